@@ -1,20 +1,102 @@
 # -*- coding: utf-8 -*-
 import logging
-import importlib.util
-import platform
+import importlib
+import functools
 
 from labquest import config
-from labquest import labquest_init_functions as init
-from labquest import labquest_open_functions as open
-from labquest import labquest_read_functions as read
-from labquest import labquest_select_sensors_functions as sensor
-from labquest import labquest_sensor_info_functions as info
-from labquest import labquest_start_functions as start
-from labquest import labquest_stop_close_functions as stop
-from labquest import labquest_dcu_functions as dcu
-from labquest import labquest_photogate_timing_functions as photo
-from labquest import labquest_buffer_functions as buffer
-buf = buffer.lq_buffer()
+
+
+class _LazyModule:
+	""" Stand-in for a labquest submodule that is imported the first time one of its 
+	attributes is used. This keeps 'import labquest' fast, and lets tools that only need 
+	sensor metadata or offline calibration avoid importing the device modules.
+	"""
+
+	def __init__(self, name):
+		self._name = name
+		self._module = None
+
+	def __getattr__(self, attribute):
+		if self._module is None:
+			self._module = importlib.import_module(self._name)
+		return getattr(self._module, attribute)
+
+	def __repr__(self):
+		return "<lazy module '" + self._name + "'>"
+
+
+init = _LazyModule('labquest.labquest_init_functions')
+open = _LazyModule('labquest.labquest_open_functions')
+read = _LazyModule('labquest.labquest_read_functions')
+sensor = _LazyModule('labquest.labquest_select_sensors_functions')
+info = _LazyModule('labquest.labquest_sensor_info_functions')
+start = _LazyModule('labquest.labquest_start_functions')
+stop = _LazyModule('labquest.labquest_stop_close_functions')
+dcu = _LazyModule('labquest.labquest_dcu_functions')
+photo = _LazyModule('labquest.labquest_photogate_timing_functions')
+photo_analysis = _LazyModule('labquest.labquest_photogate_analysis_functions')
+buffer = _LazyModule('labquest.labquest_buffer_functions')
+instrumentation = _LazyModule('labquest.labquest_instrumentation_functions')
+recorder_functions = _LazyModule('labquest.labquest_recorder_functions')
+capture = _LazyModule('labquest.labquest_raw_capture_functions')
+calibration_functions = _LazyModule('labquest.labquest_calibration_functions')
+decimation = _LazyModule('labquest.labquest_decimation_functions')
+statistics = _LazyModule('labquest.labquest_statistics_functions')
+trigger = _LazyModule('labquest.labquest_trigger_functions')
+subscriber = _LazyModule('labquest.labquest_subscriber_functions')
+shared = _LazyModule('labquest.labquest_shared_memory_functions')
+overrun = _LazyModule('labquest.labquest_overrun_functions')
+period_planner = _LazyModule('labquest.labquest_period_functions')
+device_io = _LazyModule('labquest.labquest_device_io_functions')
+control = _LazyModule('labquest.labquest_control_functions')
+sequence = _LazyModule('labquest.labquest_sequence_functions')
+shard = _LazyModule('labquest.labquest_shard_functions')
+
+def __getattr__(name):
+	# 'buf' used to be created when the package was imported. It is now the current session's buffer.
+	if name == 'buf':
+		return buffer.session_buffer()
+	raise AttributeError("module 'labquest' has no attribute '" + name + "'")
+
+def open_recording(directory):
+	""" Open a recording made with LabQuest.start(recorder=directory). Returns 
+	{"dev0_ch1":{"time":memmap, "value":memmap, "metadata":dict}, ...}
+	"""
+
+	return recorder_functions.open_recording(directory)
+
+def attach_shared_ring(name, from_start=False, track=False):
+	""" Attach to a channel's shared memory ring (see LabQuest.share()) from any process. 
+	Returns a RingReader; reader.read() returns the new time stamps and values.
+
+	Set track=True when the reader is in the process that called share(), or in a process it 
+	started with multiprocessing: they share its resource tracker, and the default (False) 
+	would remove the writer's registration of the ring.
+	"""
+
+	return shared.RingReader(name, from_start, track)
+
+def calibrate(raw, equation, k0, k1, k2, calpage=0, probe_type=2, volts_per_count=None, voltage_offset=None):
+	""" Convert raw counts to sensor units, without a device. See 
+	labquest_calibration_functions.calibrate()
+	"""
+
+	return calibration_functions.calibrate(raw, equation, k0, k1, k2, calpage, probe_type, volts_per_count, voltage_offset)
+
+def calibrate_files(paths, output_directory=None, calibration=None, max_workers=None, chunksize=None):
+	""" Calibrate many raw capture files (from RawCapture.save()) in parallel processes. See 
+	labquest_calibration_functions.calibrate_files()
+	"""
+
+	return calibration_functions.calibrate_files(paths, output_directory, calibration, max_workers, chunksize)
+
+def _in_session(method):
+	# run a LabQuest method with the object's session bound, so the functions it calls use its state
+	@functools.wraps(method)
+	def method_in_session(self, *args, **kwargs):
+		with config.use_session(self.session):
+			return method(self, *args, **kwargs)
+	return method_in_session
 
 class LabQuest:
 	""" The labquest module creates an easy way to interact with Vernier LabQuest devices.
@@ -24,20 +106,65 @@ class LabQuest:
 
 	""" A class used for labquest communication."""
 	
-	# Variables passed between the functions are stored in the config.py file
+	# Variables passed between the functions are stored in the session of each LabQuest (config.Session)
 	 
 
-	def __init__(self):
-		""" Load the NGIO shared library (dll or framework), retrieve the library handle (hLib), and get 
-		the NGIO library version number.
+	def __init__(self, instrument=False, backend=None, session=None, sharded=False):
+		""" Prepare to load the NGIO shared library (dll or framework). The library is loaded, the 
+		library handle (hLib) retrieved, and the NGIO library version number logged the first time a 
+		device is used (in open()), so creating a LabQuest object is cheap.
+
+		Args:
+			instrument (bool): if True, count the NGIO calls, their latency, and the polling 
+			for data. See get_stats().
+
+			backend: None to use the NGIO shared library (or the backend named in the 
+			LABQUEST_BACKEND environment variable), 'simulated' to use simulated LabQuest 
+			hardware, or a library object such as labquest.ngio_simulated_library.SimulatedNGIO(...)
+
+			session (config.Session): the state (library handle, devices, channels, buffers) 
+			of this LabQuest. By default each LabQuest has its own, so LabQuest objects used 
+			from separate threads do not share anything. Code that uses labquest.config outside 
+			a LabQuest method sees the session of the most recently created LabQuest.
+
+			sharded (bool): if True, open() starts a worker process for each device, which 
+			runs that device's acquisition and calibration and passes the data back through 
+			shared memory. The devices then use separate cores, and if a worker crashes only 
+			its device is lost. select_sensors(), sensor_info(), enabled_sensor_info(), start(), 
+			restart(), stop(), read(), read_multi_pt(), read_all(), stream(), dcu(), 
+			dcu_pwm_dig1() and close() work as usual; the backend must be picklable (None, 
+			'simulated', or a function that returns the library object).
 		"""
 
+		self.session = session if session is not None else config.Session()
+		config.default_session = self.session
 		config.logger = logging.getLogger(__name__)
-
-		dll_version = init.load_ngio_library_get_version()
 		config.logger.info("Version " + self.VERSION)
+
+		self.backend = backend
+		self.sharded = sharded
+		self.shards = None    # shard.ShardedDevices, when open() started the worker processes
+
+		if instrument:
+			instrumentation.enable_instrumentation()
+
+	@_in_session
+	def load_library(self):
+		""" Load the NGIO library and call NGIO_Init, if that has not been done yet. This happens 
+		automatically the first time a device is used.
+		"""
+
+		if config.dll is not None:
+			return
+
+		dll_version = init.load_ngio_library_get_version(self.backend)
 		config.logger.info("NGIO library: Version " + dll_version)
 
+		# instrumentation enabled before the library was loaded wraps it now
+		if config.stats is not None:
+			instrumentation.enable_instrumentation()
+
+	@_in_session
 	def get_version(self):
 		""" Get the library version
 
@@ -46,6 +173,145 @@ class LabQuest:
 		"""
 		return self.VERSION
 
+	@_in_session
+	def enable_stats(self, enabled=True):
+		""" Turn the NGIO call and polling instrumentation on or off. When off, the NGIO 
+		calls are not wrapped for timing and nothing is counted.
+
+		Args:
+			enabled (bool): True to start counting, False to stop
+		"""
+
+		if enabled:
+			instrumentation.enable_instrumentation()
+		else:
+			instrumentation.disable_instrumentation()
+
+	@_in_session
+	def get_stats(self, reset=False):
+		""" Get the instrumentation counters
+
+		Args:
+			reset (bool): if True, zero the counters after reading them
+
+		Returns:
+			stats (dict): {"ngio_calls":{function name:{"calls", "total_time", "mean_time", 
+			"min_time", "max_time", "histogram_us"}}, "polling":{"dev0_ch1":{"polls", "iterations", 
+			"max_iterations", "timeouts", "last_depth", "max_depth"}}, "device_io":{"dev0":{"calls", 
+			"waits"}}}. Times are in seconds, and the latency histogram is keyed by the bucket's 
+			upper bound in microseconds. "waits" counts the NGIO calls that waited for another 
+			thread's call to the same device. None if instrumentation is not enabled.
+		"""
+
+		stats = instrumentation.get_instrumentation()
+		if stats is not None:
+			stats["device_io"] = device_io.get_device_io()
+		if reset:
+			instrumentation.reset_instrumentation()
+			device_io.reset_device_io()
+		return stats
+
+	@_in_session
+	def enable_overrun_detection(self, enabled=True, warn=False):
+		""" Check the hardware time stamps of every packet read against the sample period, to 
+		find samples lost when the NGIO measurement buffer overflowed because the channel was 
+		not read often enough. See get_overruns().
+
+		Args:
+			enabled (bool): True to start checking, False to stop
+
+			warn (bool): if True, log a warning for every packet with missing or repeated samples
+		"""
+
+		if enabled:
+			overrun.enable_overrun_detection(warn)
+		else:
+			overrun.disable_overrun_detection()
+
+	@_in_session
+	def get_overruns(self, ch=None, device=None, reset=False):
+		""" Get the time stamp checks since start() (or the last reset).
+
+		Args:
+			ch (str): 'ch1', 'ch2', 'ch3', 'dig1' or 'dig2'. If None, every channel read.
+
+			device (int): only this device. If None (and no ch), every device.
+
+			reset (bool): if True, zero the counts after reading them
+
+		Returns:
+			overruns (dict): {"packets", "samples", "dropped" (samples missing from the time 
+			stamps), "gaps" (places where samples were missing), "duplicates" (repeated time 
+			stamps), "last_backlog", "max_backlog" (samples waiting when the channel was read), 
+			"max_backlog_time", "latency", "max_latency", "mean_latency"}, in seconds. Without 
+			ch, {"dev0_ch1":{...}, ...}. None if overrun detection is not enabled.
+		"""
+
+		overruns = overrun.get_overruns(device, ch)
+		if reset:
+			overrun.reset_overruns()
+		return overruns
+
+	@_in_session
+	def get_latest_reads(self, ch=None, device=None, reset=False):
+		""" Get the sample age and the discards of the read(mode='latest') calls since start() 
+		(or the last reset), to check the latency of a control loop.
+
+		Args:
+			ch (str): 'ch1', 'ch2', 'ch3', 'dig1' or 'dig2'. If None, every channel read that way.
+
+			device (int): only this device. If None (and no ch), every device.
+
+			reset (bool): if True, zero the counts after reading them
+
+		Returns:
+			latest_reads (dict): {"reads", "discarded" (older measurements skipped), 
+			"last_discarded", "time_stamp" (of the last sample returned), "age" (seconds from 
+			the sample time to when it was returned), "max_age", "mean_age"}. Without ch, 
+			{"dev0_ch1":{...}, ...}. None if ch is not a channel name.
+		"""
+
+		latest_reads = read.get_latest_reads(device, ch)
+		if reset:
+			config.latest_reads = {}
+		return latest_reads
+
+	@_in_session
+	def plan_period(self, period=None, oversample=1):
+		""" Check a sample period against what the devices can sustain with the enabled channels 
+		(call after select_sensors()). Only measure_throughput() sets a real limit for the devices 
+		in use. Before it has run, the limit is an upper bound of 100000 measurements/s shared by 
+		the channels (two measurements for each motion detector sample), so the plan is optimistic.
+
+		Args: 
+			period (int): milliseconds between samples, as in start(). If None, only the limits 
+			are returned.
+
+			oversample (int): as in start()
+
+		Returns:
+			plan (dict): {"period", "min_period" (fastest sustainable), "typical_period" (the 
+			shortest typical period of the sensors), "suggested_period" (used by start(period='auto')), 
+			"feasible", "devices":[{"device", "measurements_per_period", "min_period"}]}, in ms
+		"""
+
+		return period_planner.plan_period(period, oversample)
+
+	@_in_session
+	def measure_throughput(self, duration=1.0):
+		""" Measure the fastest period that is sustained (no lost samples) with the enabled 
+		channels on this computer, by collecting for duration seconds at faster periods first. This 
+		starts and stops the measurements several times. The rate found is used by plan_period() 
+		and start(period='auto') until close().
+
+		Returns:
+			throughput (dict): {"period" (ms), "rates" ({device:measurements/s}), "steps":[...]}, 
+			or None if no period was sustained
+		"""
+
+		return period_planner.measure_throughput(self, duration)
+
+	@_in_session
 	def open(self):
 		"""Open and get a device handle (hDevice) for each LabQuest device.
 		
@@ -56,7 +322,13 @@ class LabQuest:
 			0 if successful, else -1!
 		"""
 
-		device_type_name = open.open_labquest_devices()
+		if self.sharded:
+			self.shards = shard.open_shards(self.backend)
+			device_type_name = "no_device" if self.shards is None else "sharded"
+		else:
+			self.load_library()
+			device_type_name = open.open_labquest_devices()
+
 		if device_type_name == "no_device":
 			str1 = "No LabQuest device found \n\n"
 			str2 = "Troubleshooting tips... \n"
@@ -75,6 +347,7 @@ class LabQuest:
 		
 		return return_value
 
+	@_in_session
 	def select_sensors(self, ch1='no_sensor', ch2='no_sensor', ch3='no_sensor', dig1='no_sensor', dig2='no_sensor', device=0):
 		""" Configure ch1, ch2, ch3, dig1, and dig2 with sensors. If connecting a LabQuest analog 
 		sensor to ch1, ch2 or ch3, set the value to 'lq_sensor'. See Args below for other options.
@@ -100,18 +373,24 @@ class LabQuest:
 				select_sensors(ch1='lq_sensor_cal1', dig1='motion')
 		"""
 
+		if self.shards is not None:
+			return self.shards.call(device, 'select_sensors', ch1, ch2, ch3, dig1, dig2)
+
 		# if no devices or no device handles were found then exit this function
 		if not config.device_type or not config.hDevice:
 			config.logger.info("setup_channels() not executed due to no device or device handle")
 			return	   
 
 		active_sensor_channels = sensor.configure_channels(device, ch1, ch2, ch3, dig1, dig2)
+		# the next start() sends the new channel configuration
+		config.configured = False
 		if not any(active_sensor_channels):
 			config.logger.info("No sensors configured or detected")
 		else:
 			config.logger.info("Channels configured: " + str(active_sensor_channels))
 			pass
 
+	@_in_session
 	def sensor_info(self, ch, device=0):
 		""" Returns analog sensor information, such as the calibration equations that are stored
 		on the sensor. This only applies to analog sensors connected to ch1, ch2, or ch3.
@@ -123,6 +402,9 @@ class LabQuest:
 			If you need to configure a second LabQuest device, then device=1
 		"""			 
 		
+		if self.shards is not None:
+			return self.shards.call(device, 'sensor_info', ch)
+
 		# if no devices, no device handle, or no sensors then exit this function
 		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
 			config.logger.info("sensor_info() not executed due to no device, device handle, or sensors")
@@ -133,6 +415,7 @@ class LabQuest:
 		
 		return sensor_info
 
+	@_in_session
 	def enabled_sensor_info(self, ch, device=0):
 		""" Returns sensors' name and units (good for column headers).
 
@@ -146,6 +429,9 @@ class LabQuest:
 			sensor_info (str): Sensor's long name with units, e.g. 'Force (N)' 
 		"""
 
+		if self.shards is not None:
+			return self.shards.call(device, 'enabled_sensor_info', ch)
+
 		# if no devices, no device handle, or no sensors then exit this function
 		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
 			config.logger.info("enabled_sensor_info() not executed due to no device, device handle, or sensors")
@@ -156,17 +442,51 @@ class LabQuest:
 		return enabled_sensor_info
 
 	   
-	def start(self, period=None, reset_dig_counter=True):
+	@_in_session
+	def start(self, period=None, reset_dig_counter=True, recorder=None, raw_capture=False, oversample=1, stats=False):
 		""" Start collecting data from the sensors that were selected in the select_sensors() function. 
 		
 		Args: 
 			period (int): Milliseconds between samples. If period is left blank, a prompt in the 
-			terminal allows the user to enter the period . 
+			terminal allows the user to enter the period . If period='auto', the shortest typical 
+			period of the sensors is used, unless that is faster than the devices can sustain with 
+			the enabled channels (see plan_period()). A period that is too fast is logged as a warning.
+			A dictionary gives each channel its own period, {'ch1':1, 'ch2':1000} (for every device) 
+			or {(1, 'ch1'):10} (for one device); the other channels use the shortest of the periods. 
+			If the device can not sample each channel at its own period, every channel is sampled 
+			at the shortest period and a slower channel keeps one value (the mean for analog 
+			channels) for each of its periods, so the periods should be multiples of the shortest.
 
 			reset_dig_counter(boolean): If reset_dig_counter =True, the digital counter for rotary 
 			motion and photogate counting will be reset to zero.
+
+			recorder (str or ColumnRecorder): If a folder name is given, the calibrated values 
+			and time stamps of every read are also written to memory-mapped column files in 
+			that folder, until stop(). Open the recording with labquest.open_recording(folder).
+
+			raw_capture (bool): If True, the analog channels keep the raw counts and time stamps 
+			of every read, with a snapshot of each sensor's calibration. The calibrated values 
+			are calculated when they are first used. read_multi_pt() returns a RawCapture 
+			(which can be used like a list) and read_raw_capture() returns the whole run.
+
+			oversample (int): Sample oversample times faster than the period, and average each 
+			group of raw counts before calibration, for lower noise at the same output rate. 
+			Rotary motion and photogate counts keep the last count of each group. Not available 
+			with the motion detector.
+
+			stats (bool): If True, keep the statistics of every channel from the first value 
+			read, so that stats() covers the whole run. Otherwise they start with the first 
+			stats() call. They stay on for the later runs (and restart()).
 		"""   
 
+		if self.shards is not None:
+			# the workers can not prompt for the period
+			if period == None:
+				print("select period (ms):", end=' ')
+				period = int(input())
+			return self.shards.start(period=period, reset_dig_counter=reset_dig_counter, recorder=recorder, 
+									 raw_capture=raw_capture, oversample=oversample)
+
 		# if no devices, no device handle, or no sensors then exit this function
 		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
 			config.logger.info("start() not executed due to no device, device handle, or sensors")
@@ -184,21 +504,109 @@ class LabQuest:
 				print("select period (ms):", end=' ')
 				period = int(input())
 		
-		# Set the measurement period. Needs to be in seconds. So convert from milliseconds to seconds
-		sample_period = period/1000
+		if oversample > 1 and config.motion:
+			config.logger.info("start() - oversample is not available with the motion detector")
+			oversample = 1
+
+		# a period for each channel: the device is set up with the shortest
+		channel_periods = {}
+		if isinstance(period, dict):
+			channel_periods = start.hardware_periods(period, oversample)
+			period = min(period.values())
+
+		if period == 'auto':
+			period = period_planner.auto_period(oversample)
+
+		# Set the measurement period. Needs to be in seconds. So convert from milliseconds to seconds.
+		# When oversampling, the hardware samples oversample times faster.
+		sample_period = period/1000/oversample
 
 		# Set the analog input value, the mask value, and sampling mode
-		start.configure_channels_to_start(sample_period, reset_dig_counter)
+		start.configure_channels_to_start(sample_period, reset_dig_counter, channel_periods)
+		config.configured = True
+
+		# calibration snapshots are read again from the sensors
+		config.calibration_snapshots = {}
+		decimation.start_oversampling(oversample)
+		period_planner.check_period()
+		if oversample > 1:
+			config.logger.info("Oversample: " + str(oversample) + " samples averaged, effective period " + 
+							   str(period/1000) + " seconds/sample")
+
+		config.raw_capture = raw_capture
+		if stats:
+			statistics.enable_statistics()
+		self._start_run(recorder)
+
+	@_in_session
+	def restart(self, reset_dig_counter=False, recorder=None):
+		""" Start collecting data again after stop(), with the period, oversampling and channel 
+		configuration of the last start(). Nothing is sent to the devices except the Start 
+		Measurements command (and the digital counter reset, if asked for), so this is much 
+		quicker than start(). Use start() after select_sensors().
+
+		Args: 
+			reset_dig_counter(boolean): If True, the digital counter for rotary motion and 
+			photogate counting will be reset to zero. Otherwise the counts carry on.
+
+			recorder (str or ColumnRecorder): as in start()
+		"""
+
+		if self.shards is not None:
+			return self.shards.start('restart', reset_dig_counter=reset_dig_counter, recorder=recorder)
+
+		# if no devices, no device handle, or no sensors then exit this function
+		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
+			config.logger.info("restart() not executed due to no device, device handle, or sensors")
+			return 
+		if not config.configured:
+			config.logger.info("restart() not executed, start() has not configured the channels")
+			return
+		if config.acquiring:
+			config.logger.info("restart() not executed, the measurements have not been stopped")
+			return
+
+		if reset_dig_counter and any(config.enabled_dig_channels):
+			start.reset_digital_counter()
+		self._start_run(recorder)
+
+	@_in_session
+	def _start_run(self, recorder=None):
+		""" Reset the per-run state and send the Start Measurements command. Used by start() and 
+		restart(), once the channels are configured.
+		"""
 
 		# create a buffer for each active channel. For fast sampling there may be more than one value 
 		# returned in a read(). One value is returned and the rest are stored in this buffer.
-		buf.buffer_init()
+		buffer.session_buffer().buffer_init()
+
+		# decimation and oversampling start with a new block
+		decimation.reset_decimation()
+		# the channel statistics start again with each run
+		if config.statistics is not None:
+			config.statistics.reset()
+		trigger.reset_triggers()
+		overrun.reset_overruns()
+		config.latest_reads = {}
+		config.latest_samples = {}
+
+		if config.raw_capture:
+			capture.start_raw_capture()
+
+		if recorder is not None:
+			recorder_functions.attach_recorder(recorder)
 
 		# start data collection
 		start.start_measurements()						  
+		config.acquiring = True
+
+		# the subscribers are fed by a thread that drains their channels
+		if config.subscriptions:
+			subscriber.start_acquisition_loop()
 
 		
-	def read(self, ch, device=0):
+	@_in_session
+	def read(self, ch, device=0, mode='oldest'):
 		""" Take single point readings from the desired channel.
 
 		Args: 
@@ -206,19 +614,36 @@ class LabQuest:
 
 			device (int): If you have a single LabQuest connected, then device=0. 
 			If you need to configure a second LabQuest device, then device=1
+
+			mode (str): 'oldest' returns the values in order: the oldest value not read yet, 
+			keeping the others for the next reads. 'latest' returns the newest sample and its 
+			time stamp, and discards the older ones without calibrating them, for control loops 
+			that run slower than the sample rate. See get_latest_reads() for the sample age.
 		
 		Returns:
-			measurement: A single data point for the selected channel. 
+			measurement: A single data point for the selected channel. With mode='latest', 
+			(time_stamp, value): the sample time in microseconds from the start, and the value.
 		"""	  
 		
+		if mode not in ('oldest', 'latest'):
+			config.logger.info("read() - mode must be 'oldest' or 'latest'")
+			return
+		if self.shards is not None:
+			if mode == 'latest':
+				return self.shards.read_latest(ch, device)
+			return self.shards.read(ch, device)
+
 		# if no devices, no device handle, or no sensors then exit this function
 		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
 			config.logger.info("read() not executed due to no device, device handle, or sensors")
 			return		 
 		
+		if mode == 'latest':
+			return read.get_latest_measurement(device, ch)
 		measurement = read.get_measurement(device, ch)
 		return measurement
 
+	@_in_session
 	def read_multi_pt(self, ch, num_measurements_to_read, device=0):
 		""" Take a specified number of multi-point readings from the selected channel. This
 		only applies to analog sensors connected to ch1, ch2, or ch3.
@@ -237,6 +662,9 @@ class LabQuest:
 			asked for in the argument. 
 		"""	  
 		
+		if self.shards is not None:
+			return self.shards.read(ch, device, num_measurements_to_read)
+
 		# if no devices, no device handle, or no sensors then exit this function
 		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
 			config.logger.info("read_multi_pt() not executed due to no device, device handle, or sensors")
@@ -247,6 +675,271 @@ class LabQuest:
 		return measurements
 
 	
+	@_in_session
+	def read_all(self, device=0):
+		""" Read everything collected so far on every enabled channel (not photogate timing or 
+		dcu) in one call. Each channel has the values of its own period (see start()). Values that 
+		read() has kept in its buffer are not included, so use either read() or read_all().
+
+		Args: 
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns:
+			packets (dict): {'ch1':(time_stamps, values), ...}, numpy arrays of the time stamps 
+			(microseconds) and calibrated values of each channel, which may be empty
+		"""
+
+		if self.shards is not None:
+			return self.shards.read_all(device)
+
+		# if no devices, no device handle, or no sensors then exit this function
+		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
+			config.logger.info("read_all() not executed due to no device, device handle, or sensors")
+			return
+
+		return read.read_all(device)
+
+	def stream(self, ch, count=None, device=0):
+		""" Generator of single point readings from the desired channel, as returned by read(). 
+		The generator stops after count readings, or when a reading times out (stop() was called).
+
+		Args: 
+			ch (str): Options include 'ch1', 'ch2', 'ch3', 'dig1', 'dig2'.  
+
+			count (int): number of readings. If None, keep reading until the data stops.
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+		"""
+
+		num_read = 0
+		while count is None or num_read < count:
+			measurement = self.read(ch, device)
+			if measurement is None:
+				return
+			yield measurement
+			num_read += 1
+
+	@_in_session
+	def stats(self, ch, window=None, device=0):
+		""" Statistics of the data read from a channel. They are updated as each packet is read, 
+		so this does not re-read or store the data. Use start(stats=True) to keep them from the 
+		start of the run. Otherwise the first call starts the statistics for all channels, and 
+		only the values read after it are counted.
+
+		Args: 
+			ch (str): Options include 'ch1', 'ch2', 'ch3', 'dig1', 'dig2'.  
+
+			window (int): number of most recent values to use. If None, every value since start() 
+			(or since the first stats() call).
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns:
+			statistics (dict): "count", "mean", "std", "min", "max", "rate" (change per second), 
+			"last" (the last value) and "time" (of the last value, in seconds). None if ch is 
+			not a channel name.
+		"""
+
+		return statistics.get_statistics(device, ch, window)
+
+	@_in_session
+	def subscribe(self, ch, callback=None, queue=None, batch_size=1, max_latency=0.1, max_pending=100, device=0):
+		""" Share a channel's data with several consumers. While there are subscribers, a thread 
+		drains each subscribed channel once and hands each packet to all of its subscribers (and 
+		to any recorder, statistics or trigger), so the subscribers do not call read(). The 
+		channels without subscribers are left for read().
+
+		Args: 
+			ch (str): Options include 'ch1', 'ch2', 'ch3', 'dig1', 'dig2'.  
+
+			callback: function called as callback(time_stamps, values) with read-only numpy 
+			arrays (time stamps in microseconds). It runs on its own thread.
+
+			queue (queue.Queue): if there is no callback, (time_stamps, values) batches are put 
+			on this queue. If neither is given, a new queue is used (subscription.queue).
+
+			batch_size (int): number of values in each batch
+
+			max_latency (float): seconds before a batch that is not full is delivered anyway
+
+			max_pending (int): number of batches that can wait for a callback (or in the new 
+			queue) before new batches are dropped. subscription.dropped counts them.
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns:
+			subscription (Subscription)
+		"""
+
+		return subscriber.subscribe(device, ch, callback, queue, batch_size, max_latency, max_pending)
+
+	@_in_session
+	def control_loop(self, control_function, ch, period, output='dcu', output_ch='dig1', duration=None, device=0):
+		""" Run a control function at a fixed period on its own thread, from the newest sample 
+		of a channel to the DCU lines or the PWM output. Each iteration skips the backlog (as 
+		read(mode='latest') does), and only output changes are sent, without waiting for the 
+		device's response. Start the measurements first; stop() stops the loops.
+
+		Args: 
+			control_function: called as control_function(time_stamp, value) with the newest 
+			sample (time stamp in microseconds). It returns the output: a DCU value (0-15) for 
+			output='dcu', (frequency_Hz, duty_cycle) for output='pwm', or None for no change.
+
+			ch (str): the input, 'ch1', 'ch2', 'ch3', 'dig1' or 'dig2'
+
+			period (float): milliseconds between iterations, no shorter than the channel's period
+
+			output (str): 'dcu', 'pwm' (select_sensors(dig1='dcu_pwm')), or None
+
+			output_ch (str): the channel of the DCU, 'dig1' or 'dig2'
+
+			duration (float): seconds to run. None runs until stop() (or loop.stop()).
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns:
+			loop (ControlLoop): loop.stop(), loop.wait(), and loop.as_dict() for the iterations, 
+			the skipped deadlines, the commands sent, and the histograms of the jitter (wake-up 
+			time minus deadline), the latency (wake-up to output queued) and the command time, 
+			in seconds (the histograms in microseconds). None if the loop could not start.
+		"""
+
+		if self.shards is not None:
+			config.logger.info("control_loop() is not available with sharded devices")
+			return
+		# if no devices, no device handle, or no sensors then exit this function
+		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
+			config.logger.info("control_loop() not executed due to no device, device handle, or sensors")
+			return
+		if not config.acquiring:
+			config.logger.info("control_loop() not executed, start() the measurements first")
+			return
+
+		return control.start_control_loop(control_function, device, ch, period/1000, output, output_ch, duration)
+
+	@_in_session
+	def unsubscribe(self, subscription):
+		""" Remove a subscription made with subscribe()
+		"""
+
+		subscriber.unsubscribe(subscription)
+
+	@_in_session
+	def share(self, prefix='labquest', capacity=1048576):
+		""" Publish the time stamps and calibrated values of every enabled channel to a shared 
+		memory ring, so that other processes can read them with labquest.attach_shared_ring(name). 
+		Call this after select_sensors(). The data are the packets read by this process (with 
+		read(), read_multi_pt(), stream() or the subscribers' acquisition loop).
+
+		Args: 
+			prefix (str): start of the ring names, which are prefix_dev0_ch1, prefix_dev0_dig1, etc.. 
+			If a ring with the same name already exists (shared by another process, or not closed), 
+			FileExistsError is raised and nothing is shared.
+
+			capacity (int): number of samples in each ring. A reader that falls further behind 
+			than this loses samples (and counts them).
+
+		Returns:
+			names (dict): {(device, 'ch1'):ring name, ...}
+		"""
+
+		return shared.share_channels(prefix, capacity)
+
+	@_in_session
+	def unshare(self):
+		""" Remove the shared memory rings made by share()
+		"""
+
+		shared.unshare_channels()
+
+	@_in_session
+	def set_trigger(self, ch, condition='rising', level=0.0, hysteresis=0.0, low=None, high=None, 
+					pre=100, post=100, count=1, device=0):
+		""" Capture only the data around events on a channel. The most recent pre values are kept 
+		in a ring, and when the condition fires, those values, the value that fired, and the next 
+		post values become a capture (see get_captures()). The condition is checked on all of the 
+		data read from the channel (with read(), read_multi_pt() or stream()).
+
+		Args: 
+			ch (str): Options include 'ch1', 'ch2', 'ch3', 'dig1', 'dig2'.  
+
+			condition (str): 'level' (at or above level), 'rising' (rises through level), 'falling' 
+			(falls through level), 'window' (goes outside low to high), 'change' (the value changes, 
+			such as a digital state). None removes the trigger.
+
+			hysteresis (float): how far the value must come back past level (or inside the window) 
+			before the trigger re-arms
+
+			pre (int), post (int): number of values kept before and after the trigger
+
+			count (int): number of captures (the trigger re-arms after each). None for no limit.
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+		"""
+
+		trigger.set_trigger(device, ch, condition, level, hysteresis, low, high, pre, post, count)
+
+	@_in_session
+	def get_captures(self, ch, device=0, clear=True):
+		""" Return the completed captures of a channel's trigger, oldest first. Each capture is a 
+		dictionary of "time_stamps" (microseconds) and "values" arrays, the "trigger_index" of the 
+		value that fired in those arrays, and its "trigger_time" (microseconds). 
+
+		Args: 
+			clear (bool): if True, the captures that are returned are removed
+		"""
+
+		return trigger.get_captures(device, ch, clear)
+
+	@_in_session
+	def set_decimation(self, ch, factor, mode='mean', device=0):
+		""" Reduce a fast sampled channel by a factor before it reaches read(), read_multi_pt(), 
+		stream() and the recorder. Each block of factor samples becomes one value. 
+
+		Args: 
+			ch (str): Options include 'ch1', 'ch2', 'ch3', 'dig1', 'dig2' (not the motion detector).
+
+			factor (int): number of samples in each block. A factor of 1 turns decimation off.
+
+			mode (str): 'mean', 'min', 'max', 'last', or 'minmax' (two values per block, the 
+			minimum and the maximum, in the order they happened)
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+		"""
+
+		decimation.set_decimation(device, ch, factor, mode)
+
+	@_in_session
+	def read_raw_capture(self, ch, device=0):
+		""" Return the raw counts, time stamps and calibration of everything read from an analog 
+		channel since start(raw_capture=True).
+
+		Args: 
+			ch (str): Options include 'ch1', 'ch2', 'ch3'
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns:
+			capture (RawCapture): .raw, .time_stamps and .values (calibrated on first use) arrays. 
+			Use capture.recalibrate(...) to apply a new calibration, and capture.save(path) to save it.
+		"""
+
+		channel = config.CHANNEL_NUMBERS.get(ch)
+		raw_capture = config.raw_captures.get((device, channel))
+		if raw_capture is None:
+			config.logger.info("read_raw_capture() - no raw capture for " + str(ch) + 
+							   " (use start(raw_capture=True))")
+		return raw_capture
+
+	@_in_session
 	def stop(self, stop_measurements=True, stop_dcu=True, stop_pwm=True):
 		""" Stop data collection, turn off dcu lines, stop pwm output
 
@@ -260,6 +953,9 @@ class LabQuest:
 			output will be stopped.
 		"""
 
+		if self.shards is not None:
+			return self.shards.stop(stop_measurements=stop_measurements, stop_dcu=stop_dcu, stop_pwm=stop_pwm)
+
 		# if no devices, no device handle, or no sensors then exit this function
 		if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
 			config.logger.info("stop() not executed due to no device, device handle, or sensors")
@@ -267,7 +963,19 @@ class LabQuest:
 
 		# Stop the measurements and clear the ngio measurement buffer and the data buffer()
 		if stop_measurements:
+			# the control loops read the measurements and drive the outputs, so they stop first
+			if config.control_loops:
+				control.stop_control_loops()
+			if config.acquisition_loop is not None:
+				subscriber.stop_acquisition_loop()
+			config.acquiring = False
 			stop.stop_measurements_clear_buffer()
+			if config.recorder is not None:
+				recorder_functions.detach_recorder()
+
+		# a sequence would carry on changing the outputs after they are turned off
+		if config.sequence_players and (stop_dcu or stop_pwm):
+			sequence.stop_sequence_players()
 
 		if stop_dcu and config.dcu:
 			dcu.dcu_all_lines_off()
@@ -276,14 +984,23 @@ class LabQuest:
 			dcu.stop_pwm()
 
 
+	@_in_session
 	def close(self):
 		""" Close all devices. After this routine runs, the device handle (hDevice) is 
 		no longer valid.
 		"""
 		
+		if self.shards is not None:
+			self.shards.close()
+			self.shards = None
+		if config.control_loops:
+			control.stop_control_loops()
+		if config.sequence_players:
+			sequence.stop_sequence_players()
 		stop.close()
 
 	
+	@_in_session
 	def dcu(self, ch, value, device=0):
 		""" Control the output lines of the DCU
 
@@ -296,8 +1013,11 @@ class LabQuest:
 			If you need to configure a second LabQuest device, then device=1
 		"""
 		
+		if self.shards is not None:
+			return self.shards.call(device, 'dcu', ch, value)
 		dcu.set_io_line(ch, value, device)
 
+	@_in_session
 	def dcu_pwm_dig1(self, frequency_Hz, duty_cycle, device=0):
 		""" Control the DCU's PWM output, this occurs on the DCU's line D4. The DCU must be connected 
 		to dig1 (PWM is not available on channel dig2)
@@ -311,9 +1031,53 @@ class LabQuest:
 			If you need to configure a second LabQuest device, then device=1
 		"""
 		
+		if self.shards is not None:
+			return self.shards.call(device, 'dcu_pwm_dig1', frequency_Hz, duty_cycle)
 		dcu.set_pwm(frequency_Hz, duty_cycle, device)
 
+	@_in_session
+	def play_sequence(self, steps, output='dcu', output_ch='dig1', repeat=1, period=None, device=0):
+		""" Play a schedule of DCU line states or PWM settings on its own thread. The commands 
+		are encoded before the first step, and each step is sent at its time from the start of 
+		the schedule, so the timing does not drift from step to step. stop() stops the player.
+
+		Args: 
+			steps (list): [(time, value)] for output='dcu' (value 0-15, as in dcu()), or 
+			[(time, frequency_Hz, duty_cycle)] for output='pwm' (as in dcu_pwm_dig1()). Times 
+			are in seconds from the start, in order.
+
+			output (str): 'dcu' or 'pwm' (select_sensors(dig1='dcu_pwm'))
+
+			output_ch (str): the channel of the DCU, 'dig1' or 'dig2'
+
+			repeat (int): number of times to play the schedule
+
+			period (float): seconds from the start of one repeat to the next. If None, the time 
+			of the last step.
 
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns:
+			player (SequencePlayer): player.wait(), player.stop(), and player.log, a list of 
+			{"step", "repeat", "time", "sent", "late", "command_time", "time_stamp"} for each step 
+			sent, with the times in seconds and time_stamp the send time in microseconds from the 
+			start of the measurements (as the sensor data are time stamped), or None if they were 
+			not running. None if the schedule could not be played.
+		"""
+
+		if self.shards is not None:
+			config.logger.info("play_sequence() is not available with sharded devices")
+			return
+		# if no devices or no device handles were found then exit this function
+		if not config.device_type or not config.hDevice:
+			config.logger.info("play_sequence() not executed due to no device or device handle")
+			return
+
+		return sequence.play_sequence(steps, device, output, output_ch, repeat, period)
+
+
+	@_in_session
 	def photogate_timing(self, ch, samples, timeout, device=0):
 		"""Perform photogate timing
 
@@ -337,3 +1101,50 @@ class LabQuest:
 		timing_values = photo.get_photogate_timing(ch, samples, timeout, device)
 
 		return timing_values
+
+	@_in_session
+	def photogate_analysis(self, ch, samples, timeout, mode='gate', flag_width=None, bin_width=1.0, device=0):
+		"""Perform photogate timing and analyze the raw edge time stamps in bulk
+
+		Args: 
+			ch (str): Options include 'dig1' or 'dig2'
+			
+			samples(int): number of timing samples to record
+
+			timeout: (seconds) Maximum time to wait for all samples to be collected.
+
+			mode (str): 'gate', 'pulse', 'pendulum' or 'count_rate'
+
+			flag_width (float): width of the flag (m) for 'gate' mode, or the distance between 
+			blocks for 'pulse' mode. Used to calculate speed.
+
+			bin_width (float): counting interval (seconds) for 'count_rate' mode
+
+			device (int): If you have a single LabQuest connected, then device=0. 
+			If you need to configure a second LabQuest device, then device=1
+
+		Returns: 
+			results: a numpy structured array. The fields depend on the mode:
+			'gate' (time, gate_time, speed), 'pulse' (time, pulse_time, speed), 
+			'pendulum' (time, period), 'count_rate' (time, count, rate)
+		"""
+
+		# check the mode before the samples are collected
+		if mode not in ('gate', 'pulse', 'pendulum', 'count_rate'):
+			config.logger.info("photogate_analysis() mode must be 'gate', 'pulse', 'pendulum' or 'count_rate'")
+			return None
+
+		samples = samples + 2	# to get the number of samples requested, actually need 2 extra
+		timeout = timeout/3   # the read takes 3x the timeout, so need to divide by 3 here
+		time_stamps = photo.get_photogate_time_stamps(ch, samples, timeout, device)
+
+		if mode == 'gate':
+			results = photo_analysis.gate_mode(time_stamps, flag_width)
+		elif mode == 'pulse':
+			results = photo_analysis.pulse_mode(time_stamps, flag_width)
+		elif mode == 'pendulum':
+			results = photo_analysis.pendulum_mode(time_stamps)
+		else:
+			results = photo_analysis.count_rate(time_stamps, bin_width)
+
+		return results
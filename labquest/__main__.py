@@ -0,0 +1,27 @@
+import sys
+
+
+COMMANDS = {
+    "serve":"stream LabQuest data to TCP clients (python -m labquest serve --help)",
+    "bench":"benchmark the acquisition pipeline (python -m labquest bench --help)",
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] not in COMMANDS:
+        print("usage: python -m labquest {" + ",".join(COMMANDS) + "} ...", file=sys.stderr)
+        for command, description in COMMANDS.items():
+            print("  " + command + ": " + description, file=sys.stderr)
+        return 2
+
+    if argv[0] == "serve":
+        from labquest import server
+        return server.main(argv[1:])
+    from labquest.bench import __main__ as bench_main
+    return bench_main.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+""" Benchmarks for the labquest acquisition pipeline.
+
+The benchmarks run in-process against labquest.ngio_simulated_library.SimulatedNGIO, so they
+need no LabQuest hardware and give the same workload on every machine. Run them with
+
+    python -m labquest.bench [--quick] [--output results.json] [--compare baseline.json]
+
+Each benchmark returns a dictionary of metrics. Metrics whose names end in '_per_s' are rates
+(higher is better); all other metrics are times in seconds (lower is better).
+"""
+
+import json
+import platform
+import sys
+import time
+
+from labquest.bench import benchmarks
+
+
+def run(names=None, quick=False):
+    """ Run the benchmarks and return the results as a dictionary.
+
+    Args:
+        names (list): names of the benchmarks to run (see benchmarks.BENCHMARKS). None runs all.
+
+        quick (bool): use smaller workloads, for a fast smoke run
+    """
+
+    if names is None:
+        names = list(benchmarks.BENCHMARKS)
+
+    results = {}
+    for name in names:
+        benchmark = benchmarks.BENCHMARKS[name]
+        results[name] = benchmark(quick)
+
+    from labquest import LabQuest
+    return {"meta":{"labquest_version":LabQuest.VERSION, "python":sys.version.split()[0],
+                    "platform":platform.platform(), "quick":quick, "time":time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results":results}
+
+def compare(results, baseline, threshold=0.1):
+    """ Compare results against a baseline (both as returned by run()).
+
+    Args:
+        threshold (float): fractional change that counts as a regression (0.1 = 10%)
+
+    Returns:
+        comparison (dict): {benchmark:{metric:{"baseline", "current", "change", "regression"}}}.
+        The change is the fractional improvement (positive) or slowdown (negative).
+    """
+
+    comparison = {}
+    for name, metrics in results["results"].items():
+        baseline_metrics = baseline.get("results", {}).get(name)
+        if not baseline_metrics:
+            continue
+        for metric, current in flatten(metrics).items():
+            previous = flatten(baseline_metrics).get(metric)
+            if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+                continue
+            if metric.endswith('_per_s'):
+                change = (current - previous)/previous
+            else:
+                change = (previous - current)/previous
+            comparison.setdefault(name, {})[metric] = {"baseline":previous, "current":current,
+                                                      "change":change, "regression":change < -threshold}
+    return comparison
+
+def flatten(metrics, prefix=''):
+    """ Flatten nested metric dictionaries into {"a.b.c":value}
+    """
+
+    flat = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + str(key) + '.'))
+        else:
+            flat[prefix + str(key)] = value
+    return flat
+
+def load(path):
+    with open(path, 'r') as file:
+        return json.load(file)
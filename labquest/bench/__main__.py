@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+
+from labquest import bench
+from labquest.bench import benchmarks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m labquest.bench",
+                                     description="Benchmark the labquest acquisition pipeline against simulated hardware.")
+    parser.add_argument("names", nargs="*", metavar="benchmark",
+                        help="benchmarks to run (default: all of " + ", ".join(benchmarks.BENCHMARKS) + ")")
+    parser.add_argument("--quick", action="store_true", help="use smaller workloads")
+    parser.add_argument("--output", help="write the results (JSON) to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a saved results file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fractional slowdown reported as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in benchmarks.BENCHMARKS:
+            parser.error("unknown benchmark: " + name)
+
+    results = bench.run(args.names or None, quick=args.quick)
+
+    if args.compare:
+        comparison = bench.compare(results, bench.load(args.compare), args.threshold)
+        results["comparison"] = comparison
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        regressions = [name + "." + metric for name, metrics in results["comparison"].items()
+                       for metric, change in metrics.items() if change["regression"]]
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,468 @@
+import functools
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from labquest import config
+from labquest import labquest_read_functions as read
+from labquest import ngio_sensor_functions as ngio_sensor
+from labquest import ngio_simulated_library as ngio_sim
+
+
+# Coefficients used for each calibration equation, and the voltage range they are valid for
+CALIBRATIONS = {
+    1:(0.0, 4.9, 0.0),    # linear
+    2:(-10.0, 25.0, 0.5),    # quadratic
+    3:(2.0, 1.5, 0.0),    # power
+    4:(1.5, 2.0, 0.0),    # modified power (ISE)
+    5:(1.0, 2.0, 0.0),    # logarithmic (colorimeter)
+    12:(0.00102119, 0.000222468, 1.33342e-07),    # Steinhart-Hart (temperature)
+}
+
+SEED = 1234
+
+
+def simulated_labquest(**simulator_args):
+    """ Return an opened LabQuest that uses a SimulatedNGIO backend
+    """
+
+    from labquest import LabQuest
+
+    simulator_args.setdefault('seed', SEED)
+    simulator = ngio_sim.SimulatedNGIO(**simulator_args)
+    lq = LabQuest(backend=simulator)
+    lq.open()
+    return lq, simulator
+
+def summarize(times):
+    """ mean, median, 95th percentile and max of a list of times
+    """
+
+    ordered = sorted(times)
+    return {"mean":statistics.fmean(ordered), "p50":ordered[len(ordered)//2],
+            "p95":ordered[min(int(len(ordered)*0.95), len(ordered) - 1)], "max":ordered[-1]}
+
+def bench_calibration(quick):
+    """ Samples/s and per-sample CPU time of apply_calibration() for each calibration equation
+    """
+
+    num_samples = 2000 if quick else 20000
+    lq, simulator = simulated_labquest()
+    lq.select_sensors(ch1='raw_voltage')
+    hDevice = config.hDevice[0]
+    channel = 1
+    voltages = [0.5 + 4.0*i/num_samples for i in range(num_samples)]
+    # warm up, so the first equation is not charged for the first calls into the library
+    for voltage in voltages[:1000]:
+        read.apply_calibration(voltage, hDevice, channel)
+
+    results = {}
+    for equation, (k0, k1, k2) in CALIBRATIONS.items():
+        ngio_sensor.ddsmem_set_calibration_equation(hDevice, channel, equation)
+        ngio_sensor.ddsmem_set_cal_page(hDevice, channel, 0, k0, k1, k2, "(units)")
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for voltage in voltages:
+            read.apply_calibration(voltage, hDevice, channel)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        results["equation_" + str(equation)] = {"samples_per_s":num_samples/wall, "cpu_per_sample":cpu/num_samples}
+
+    lq.close()
+    return results
+
+def bench_read_latency(quick):
+    """ Latency of single point read() calls at several sample periods
+    """
+
+    periods_ms = (1, 10, 100)
+    num_reads = 20 if quick else 100
+
+    results = {}
+    for period_ms in periods_ms:
+        lq, simulator = simulated_labquest()
+        lq.select_sensors(ch1='lq_sensor')
+        lq.start(period=period_ms)
+        latencies = []
+        total_start = time.perf_counter()
+        for i in range(num_reads):
+            read_start = time.perf_counter()
+            lq.read('ch1')
+            latencies.append(time.perf_counter() - read_start)
+        total = time.perf_counter() - total_start
+        lq.stop()
+        lq.close()
+        summary = summarize(latencies)
+        summary["reads_per_s"] = num_reads/total
+        results["period_" + str(period_ms) + "ms"] = summary
+
+    return results
+
+def bench_read_multi_pt(quick):
+    """ Throughput of read_multi_pt() for packets of 1k, 100k and 1M points
+    """
+
+    sizes = (1000, 100000) if quick else (1000, 100000, 1000000)
+
+    results = {}
+    for size in sizes:
+        # sample every microsecond so that the wait for the packet is short
+        lq, simulator = simulated_labquest(min_period=0.000001)
+        lq.select_sensors(ch1='lq_sensor')
+        lq.start(period=0.001)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        measurements = lq.read_multi_pt('ch1', size)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        lq.stop()
+        lq.close()
+        results[str(size) + "_points"] = {"time":wall, "samples_per_s":len(measurements)/wall,
+                                          "cpu_per_sample":cpu/max(len(measurements), 1)}
+
+    return results
+
+def bench_setup_and_stop(quick):
+    """ select_sensors(), start() and stop() time with 1 to 8 devices
+    """
+
+    device_counts = (1, 2) if quick else (1, 2, 4, 8)
+
+    results = {}
+    for num_devices in device_counts:
+        # use a LabQuest Stream, the LabQuest Mini pauses while it lights the LED of each device
+        lq, simulator = simulated_labquest(device_type=17, num_devices=num_devices)
+        select_start = time.perf_counter()
+        for device in range(num_devices):
+            lq.select_sensors(ch1='lq_sensor', ch2='lq_sensor', device=device)
+        select_time = time.perf_counter() - select_start
+        start_start = time.perf_counter()
+        lq.start(period=10)
+        start_time = time.perf_counter() - start_start
+        stop_start = time.perf_counter()
+        lq.stop()
+        stop_time = time.perf_counter() - stop_start
+        lq.close()
+        results[str(num_devices) + "_devices"] = {"select_sensors":select_time, "start":start_time, "stop":stop_time}
+
+    return results
+
+def bench_stop_start(quick):
+    """ stop() time, and the turnaround from stop() to collecting again with start() (which sends
+    the channel configuration again) and with restart() (which reuses it)
+    """
+
+    repeats = 5 if quick else 20
+    lq, simulator = simulated_labquest(device_type=17)
+    lq.select_sensors(ch1='lq_sensor', ch2='lq_sensor', dig1='motion')
+    lq.start(period=10)
+
+    stop_times = []
+    start_times = []
+    restart_times = []
+    for i in range(repeats):
+        stop_start = time.perf_counter()
+        lq.stop()
+        stop_times.append(time.perf_counter() - stop_start)
+        start_start = time.perf_counter()
+        lq.start(period=10)
+        start_times.append(time.perf_counter() - start_start)
+        lq.read('ch1')
+        lq.stop()
+        restart_start = time.perf_counter()
+        lq.restart()
+        restart_times.append(time.perf_counter() - restart_start)
+        lq.read('ch1')
+    lq.stop()
+    lq.close()
+
+    return {"stop":summarize(stop_times), "start":summarize(start_times), "restart":summarize(restart_times),
+            "stop_to_start":statistics.fmean(stop_times) + statistics.fmean(start_times),
+            "stop_to_restart":statistics.fmean(stop_times) + statistics.fmean(restart_times)}
+
+def bench_device_io(quick):
+    """ NGIO calls/s with 1 to 8 simulated devices (each call takes 200 us, like a USB round trip),
+    one thread per device, and with 4 threads sharing one device. Calls to separate devices run in
+    parallel, the calls to one device are serialized ("overlapping_calls" stays 0).
+
+    "1_thread_call_time" is the time of one ngio_read call (with no USB delay) from a single
+    thread, through the serializing wrapper and straight to the library. The wrapper skips the lock while
+    only one thread calls a device, but it still costs about 0.7 us per call (it was about 1.2 us
+    with the lock and the argtypes passed through on each call).
+    """
+
+    from labquest import labquest_device_io_functions as device_io
+    from labquest import ngio_read_functions as ngio_read
+    from labquest import ngio_send_cmd_get_resp as ngio_send
+
+    duration = 0.25 if quick else 1.0
+    device_counts = (1, 2, 4) if quick else (1, 2, 4, 8)
+
+    def run(threads_devices):
+        counts = [0]*len(threads_devices)
+        end_time = time.perf_counter() + duration
+
+        def worker(index, hDevice):
+            while time.perf_counter() < end_time:
+                ngio_read.get_num_measurements_available(hDevice, 1)
+                ngio_send.send_cmd_get_response(hDevice, 0x10, [0]*14, 0)    # get status
+                counts[index] += 2
+
+        threads = [threading.Thread(target=config.in_current_session(worker), args=(index, hDevice))
+                   for index, hDevice in enumerate(threads_devices)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts)/duration
+
+    results = {}
+    for num_devices in device_counts:
+        lq, simulator = simulated_labquest(device_type=17, num_devices=num_devices, latency=0.0002,
+                                                check_overlaps=True)
+        for device in range(num_devices):
+            lq.select_sensors(ch1='lq_sensor', device=device)
+        with config.use_session(lq.session):
+            calls_per_s = run(list(config.hDevice))
+        results[str(num_devices) + "_devices"] = {"calls_per_s":calls_per_s,
+                                                  "overlapping_calls":simulator.overlapping_calls}
+        lq.close()
+
+    lq, simulator = simulated_labquest(device_type=17, latency=0.0002, check_overlaps=True)
+    lq.select_sensors(ch1='lq_sensor')
+    with config.use_session(lq.session):
+        calls_per_s = run([config.hDevice[0]]*4)
+        waits = device_io.get_executor(config.hDevice[0]).waits
+    results["4_threads_1_device"] = {"calls_per_s":calls_per_s, "overlapping_calls":simulator.overlapping_calls,
+                                     "waits":waits}
+    lq.close()
+
+    lq, simulator = simulated_labquest(device_type=17)
+    lq.select_sensors(ch1='lq_sensor')
+    number = 20000 if quick else 100000
+    with config.use_session(lq.session):
+        hDevice = config.hDevice[0]
+        call_times = {}
+        serialized = config.dll
+        for name, library in (("serialized", serialized), ("direct", serialized._dll)):
+            config.dll = library
+            start_time = time.perf_counter()
+            for i in range(number):
+                ngio_read.get_num_measurements_available(hDevice, 1)
+            call_times[name] = (time.perf_counter() - start_time)/number
+        config.dll = serialized
+    results["1_thread_call_time"] = {"serialized":call_times["serialized"], "direct":call_times["direct"],
+                                     "overhead":call_times["serialized"] - call_times["direct"]}
+    lq.close()
+
+    return results
+
+def bench_sharded(quick):
+    """ Calibrated samples/s delivered by read_all() with 1 to 4 simulated devices, 3 analog
+    channels each at 0.1 ms, in one process and sharded (a worker process per device), with the
+    CPU time the parent process spends on each sample. Sharding scales with the cores: "cpus" is
+    the number of cores of this computer.
+    """
+
+    from labquest import LabQuest
+
+    duration = 0.5 if quick else 2.0
+    device_counts = (1, 2) if quick else (1, 2, 4)
+
+    def run(num_devices, sharded):
+        backend = functools.partial(ngio_sim.SimulatedNGIO, device_type=17, num_devices=num_devices, seed=SEED)
+        lq = LabQuest(backend=backend, sharded=sharded)
+        lq.open()
+        for device in range(num_devices):
+            lq.select_sensors(ch1='lq_sensor', ch2='lq_sensor', ch3='lq_sensor', device=device)
+        samples = 0
+        lq.start(period=0.1)
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+        end_time = start_time + duration
+        while time.perf_counter() < end_time:
+            for device in range(num_devices):
+                for time_stamps, values in lq.read_all(device).values():
+                    samples += values.size
+            # the CPU time is then the reads' own, not the loop's
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start_time
+        cpu = time.process_time() - start_cpu
+        lq.stop()
+        lq.close()
+        return {"samples_per_s":samples/elapsed, "parent_cpu_per_sample_us":cpu/max(samples, 1)*1e6}
+
+    results = {"cpus":os.cpu_count()}
+    for num_devices in device_counts:
+        results[str(num_devices) + "_devices"] = {"one_process":run(num_devices, False),
+                                                  "sharded":run(num_devices, True)}
+    return results
+
+def bench_read_latest(quick):
+    """ Time of read(mode='latest') with a backlog of 10 to 10,000 samples waiting (a control loop
+    slower than the sample rate), next to the time of a read() that finds the same backlog, and
+    the age of the sample returned
+    """
+
+    backlogs = (10, 100, 1000) if quick else (10, 100, 1000, 10000)
+    repeats = 3 if quick else 10
+    period = 0.1    # ms
+
+    results = {}
+    for backlog in backlogs:
+        lq, simulator = simulated_labquest(device_type=17)
+        lq.select_sensors(ch1='lq_sensor')
+        lq.start(period=period)
+        latest_times = []
+        oldest_times = []
+        for repeat in range(repeats):
+            time.sleep(backlog*period/1000)
+            read_start = time.perf_counter()
+            lq.read('ch1', mode='latest')
+            latest_times.append(time.perf_counter() - read_start)
+            time.sleep(backlog*period/1000)
+            read_start = time.perf_counter()
+            lq.read('ch1')
+            oldest_times.append(time.perf_counter() - read_start)
+            with config.use_session(lq.session):
+                read.buffer.session_buffer().buffer_clear()
+        latest_reads = lq.get_latest_reads('ch1')
+        results[str(backlog) + "_samples"] = {"latest":summarize(latest_times), "oldest":summarize(oldest_times),
+                                              "mean_discarded":latest_reads["discarded"]/latest_reads["reads"],
+                                              "mean_age":latest_reads["mean_age"]}
+        lq.stop()
+        lq.close()
+    return results
+
+def bench_control_loop(quick):
+    """ A bang-bang loop from ch1 (sampled every 2 ms) to the DCU at a 10 ms period (the simulated
+    NGIO calls take 0.5 ms, like a USB round trip), written as a plain Python loop (read(), then
+    dcu() for every iteration, sleeping for the period) and with control_loop(): iterations,
+    deadlines skipped, the jitter and latency of the iterations, and how old the samples used are
+    (seconds)
+    """
+
+    from labquest import labquest_instrumentation_functions as instrumentation
+
+    duration = 0.5 if quick else 2.0
+    period = 10    # ms
+    sample_period = 2    # ms
+
+    def bang_bang(time_stamp, value):
+        return 15 if value < 40 else 0
+
+    def loop_stats(stats):
+        return {"mean":stats.total_time/stats.calls if stats.calls else None, "max":stats.max_time}
+
+    def open_loop():
+        lq, simulator = simulated_labquest(device_type=17, latency=0.0005)
+        lq.select_sensors(ch1='lq_sensor', dig2='dcu')
+        lq.start(period=sample_period)
+        return lq
+
+    # the plain loop, timed the same way as control_loop() times itself
+    lq = open_loop()
+    jitter = instrumentation.CallStats()
+    latency = instrumentation.CallStats()
+    iterations = 0
+    deadline = time.perf_counter()
+    end_time = deadline + duration
+    while deadline < end_time:
+        time.sleep(max(deadline - time.perf_counter(), 0))
+        wake_time = time.perf_counter()
+        jitter.add(wake_time - deadline)
+        lq.dcu('dig2', bang_bang(None, lq.read('ch1')))
+        latency.add(time.perf_counter() - wake_time)
+        iterations += 1
+        deadline += period/1000
+    with config.use_session(lq.session):
+        # the values read() has kept: the loop uses each of them in turn, so its data are this far behind
+        backlog = read.buffer.session_buffer().ch1_0.qsize()
+    results = {"python_loop":{"iterations":iterations, "jitter":loop_stats(jitter), "latency":loop_stats(latency),
+                              "sample_age":backlog*sample_period/1000}}
+    lq.stop()
+    lq.close()
+
+    lq = open_loop()
+    loop = lq.control_loop(bang_bang, 'ch1', period, output='dcu', output_ch='dig2', duration=duration)
+    loop.wait()
+    results["control_loop"] = {"iterations":loop.iterations, "skipped":loop.skipped, "commands":loop.commands,
+                               "jitter":loop_stats(loop.jitter), "latency":loop_stats(loop.latency),
+                               "sample_age":lq.get_latest_reads('ch1')["mean_age"]}
+    lq.stop()
+    lq.close()
+    return results
+
+def bench_sequence(quick):
+    """ Timing of a DCU schedule (a step every 10 ms, the simulated NGIO calls take 0.5 ms, like
+    a USB round trip), sent with a plain Python loop (dcu(), then sleep for the step) and with
+    play_sequence(): how late the steps are sent against the schedule (seconds)
+    """
+
+    num_steps = 20 if quick else 100
+    step_time = 0.01
+    steps = [(step*step_time, step % 16) for step in range(num_steps)]
+
+    def lateness(late):
+        return {"mean":statistics.fmean(late), "max":max(late), "last":late[-1]}
+
+    lq, simulator = simulated_labquest(device_type=17, latency=0.0005)
+    lq.select_sensors(dig2='dcu')
+    late = []
+    start_time = time.perf_counter()
+    for step, value in steps:
+        late.append(time.perf_counter() - start_time - step)
+        lq.dcu('dig2', value)
+        time.sleep(step_time)
+    results = {"python_loop":lateness(late)}
+
+    player = lq.play_sequence(steps, output_ch='dig2')
+    player.wait()
+    results["play_sequence"] = lateness([entry["late"] for entry in player.log])
+    lq.close()
+    return results
+
+def bench_startup(quick):
+    """ Time to import labquest (in a fresh interpreter), to create a LabQuest object, and to
+    create one and open the first device (which loads the library)
+    """
+
+    repeats = 3 if quick else 10
+    import_code = "import time; t = time.perf_counter(); import labquest; print(time.perf_counter() - t)"
+    import_times = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, "-c", import_code], capture_output=True, text=True, check=True)
+        import_times.append(float(output.stdout.strip()))
+
+    from labquest import LabQuest
+
+    construct_times = []
+    open_times = []
+    for i in range(repeats):
+        construct_start = time.perf_counter()
+        lq = LabQuest(backend=ngio_sim.SimulatedNGIO(seed=SEED))
+        construct_times.append(time.perf_counter() - construct_start)
+        lq.open()
+        open_times.append(time.perf_counter() - construct_start)
+        lq.close()
+
+    return {"import":statistics.median(import_times), "construct":statistics.median(construct_times),
+            "construct_and_open":statistics.median(open_times)}
+
+
+BENCHMARKS = {
+    "startup":bench_startup,
+    "calibration":bench_calibration,
+    "read_latency":bench_read_latency,
+    "read_multi_pt":bench_read_multi_pt,
+    "setup_and_stop":bench_setup_and_stop,
+    "stop_start":bench_stop_start,
+    "device_io":bench_device_io,
+    "sharded":bench_sharded,
+    "read_latest":bench_read_latest,
+    "control_loop":bench_control_loop,
+    "sequence":bench_sequence,
+}
@@ -1,33 +1,156 @@
+# Variables passed between the functions.
+#
+# The state of each LabQuest object is kept in a Session. The functions use it as config.<name>
+# (config.hDevice, config.sample_period, ...): the module looks the name up in the session bound
+# to the current thread (or asyncio task) by use_session(), and in default_session if none is.
+# Each LabQuest binds its own session while its methods run, so LabQuest objects on separate
+# threads drive their devices independently.
 
+import contextvars
+import sys
+import types
 
-# Variables passed between the functions.
 
 logger = None # global logging instance for this module
-dll = None    # The NGIO library
-hLib = None    # Library handle
-hDevice = []    # 1D list of Device Handles of the connected devices
-device_type = None    # Original LQ, LQ Mini, LQ2, LQStream, or LQ3
-auto_id_list = []    # 2D list of all the auto-id sensors detected
-enabled_analog_channels = []   # 2D list of each device's active channels (sensors connected)
-enabled_dig_channels = []    # 2d list of each device's active dig channels
-enabled_all_channels = []    # 2D list of both analog and dig active channels [[1,2,3,5,6],[1,2]]
-channel_name_list = []    # 2D list of all enabled chs, but as string [['ch1','ch2','ch3','dig1','dig2'],['ch1','ch2']]
-motion = False     # is a motion detector configured?
-photogate = False    # is a photogate configured?
-photogate_timing = False
-rotary_motion = False    # is a rotary motion configured?
-rotary_motion_high_res = False    # is a rotary motion (high res) configured?
-dcu = False   # is a dcu configured?
-dcu_pwm = False
-sample_period = None
-op_type_list = []    # 2D list of each sensor's op_type. This value is used in the read function
-probe_type_list = []
-sensor_cal_list = []    # 2D list of each sensor's calibration and equation info. Used in the read function
-                        # {"equation":cal_eq, "cal0":active_cal0, "cal1":active_cal1, "cal2":active_cal2,
-                            #   "units":active_units, "active_calpage":active_calpage}
-device_dig_channel_dictionary = []    # 1D list of each devices dig channel info [{dig1:motion, dig2:photogate},{dig1:motion}]
-device_channel_dictionary = []    # 1D list of each devices channel info. The channel info is a 2D library
-                                    # each device will have info of each active channel. For example, dev0 has ch1,ch2 info
-                                    # and dev1 has ch1 info. Index out the library for the device, and return the library attributes
-                                    # [{ch1:{name:name, units:units}, ch2:{name:name, units:units}}, {ch1:{name:name, units:units}}]
-                                    # Get the name of the sensor in ch1 of dev0 = (device_channel_dictionary[0]["ch1"]["name"])
\ No newline at end of file
+
+# The LabQuest's channel numbers by name, and the names by number
+CHANNEL_NUMBERS = {'ch1':1, 'ch2':2, 'ch3':3, 'dig1':5, 'dig2':6}
+CHANNEL_NAMES = {number:name for name, number in CHANNEL_NUMBERS.items()}
+
+
+class Session:
+    """ The library handle, devices, channel configuration, calibrations, buffers and per-run
+    state of one LabQuest object
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Set every variable to its initial value (close() does this)
+        """
+
+        self.dll = None    # The NGIO library
+        self.hLib = None    # Library handle
+        self.hDevice = []    # 1D list of Device Handles of the connected devices
+        self.device_executors = {}    # {hDevice:DeviceExecutor} that serialize the NGIO calls to each device
+        self.device_type = None    # Original LQ, LQ Mini, LQ2, LQStream, or LQ3
+        self.auto_id_list = []    # 2D list of all the auto-id sensors detected
+        self.enabled_analog_channels = []   # 2D list of each device's active channels (sensors connected)
+        self.enabled_dig_channels = []    # 2d list of each device's active dig channels
+        self.enabled_all_channels = []    # 2D list of both analog and dig active channels [[1,2,3,5,6],[1,2]]
+        self.channel_name_list = []    # 2D list of all enabled chs, but as string [['ch1','ch2','ch3','dig1','dig2'],['ch1','ch2']]
+        self.motion = False     # is a motion detector configured?
+        self.photogate = False    # is a photogate configured?
+        self.photogate_timing = False
+        self.rotary_motion = False    # is a rotary motion configured?
+        self.rotary_motion_high_res = False    # is a rotary motion (high res) configured?
+        self.dcu = False   # is a dcu configured?
+        self.dcu_pwm = False
+        self.sample_period = None
+        self.configured = False    # True once start() has sent the channel configuration (restart() reuses it)
+        self.channel_periods = {}    # {(device_index, channel):seconds} of channels the device samples at their own period
+        self.period_factors = {}    # {(device_index, channel):N} slower channels that keep 1 of every N samples of sample_period
+        self.sustained_rates = {}    # {device_index:measurements/s} found by measure_throughput()
+        self.start_times = []    # perf_counter() of each device's Start Measurements command (time stamp 0)
+        self.stats = None    # NGIO call and polling counters (labquest_instrumentation_functions). None when disabled
+        self.overruns = None    # time stamp checks (labquest_overrun_functions). None when disabled
+        self.latest_reads = {}    # {(device_index, channel):LatestRead} sample age and discards of read(mode='latest')
+        self.packet_sinks = []    # callables sink(device_index, channel, time_stamps, values) given each packet of calibrated data
+        self.recorder = None    # the ColumnRecorder attached by start(recorder=...)
+        self.statistics = None    # the StatisticsSink used by LabQuest.stats(). None until stats() is first used
+        self.triggers = {}    # {(device_index, channel):Trigger} set by set_trigger()
+        self.subscriptions = []    # Subscription objects added by subscribe()
+        self.acquisition_loop = None    # the AcquisitionLoop that drains the channels for the subscribers
+        self.latest_samples = {}    # {(device_index, channel):(time_stamp, value, count)} newest sample the acquisition loop drained
+        self.control_loops = []    # ControlLoop objects started by LabQuest.control_loop()
+        self.sequence_players = []    # SequencePlayer objects started by LabQuest.play_sequence()
+        self.acquiring = False    # True between start() and stop()
+        self.shared_rings = {}    # {(device_index, channel):SharedRing} created by LabQuest.share()
+        self.raw_capture = False    # True when start(raw_capture=True) keeps the raw counts of the analog channels
+        self.raw_captures = {}    # {(device_index, channel):RawCapture} for the current run
+        self.calibration_snapshots = {}    # {(device_index, channel):calibration} used to calibrate whole packets at once
+        self.decimators = {}    # {(device_index, channel):Decimator} set by set_decimation()
+        self.oversample = 1    # number of hardware samples averaged into each sample, set by start(oversample=N)
+        self.oversamplers = {}    # {(device_index, channel):Decimator} that average the raw counts when oversampling
+        self.op_type_list = []    # 2D list of each sensor's op_type. This value is used in the read function
+        self.probe_type_list = []
+        self.sensor_cal_list = []    # 2D list of each sensor's calibration and equation info. Used in the read function
+                                # {"equation":cal_eq, "cal0":active_cal0, "cal1":active_cal1, "cal2":active_cal2,
+                                    #   "units":active_units, "active_calpage":active_calpage}
+        self.device_dig_channel_dictionary = []    # 1D list of each devices dig channel info [{dig1:motion, dig2:photogate},{dig1:motion}]
+        self.device_channel_dictionary = []    # 1D list of each devices channel info. The channel info is a 2D library
+                                            # each device will have info of each active channel. For example, dev0 has ch1,ch2 info
+                                            # and dev1 has ch1 info. Index out the library for the device, and return the library attributes
+                                            # [{ch1:{name:name, units:units}, ch2:{name:name, units:units}}, {ch1:{name:name, units:units}}]
+                                            # Get the name of the sensor in ch1 of dev0 = (device_channel_dictionary[0]["ch1"]["name"])
+        self.buffer = None    # the lq_buffer of this session's read() queues, created on first use
+
+    def __repr__(self):
+        return "<labquest Session, " + str(len(self.hDevice)) + " device(s)>"
+
+
+default_session = Session()    # the session used when none is bound (the most recently created LabQuest's)
+_current_session = contextvars.ContextVar('labquest_session', default=None)
+_SESSION_NAMES = frozenset(vars(default_session))
+
+
+def current_session():
+    """ The session bound to this thread or task, or default_session
+    """
+
+    return _current_session.get() or default_session
+
+
+class use_session:
+    """ Bind a session to the current thread (or asyncio task) while the with block runs:
+
+        with config.use_session(lq.session):
+            ...
+    """
+
+    __slots__ = ('session', 'token')
+
+    def __init__(self, session):
+        self.session = session
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current_session.set(self.session)
+        return self.session
+
+    def __exit__(self, *exc):
+        _current_session.reset(self.token)
+
+
+def in_current_session(function):
+    """ function, wrapped to run with the current session bound. A new thread starts with no
+    session bound, so the threads the functions start run their target through this.
+    """
+
+    session = current_session()
+
+    def function_in_session(*args, **kwargs):
+        with use_session(session):
+            return function(*args, **kwargs)
+    return function_in_session
+
+
+class _ConfigModule(types.ModuleType):
+    """ The config module. config.<name> reads and writes the current session's state, through
+    the property of each of the session's names.
+    """
+
+
+def _session_property(name):
+    def get(module):
+        return getattr(_current_session.get() or default_session, name)
+
+    def set(module, value):
+        setattr(_current_session.get() or default_session, name, value)
+    return property(get, set)
+
+
+for _name in _SESSION_NAMES:
+    setattr(_ConfigModule, _name, _session_property(_name))
+sys.modules[__name__].__class__ = _ConfigModule
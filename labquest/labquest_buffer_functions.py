@@ -3,6 +3,15 @@ from queue import Queue
 from labquest import config
 
 
+def session_buffer():
+    """ The lq_buffer of the current session, created the first time it is used
+    """
+
+    if config.buffer is None:
+        config.buffer = lq_buffer()
+    return config.buffer
+
+
 class lq_buffer:
     """ Create a buffer for the analog and digital channels of up to two labquest devices.
     The lq_buffer class uses queue to store excess data during data collection. For faster
@@ -10,22 +19,21 @@ class lq_buffer:
     recent data pt will be returned, the rest stored in this buffer. During the next call to read(), 
     a single data point from this buffer will be returned, rather than from the labquest. This will 
     continue until the buffer is empty, at which point the read() will again pull data from the labquest. 
+    Each session has its own lq_buffer (see session_buffer()).
 	"""
 
-    ch1_0 = Queue(maxsize=1)
-    ch2_0 = Queue(maxsize=1)
-    ch3_0 = Queue(maxsize=1)
-    dig1_0 = Queue(maxsize=1)
-    dig2_0 = Queue(maxsize=1)
-
-    ch1_1 = Queue(maxsize=1)
-    ch2_1 = Queue(maxsize=1)
-    ch3_1 = Queue(maxsize=1)
-    dig1_1 = Queue(maxsize=1)
-    dig2_1 = Queue(maxsize=1)
-
     def __init__(self):
-        pass
+        self.ch1_0 = Queue(maxsize=1)
+        self.ch2_0 = Queue(maxsize=1)
+        self.ch3_0 = Queue(maxsize=1)
+        self.dig1_0 = Queue(maxsize=1)
+        self.dig2_0 = Queue(maxsize=1)
+
+        self.ch1_1 = Queue(maxsize=1)
+        self.ch2_1 = Queue(maxsize=1)
+        self.ch3_1 = Queue(maxsize=1)
+        self.dig1_1 = Queue(maxsize=1)
+        self.dig2_1 = Queue(maxsize=1)
 
     def buffer_init(self):
         """ Initialize the buffer by setting queue(maxsize) = 0. This
@@ -38,32 +46,32 @@ class lq_buffer:
             if device_index == 0:
                 # all enabled channels. [[1,2,3,5,6],[1,2]]
                 for ch in config.enabled_all_channels[device_index]:
-                    config.logger.debug("buffer init ch" +str(ch))
+                    config.logger.debug("buffer init ch%s", ch)
                     if ch == 1:
-                        lq_buffer.ch1_0 = Queue(maxsize=0)
+                        self.ch1_0 = Queue(maxsize=0)
                     if ch == 2:
-                        lq_buffer.ch2_0 = Queue(maxsize=0)
+                        self.ch2_0 = Queue(maxsize=0)
                     if ch == 3:
-                        lq_buffer.ch3_0 = Queue(maxsize=0)
+                        self.ch3_0 = Queue(maxsize=0)
                     if ch == 5:
-                        lq_buffer.dig1_0 = Queue(maxsize=0)
+                        self.dig1_0 = Queue(maxsize=0)
                     if ch == 6:
-                        lq_buffer.dig2_0 = Queue(maxsize=0)
+                        self.dig2_0 = Queue(maxsize=0)
 
             if device_index == 1:
                 # all enabled channels. [[1,2,3,5,6],[1,2]]
                 for ch in config.enabled_all_channels[device_index]:
-                    config.logger.debug("buffer init ch" +str(ch))
+                    config.logger.debug("buffer init ch%s", ch)
                     if ch == 1:
-                        lq_buffer.ch1_1 = Queue(maxsize=0)
+                        self.ch1_1 = Queue(maxsize=0)
                     if ch == 2:
-                        lq_buffer.ch2_1 = Queue(maxsize=0)
+                        self.ch2_1 = Queue(maxsize=0)
                     if ch == 3:
-                        lq_buffer.ch3_1 = Queue(maxsize=0)
+                        self.ch3_1 = Queue(maxsize=0)
                     if ch == 5:
-                        lq_buffer.dig1_1 = Queue(maxsize=0)
+                        self.dig1_1 = Queue(maxsize=0)
                     if ch == 6:
-                        lq_buffer.dig2_1 = Queue(maxsize=0)
+                        self.dig2_1 = Queue(maxsize=0)
 
             device_index += 1
 
@@ -73,29 +81,29 @@ class lq_buffer:
 
         if device_index == 0:
             if ch == 1:
-                is_empty = lq_buffer.ch1_0.empty()
+                is_empty = self.ch1_0.empty()
             if ch == 2:
-                is_empty = lq_buffer.ch2_0.empty()
+                is_empty = self.ch2_0.empty()
             if ch == 3:
-                is_empty = lq_buffer.ch3_0.empty()
+                is_empty = self.ch3_0.empty()
             if ch == 5:
-                is_empty = lq_buffer.dig1_0.empty()
+                is_empty = self.dig1_0.empty()
             if ch == 6:
-                is_empty = lq_buffer.dig2_0.empty()
+                is_empty = self.dig2_0.empty()
 
         if device_index == 1:
             if ch == 1:
-                is_empty = lq_buffer.ch1_1.empty()
+                is_empty = self.ch1_1.empty()
             if ch == 2:
-                is_empty = lq_buffer.ch2_1.empty()
+                is_empty = self.ch2_1.empty()
             if ch == 3:
-                is_empty = lq_buffer.ch3_1.empty()
+                is_empty = self.ch3_1.empty()
             if ch == 5:
-                is_empty = lq_buffer.dig1_1.empty()
+                is_empty = self.dig1_1.empty()
             if ch == 6:
-                is_empty = lq_buffer.dig2_1.empty()
+                is_empty = self.dig2_1.empty()
                         
-        config.logger.debug("buffer 'empty' ch" +str(ch) +": " +str(is_empty))
+        config.logger.debug("buffer 'empty' ch%s: %s", ch, is_empty)
         return is_empty
 
     def buffer_put(self, device_index, ch, new_data):
@@ -103,40 +111,40 @@ class lq_buffer:
         """
 
         if device_index == 0:
-            config.logger.debug("buffer 'put' ch" +str(ch) +": " +str(new_data))
+            config.logger.debug("buffer 'put' ch%s: %s", ch, new_data)
             if ch == 1:
                 for data in new_data:
-                    lq_buffer.ch1_0.put(data)
+                    self.ch1_0.put(data)
             if ch == 2:
                 for data in new_data:
-                    lq_buffer.ch2_0.put(data)
+                    self.ch2_0.put(data)
             if ch == 3:
                 for data in new_data:
-                    lq_buffer.ch3_0.put(data)
+                    self.ch3_0.put(data)
             if ch == 5:
                 for data in new_data:
-                    lq_buffer.dig1_0.put(data)
+                    self.dig1_0.put(data)
             if ch == 6:
                 for data in new_data:
-                    lq_buffer.dig2_0.put(data)
+                    self.dig2_0.put(data)
 
         if device_index == 1:
-            config.logger.debug("buffer 'put' ch" +str(ch) +": " +str(new_data))
+            config.logger.debug("buffer 'put' ch%s: %s", ch, new_data)
             if ch == 1:
                 for data in new_data:
-                    lq_buffer.ch1_1.put(data)
+                    self.ch1_1.put(data)
             if ch == 2:
                 for data in new_data:
-                    lq_buffer.ch2_1.put(data)
+                    self.ch2_1.put(data)
             if ch == 3:
                 for data in new_data:
-                    lq_buffer.ch3_1.put(data)
+                    self.ch3_1.put(data)
             if ch == 5:
                 for data in new_data:
-                    lq_buffer.dig1_1.put(data)
+                    self.dig1_1.put(data)
             if ch == 6:
                 for data in new_data:
-                    lq_buffer.dig2_1.put(data)
+                    self.dig2_1.put(data)
 
        
     def buffer_get(self, device_index, ch):
@@ -147,64 +155,78 @@ class lq_buffer:
 
         if device_index == 0:
             if ch == 1:
-                if lq_buffer.ch1_0.empty() == False:
-                    measurement = lq_buffer.ch1_0.get()
+                if self.ch1_0.empty() == False:
+                    measurement = self.ch1_0.get()
             if ch == 2:
-                if lq_buffer.ch2_0.empty() == False:
-                    measurement = lq_buffer.ch2_0.get()
+                if self.ch2_0.empty() == False:
+                    measurement = self.ch2_0.get()
             if ch == 3:
-                if lq_buffer.ch3_0.empty() == False:
-                    measurement = lq_buffer.ch3_0.get()
+                if self.ch3_0.empty() == False:
+                    measurement = self.ch3_0.get()
             if ch == 5:
-                if lq_buffer.dig1_0.empty() == False:
-                    measurement = lq_buffer.dig1_0.get()
+                if self.dig1_0.empty() == False:
+                    measurement = self.dig1_0.get()
             if ch == 6:
-                if lq_buffer.dig2_0.empty() == False:
-                    measurement = lq_buffer.dig2_0.get()
+                if self.dig2_0.empty() == False:
+                    measurement = self.dig2_0.get()
 
         if device_index == 1:
             if ch == 1:
-                if lq_buffer.ch1_1.empty() == False:
-                    measurement = lq_buffer.ch1_1.get()
+                if self.ch1_1.empty() == False:
+                    measurement = self.ch1_1.get()
             if ch == 2:
-                if lq_buffer.ch2_1.empty() == False:
-                    measurement = lq_buffer.ch2_1.get()
+                if self.ch2_1.empty() == False:
+                    measurement = self.ch2_1.get()
             if ch == 3:
-                if lq_buffer.ch3_1.empty() == False:
-                    measurement = lq_buffer.ch3_1.get()
+                if self.ch3_1.empty() == False:
+                    measurement = self.ch3_1.get()
             if ch == 5:
-                if lq_buffer.dig1_1.empty() == False:
-                    measurement = lq_buffer.dig1_1.get()
+                if self.dig1_1.empty() == False:
+                    measurement = self.dig1_1.get()
             if ch == 6:
-                if lq_buffer.dig2_1.empty() == False:
-                    measurement = lq_buffer.dig2_1.get()
+                if self.dig2_1.empty() == False:
+                    measurement = self.dig2_1.get()
             
-        config.logger.debug("buffer 'get' ch" +str(ch) +": " +str(measurement))
+        config.logger.debug("buffer 'get' ch%s: %s", ch, measurement)
         return measurement
 
 
+    def buffer_discard(self, device_index, ch):
+        """ Empty the buffer of a specified channel. Returns the number of data points discarded.
+        """
+
+        name = config.CHANNEL_NAMES.get(ch)
+        if name is None or device_index not in (0, 1):
+            return 0
+        queue = getattr(self, name + "_" + str(device_index))
+        with queue.mutex:
+            num_discarded = len(queue.queue)
+            queue.queue.clear()
+        config.logger.debug("buffer 'discard' ch%s: %s", ch, num_discarded)
+        return num_discarded
+
     def buffer_clear(self):
         """ Uninit the buffer by clearing queue
         """
         config.logger.debug("buffer clear")
-        with lq_buffer.ch1_0.mutex:
-            lq_buffer.ch1_0.queue.clear()
-        with lq_buffer.ch2_0.mutex:
-            lq_buffer.ch2_0.queue.clear()
-        with lq_buffer.ch3_0.mutex:
-            lq_buffer.ch3_0.queue.clear()
-        with lq_buffer.dig1_0.mutex:
-            lq_buffer.dig1_0.queue.clear()
-        with lq_buffer.dig2_0.mutex:
-            lq_buffer.dig2_0.queue.clear()
-
-        with lq_buffer.ch1_1.mutex:
-            lq_buffer.ch1_1.queue.clear()
-        with lq_buffer.ch2_1.mutex:
-            lq_buffer.ch2_1.queue.clear()
-        with lq_buffer.ch3_1.mutex:
-            lq_buffer.ch3_1.queue.clear()
-        with lq_buffer.dig1_1.mutex:
-            lq_buffer.dig1_1.queue.clear()
-        with lq_buffer.dig2_1.mutex:
-            lq_buffer.dig2_1.queue.clear()
\ No newline at end of file
+        with self.ch1_0.mutex:
+            self.ch1_0.queue.clear()
+        with self.ch2_0.mutex:
+            self.ch2_0.queue.clear()
+        with self.ch3_0.mutex:
+            self.ch3_0.queue.clear()
+        with self.dig1_0.mutex:
+            self.dig1_0.queue.clear()
+        with self.dig2_0.mutex:
+            self.dig2_0.queue.clear()
+
+        with self.ch1_1.mutex:
+            self.ch1_1.queue.clear()
+        with self.ch2_1.mutex:
+            self.ch2_1.queue.clear()
+        with self.ch3_1.mutex:
+            self.ch3_1.queue.clear()
+        with self.dig1_1.mutex:
+            self.dig1_1.queue.clear()
+        with self.dig2_1.mutex:
+            self.dig2_1.queue.clear()
\ No newline at end of file
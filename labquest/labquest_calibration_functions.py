@@ -0,0 +1,191 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# The nominal straight line of NGIO_Device_ConvertToVoltage() for each probe type, for data that
+# is calibrated away from the device. {probe_type:(volts_per_count, voltage_offset)}
+# probe type 2 is the 5 V input (0 to 5 V), probe type 3 the 10 V input (-10 to +10 V).
+NOMINAL_VOLTAGE_SCALE = {2:(5/4096, 0.0), 3:(20/4096, -10.0)}
+
+CALIBRATED_FILE_SUFFIX = ".calibrated.npz"
+
+
+def calibrate_voltages(voltages, equation, k0, k1, k2, calpage=0):
+    """ Use the equation and calibration values to convert an array of sensor voltages to
+    proper sensor units. This is the array form of apply_calibration() in
+    labquest_read_functions.py, and gives the same values.
+
+    Args:
+        voltages: sensor voltages (a number, list or numpy array)
+
+        equation (int): 1 linear, 2 quadratic, 3 power, 4 modified power, 5 logarithmic,
+        12 Steinhart-Hart
+
+        k0, k1, k2 (float): the calibration coefficients of the calibration page
+
+        calpage (int): the active calibration page. For equation 12 this selects the
+        units: 0 Celsius, 1 Fahrenheit, any other Kelvin.
+
+    Returns:
+        calibrated values (numpy float64 array). Unknown equations return NaN.
+    """
+
+    voltages = np.asarray(voltages, dtype=np.float64)
+
+    # an equation of 1 signifies a linear calibration:
+    if equation == 1:
+        return voltages*k1 + k0
+    # equation 2 is a quadratic used for wide range temp probe:
+    if equation == 2:
+        return k0 + k1*voltages + k2*voltages*voltages
+    # equation 3 is a power function used by the ethanol sensor:
+    if equation == 3:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.power(voltages, k1)*k0
+    # equation 4: ISE sensors use a modified power relationship
+    if equation == 4:
+        return k0*np.power(k1, voltages)
+    # equation 5: Logarithmic. The Colorimeter uses this equation.
+    if equation == 5:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return k0 + k1*np.log(voltages)
+    # equation 12: Steinhart-Hart equation for temp sensors
+    if equation == 12:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resistance = 15000/(5/voltages - 1)
+            log_r = np.log(resistance)
+            temperature = 1/(k0 + k1*log_r + k2*log_r*log_r*log_r) - 273.15
+        # a voltage of 0 has no resistance to convert
+        temperature = np.where(voltages == 0, np.nan, temperature)
+        if calpage == 0:    # Celsius
+            return temperature
+        if calpage == 1:    # Fahrenheit
+            return temperature*1.8 + 32
+        return temperature + 273    # Kelvin
+
+    return np.full(voltages.shape, np.nan)
+
+def counts_to_voltages(raw, volts_per_count, voltage_offset):
+    """ Convert an array of raw A/D counts to voltages, using the straight line that
+    NGIO_Device_ConvertToVoltage() applies for the channel and probe type.
+    """
+
+    return np.asarray(raw, dtype=np.float64)*volts_per_count + voltage_offset
+
+def calibrate(raw, equation, k0, k1, k2, calpage=0, probe_type=2, volts_per_count=None, voltage_offset=None):
+    """ Convert raw A/D counts to sensor units without a device. 
+
+    Args:
+        raw: raw counts (a number, list or numpy array), as returned by NGIO_Device_ReadRawMeasurements()
+
+        equation, k0, k1, k2, calpage: the sensor's calibration (see calibrate_voltages())
+
+        probe_type (int): 2 for a 5 V sensor, 3 for a 10 V sensor (an operation type of 2)
+
+        volts_per_count, voltage_offset (float): the counts to voltage line. If None, the nominal
+        line of the probe type is used. A RawCapture calibration snapshot has the measured line.
+
+    Returns:
+        calibrated values (numpy float64 array)
+    """
+
+    nominal_volts_per_count, nominal_offset = NOMINAL_VOLTAGE_SCALE.get(probe_type, NOMINAL_VOLTAGE_SCALE[2])
+    if volts_per_count is None:
+        volts_per_count = nominal_volts_per_count
+    if voltage_offset is None:
+        voltage_offset = nominal_offset
+
+    voltages = counts_to_voltages(raw, volts_per_count, voltage_offset)
+    return calibrate_voltages(voltages, equation, k0, k1, k2, calpage)
+
+def calibrate_capture_file(path, output_path=None, calibration=None, block_size=1048576):
+    """ Calibrate a raw capture saved with RawCapture.save(), and save the time stamps and
+    calibrated values to a .npz file.
+
+    Args:
+        path (str): the raw capture (.npz)
+
+        output_path (str): where to save the result. If None, the name of the raw capture file
+        with CALIBRATED_FILE_SUFFIX.
+
+        calibration (dict): values that replace those in the file's calibration snapshot
+        (for example {"k0":0.0, "k1":2.5}), to apply a corrected calibration
+
+        block_size (int): number of samples calibrated at a time, to limit the temporary memory
+
+    Returns:
+        output_path (str)
+    """
+
+    if output_path is None:
+        output_path = _calibrated_file_name(path)
+
+    with np.load(path) as data:
+        raw = data["raw"]
+        time_stamps = data["time_stamps"]
+        snapshot = json.loads(str(data["calibration"]))
+    if calibration:
+        snapshot.update(calibration)
+
+    values = np.empty(raw.size, dtype=np.float64)
+    for start in range(0, raw.size, block_size):
+        values[start:start + block_size] = calibrate(
+                raw[start:start + block_size], snapshot["equation"], snapshot["k0"], snapshot["k1"],
+                snapshot["k2"], snapshot.get("calpage", 0), snapshot.get("probe_type", 2),
+                snapshot.get("volts_per_count"), snapshot.get("voltage_offset"))
+
+    np.savez(output_path, time_stamps=time_stamps, values=values, calibration=np.array(json.dumps(snapshot)))
+    return output_path
+
+def calibrate_files(paths, output_directory=None, calibration=None, max_workers=None, chunksize=None):
+    """ Calibrate many raw capture files in parallel, one process per core.
+
+    Args:
+        paths (list): raw capture files (.npz, from RawCapture.save())
+
+        output_directory (str): folder for the calibrated files. If None, each calibrated file is
+        saved next to its raw capture.
+
+        calibration (dict): values that replace those in every file's calibration snapshot
+
+        max_workers (int): number of processes. If None, the number of cores.
+
+        chunksize (int): number of files handed to a process at a time. If None, the files are
+        split into about four chunks per process.
+
+    Returns:
+        output_paths (list): the calibrated files, in the order of paths
+    """
+
+    paths = [os.fspath(path) for path in paths]
+    if not paths:
+        return []
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(paths))
+    if chunksize is None:
+        chunksize = max(1, len(paths)//(max_workers*4))
+
+    if output_directory is not None:
+        os.makedirs(output_directory, exist_ok=True)
+        output_paths = [os.path.join(output_directory, os.path.basename(_calibrated_file_name(path)))
+                        for path in paths]
+    else:
+        output_paths = [_calibrated_file_name(path) for path in paths]
+
+    # a single file (or a single worker) is not worth starting processes for
+    if max_workers == 1:
+        return [calibrate_capture_file(path, output_path, calibration)
+                for path, output_path in zip(paths, output_paths)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(calibrate_capture_file, paths, output_paths,
+                                 [calibration]*len(paths), chunksize=chunksize))
+
+def _calibrated_file_name(path):
+    if path.endswith(".npz"):
+        path = path[:-len(".npz")]
+    return path + CALIBRATED_FILE_SUFFIX
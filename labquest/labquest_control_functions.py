@@ -0,0 +1,241 @@
+import threading
+import time
+
+from labquest import config
+from labquest import labquest_dcu_functions as dcu
+from labquest import labquest_device_io_functions as device_io
+from labquest import labquest_instrumentation_functions as instrumentation
+from labquest import labquest_read_functions as read
+from labquest import labquest_start_functions as start
+from labquest import labquest_subscriber_functions as subscriber
+
+
+CONTROL_OUTPUTS = ('dcu', 'pwm', None)
+# Seconds stop() waits for the last output command to be sent
+COMMAND_TIMEOUT = 2.0
+
+
+class ControlLoop:
+    """ Runs a control function at a fixed period on its own thread. Each iteration reads the
+    newest sample of the input channel (as read(mode='latest') does, so the backlog is skipped, or
+    from the acquisition loop when it drains the channel for subscribers), calls control(time_stamp, value), and if the output changed, queues the command on the
+    device's executor without waiting for the response. If a command is still being sent, only
+    the newest output is kept and sent when it is done.
+
+    The iterations are scheduled from the start time, so they do not drift. An iteration that
+    runs past the next deadlines skips them (counted in "skipped") instead of running late in a
+    burst.
+
+    Args:
+        control: function control(time_stamp, value) returning the output: a DCU value (0-15) for
+        output='dcu', (frequency_Hz, duty_cycle) for output='pwm', or None to leave the output
+        as it is. The time stamp is in microseconds from the start.
+
+        device_index (int), ch (str): the input channel, 'ch1', 'ch2', 'ch3', 'dig1' or 'dig2'
+
+        period (float): seconds between iterations
+
+        output (str): 'dcu', 'pwm', or None if the control function drives something else
+
+        output_ch (str): the DCU's channel, 'dig1' or 'dig2' (the PWM output is on dig1)
+
+        duration (float): seconds to run. None runs until stop().
+    """
+
+    def __init__(self, control, device_index, ch, period, output='dcu', output_ch='dig1', duration=None):
+        self.control = control
+        self.device_index = device_index
+        self.ch = ch
+        self.channel = config.CHANNEL_NUMBERS[ch]
+        self.period = period
+        self.output = output
+        self.output_ch = output_ch
+        self.duration = duration
+        self.last_output = None    # the newest output asked for (sent, being sent, or pending)
+        self._in_flight = None    # Future of the command being sent
+        self._pending = None    # output waiting for the command in flight
+        # reentrant: a done callback runs at once, on this thread, if the command is already done
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.iterations = 0
+        self.skipped = 0    # deadlines missed because an iteration ran late
+        self.no_sample = 0    # iterations without a new sample since the one before
+        self.commands = 0    # output commands sent
+        self.coalesced = 0    # outputs replaced by a newer one before they were sent
+        self.errors = 0    # exceptions raised by the control function or the output command
+        self.jitter = instrumentation.CallStats()    # wake-up time minus the deadline
+        self.latency = instrumentation.CallStats()    # wake-up to output queued: read, control and send
+        self.command_time = instrumentation.CallStats()    # output queued to the device's response
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=config.in_current_session(self._run), name="labquest-control",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the iterations, and wait for the last output command. The outputs are left as
+        they are (LabQuest.stop() turns the DCU lines and the PWM off).
+        """
+
+        self._stop.set()
+        self.wait()
+        with self._lock:
+            in_flight = self._in_flight
+        if in_flight is not None:
+            try:
+                in_flight.result(COMMAND_TIMEOUT)
+            except Exception:
+                pass
+
+    def wait(self, timeout=None):
+        """ Wait for the loop to finish (the end of its duration, or stop()). Returns True if it has.
+        """
+
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+        return True
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def as_dict(self):
+        return {"iterations":self.iterations, "skipped":self.skipped, "no_sample":self.no_sample,
+                "commands":self.commands, "coalesced":self.coalesced, "errors":self.errors,
+                "jitter":self.jitter.as_dict(), "latency":self.latency.as_dict(),
+                "command_time":self.command_time.as_dict()}
+
+    def _run(self):
+        deadline = time.perf_counter()
+        end_time = None if self.duration is None else deadline + self.duration
+        while True:
+            now = time.perf_counter()
+            if deadline > now:
+                if self._stop.wait(deadline - now):
+                    break
+                now = time.perf_counter()
+            elif self._stop.is_set():
+                break
+            if end_time is not None and now >= end_time:
+                break
+            self.jitter.add(now - deadline)
+            self._iterate(now)
+            self.iterations += 1
+            deadline += self.period
+            missed = int((time.perf_counter() - deadline)//self.period)
+            if missed > 0:
+                self.skipped += missed
+                deadline += missed*self.period
+
+    def _iterate(self, wake_time):
+        # an iteration does not wait for a sample: the control function runs again with the next one
+        acquisition_loop = config.acquisition_loop
+        if acquisition_loop is not None and (self.device_index, self.channel) in acquisition_loop.channels:
+            sample = subscriber.take_latest_sample(self.device_index, self.channel)
+        else:
+            sample = read.get_latest_measurement(self.device_index, self.ch, wait=False)
+        if sample is None:
+            self.no_sample += 1
+            return
+        try:
+            output = self.control(*sample)
+        except Exception as error:
+            self.errors += 1
+            config.logger.info("Control function failed: %s", error)
+            return
+        if output is not None and self.output is not None:
+            self._set_output(output)
+        self.latency.add(time.perf_counter() - wake_time)
+
+    def _set_output(self, output):
+        # only changes are sent
+        if output == self.last_output:
+            return
+        self.last_output = output
+        with self._lock:
+            if self._in_flight is not None and not self._in_flight.done():
+                if self._pending is not None:
+                    self.coalesced += 1
+                self._pending = output
+                return
+            self._submit(output)
+
+    def _submit(self, output):
+        # called holding self._lock
+        self.commands += 1
+        executor = device_io.get_executor(config.hDevice[self.device_index])
+        self._in_flight = executor.submit(self._send, output, time.perf_counter())
+        self._in_flight.add_done_callback(self._sent)
+
+    def _send(self, output, queued_time):
+        # runs on the device's executor thread
+        try:
+            if self.output == 'dcu':
+                dcu.set_io_line(self.output_ch, output, self.device_index)
+            else:
+                frequency_Hz, duty_cycle = output
+                dcu.set_pwm(frequency_Hz, duty_cycle, self.device_index)
+        except Exception as error:
+            self.errors += 1
+            config.logger.info("Control output failed: %s", error)
+        self.command_time.add(time.perf_counter() - queued_time)
+
+    def _sent(self, future):
+        with self._lock:
+            if self._pending is not None:
+                output, self._pending = self._pending, None
+                self._submit(output)
+
+
+def start_control_loop(control, device_index, ch, period, output='dcu', output_ch='dig1', duration=None):
+    """ Check the input and output channels, then start a ControlLoop (period in seconds) and add
+    it to config.control_loops.
+
+    Returns:
+        loop (ControlLoop), or None if the channels are not configured for it
+    """
+
+    if output not in CONTROL_OUTPUTS:
+        config.logger.info("control_loop() - output must be 'dcu', 'pwm' or None")
+        return None
+    if device_index >= len(config.hDevice):
+        config.logger.info("control_loop() - no device " + str(device_index))
+        return None
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("control_loop() - unknown channel: " + str(ch))
+        return None
+    if channel not in config.enabled_all_channels[device_index]:
+        config.logger.info("control_loop() - " + str(ch) + " is not enabled")
+        return None
+    sensors = config.device_dig_channel_dictionary[device_index]
+    if output == 'pwm':
+        output_ch = 'dig1'
+    if output is not None and sensors.get(output_ch) != dcu.OUTPUT_SENSORS[output]:
+        config.logger.info("control_loop() - select_sensors() has not set " + output_ch + " to '" +
+                           dcu.OUTPUT_SENSORS[output] + "'")
+        return None
+    if period < start.output_period(device_index, channel):
+        config.logger.info("control_loop() - the loop is faster than the channel's sample period, so some " +
+                           "iterations will have no new sample")
+
+    loop = ControlLoop(control, device_index, ch, period, output, output_ch, duration)
+    config.control_loops.append(loop)
+    loop.start()
+    return loop
+
+def stop_control_loops():
+    """ Stop every control loop (LabQuest.stop() does this before stopping the measurements)
+    """
+
+    for loop in config.control_loops:
+        loop.stop()
+    config.control_loops = []
@@ -1,15 +1,22 @@
 from labquest import config
 from labquest import ngio_send_cmd_get_resp as ngio_send
 
+# The sensor select_sensors() sets on the channel of each kind of output
+OUTPUT_SENSORS = {'dcu':'dcu', 'pwm':'dcu_pwm'}
+
 def set_io_line(ch, value, device_index):
     """Set the DCU line with Send Command Get Response - Write IO
     """
 
     hDevice = config.hDevice[device_index]
-    if ch == 'dig1':
-            dig_channel = 5
-    if ch == 'dig2':
-            dig_channel = 6
+    command, parameters, param_bytes = encode_io_line(ch, value)
+    ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
+
+def encode_io_line(ch, value):
+    """ The Write IO command that sets the DCU lines: (command, parameters, param_bytes)
+    """
+
+    dig_channel = config.CHANNEL_NUMBERS[ch]
 
     parameters = [0]*14    # the ngio function is expecting up to 14 values in the parameters         
     command = 0x39    #define NGIO_CMD_ID_WRITE_IO 0x39
@@ -19,7 +26,7 @@ def set_io_line(ch, value, device_index):
     parameters[2] = value    # output
     param_bytes = 3
     #parameters = (dig_channel, 15, values[i], 0,0,0,0,0,0,0,0,0,0,0)
-    ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
+    return command, parameters, param_bytes
                 
 
 def dcu_all_lines_off():
@@ -49,6 +56,17 @@ def dcu_all_lines_off():
 def set_pwm(frequency_Hz, duty_cycle, device_index):
     """ Frequency range of 2.5 Hz (0.4 sec period) to 1,000,000 Hz (1 microsecond period)
     """
+
+    hDevice = config.hDevice[device_index]
+    command, parameters, param_bytes = encode_pwm(frequency_Hz, duty_cycle)
+    # debug: a control loop may change the duty cycle every few milliseconds
+    config.logger.debug("set_pwm: parameters %s", parameters)
+    ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
+
+def encode_pwm(frequency_Hz, duty_cycle):
+    """ The Set PWM Config command that starts the PWM output on dig1: (command, parameters, param_bytes)
+    """
+
     # convert frequency to period (seconds)
     period = 1/frequency_Hz
     # convert period (seconds) to period (nanoseconds) and make sure it is unsigned int
@@ -57,7 +75,6 @@ def set_pwm(frequency_Hz, duty_cycle, device_index):
     denominator = 10000
     numerator = abs(int((duty_cycle/100)*denominator))
     dig_channel = 5
-    hDevice = config.hDevice[device_index]
     
     parameters = [0]*14    # the ngio function is expecting up to 14 values in the parameters
     command = 0x40    ##define NGIO_CMD_ID_SET_PWM_CONFIG 0x40
@@ -71,8 +88,7 @@ def set_pwm(frequency_Hz, duty_cycle, device_index):
     #denominator_bytes = int32_to_int8(denominator)
     #parameters = (dig_channel, pwm_state) + period_bytes + numerator_bytes + denominator_bytes   # pwm state, period, numerator, denominator
     param_bytes = 14
-    config.logger.info("set_pwm: parameters " + str(parameters))
-    ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
+    return command, parameters, param_bytes
                 
 
 def int32_to_int8(n):
@@ -0,0 +1,153 @@
+import numpy as np
+
+from labquest import config
+
+
+DECIMATION_MODES = ('mean', 'min', 'max', 'minmax', 'last')
+
+
+class Decimator:
+    """ Reduce a channel's data by a factor of N, one packet at a time. Each block of N samples
+    becomes one value ('mean', 'min', 'max' or 'last') or two values ('minmax': the minimum and the
+    maximum of the block, in the order they happened). Samples left over at the end of a packet are
+    kept and completed by the next packet.
+
+    Args:
+        factor (int): number of samples in each block
+
+        mode (str): 'mean', 'min', 'max', 'minmax' or 'last'
+    """
+
+    def __init__(self, factor, mode='mean'):
+        self.factor = int(factor)
+        self.mode = mode
+        self.reset()
+
+    def reset(self):
+        """ Discard the samples of an incomplete block. Called by start().
+        """
+
+        self._carry_times = np.empty(0, dtype=np.int64)
+        self._carry_values = np.empty(0, dtype=np.float64)
+
+    def samples_needed(self, num_outputs=1):
+        """ Number of new samples needed for num_outputs complete blocks
+        """
+
+        return max(self.factor*num_outputs - self._carry_values.size, 1)
+
+    def process(self, time_stamps, values):
+        """ Decimate a packet of time stamps (microseconds) and values.
+
+        Returns:
+            time_stamps, values (numpy arrays): one entry per complete block (two for 'minmax').
+            The time stamp is the mean time of the block for 'mean', otherwise the time of the
+            value that was kept.
+        """
+
+        time_stamps = np.concatenate((self._carry_times, np.asarray(time_stamps, dtype=np.int64)))
+        values = np.concatenate((self._carry_values, np.asarray(values, dtype=np.float64)))
+        num_blocks = values.size // self.factor
+        used = num_blocks*self.factor
+        self._carry_times = time_stamps[used:]
+        self._carry_values = values[used:]
+
+        time_blocks = time_stamps[:used].reshape(num_blocks, self.factor)
+        value_blocks = values[:used].reshape(num_blocks, self.factor)
+        rows = np.arange(num_blocks)
+
+        if self.mode == 'mean':
+            return time_blocks.mean(axis=1).astype(np.int64), value_blocks.mean(axis=1)
+        if self.mode == 'last':
+            return time_blocks[:, -1], value_blocks[:, -1]
+        if self.mode == 'min':
+            index = value_blocks.argmin(axis=1)
+            return time_blocks[rows, index], value_blocks[rows, index]
+        if self.mode == 'max':
+            index = value_blocks.argmax(axis=1)
+            return time_blocks[rows, index], value_blocks[rows, index]
+
+        # minmax: the two extremes of each block, earliest first
+        min_index = value_blocks.argmin(axis=1)
+        max_index = value_blocks.argmax(axis=1)
+        first = np.minimum(min_index, max_index)
+        second = np.maximum(min_index, max_index)
+        out_times = np.empty(2*num_blocks, dtype=np.int64)
+        out_values = np.empty(2*num_blocks, dtype=np.float64)
+        out_times[0::2] = time_blocks[rows, first]
+        out_times[1::2] = time_blocks[rows, second]
+        out_values[0::2] = value_blocks[rows, first]
+        out_values[1::2] = value_blocks[rows, second]
+        return out_times, out_values
+
+
+def set_decimation(device_index, ch, factor, mode='mean'):
+    """ Decimate a channel by factor, using mode. A factor of 1 (or None) turns decimation off.
+    Motion detector data can not be decimated.
+    """
+
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("set_decimation() - unknown channel: " + str(ch))
+        return
+    if mode not in DECIMATION_MODES:
+        config.logger.info("set_decimation() - mode must be one of " + str(DECIMATION_MODES))
+        return
+    if channel in (5, 6):
+        try:
+            sensor = config.device_dig_channel_dictionary[device_index].get(ch)
+        except IndexError:
+            sensor = None
+        if sensor == 'motion':
+            config.logger.info("set_decimation() - motion detector data can not be decimated")
+            return
+
+    if not factor or factor <= 1:
+        config.decimators.pop((device_index, channel), None)
+        config.logger.info("Decimation off: device " + str(device_index) + " " + ch)
+        return
+
+    config.decimators[(device_index, channel)] = Decimator(factor, mode)
+    config.logger.info("Decimation: device " + str(device_index) + " " + ch + " " + mode + " of " + str(factor))
+
+def reset_decimation():
+    """ Start every decimator and oversampler with an empty block
+    """
+
+    for decimator in config.decimators.values():
+        decimator.reset()
+    for oversampler in config.oversamplers.values():
+        oversampler.reset()
+
+def start_oversampling(oversample):
+    """ Create an oversampler for every enabled channel. The analog channels average each group of
+    oversample raw counts (before calibration); the rotary motion and photogate count channels keep
+    the last count of each group. A channel that is sampled faster than its own period (see
+    labquest_start_functions.set_period_factors()) also reduces each group of N samples to one. 
+    Called by LabQuest.start(oversample=N).
+    """
+
+    config.oversample = oversample
+    config.oversamplers = {}
+
+    for device_index, device_enabled_chs in enumerate(config.enabled_all_channels):
+        for channel in device_enabled_chs:
+            factor = oversample*config.period_factors.get((device_index, channel), 1)
+            if factor > 1:
+                mode = 'mean' if channel in (1, 2, 3) else 'last'
+                config.oversamplers[(device_index, channel)] = Decimator(factor, mode)
+
+def samples_needed(device_index, channel, num_outputs=1):
+    """ Number of new raw samples needed for num_outputs values, through the channel's oversampler
+    and decimator. None if the channel has neither.
+    """
+
+    oversampler = config.oversamplers.get((device_index, channel))
+    decimator = config.decimators.get((device_index, channel))
+    if oversampler is None and decimator is None:
+        return None
+    if decimator is not None:
+        num_outputs = decimator.samples_needed(num_outputs)
+    if oversampler is not None:
+        num_outputs = oversampler.samples_needed(num_outputs)
+    return num_outputs
@@ -0,0 +1,241 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from labquest import config
+
+
+SHARED = object()    # DeviceExecutor.owner once more than one thread has called the device
+
+
+class DeviceExecutor:
+    """ Serializes the NGIO calls to one device handle. A call made by a read or command function
+    runs on the caller's thread, holding the device's lock, so it does not wait for a thread
+    switch. Functions queued with submit() run in order on the executor's own thread (started the
+    first time one is queued), holding the same lock. Calls to other devices run in parallel: ctypes
+    releases the GIL during each NGIO call.
+
+    While only one thread has called the device (its owner), its calls skip the lock: there is
+    nothing to serialize. The first call from a second thread makes the device shared (see
+    claim()), and from then on every call holds the lock.
+    """
+
+    def __init__(self, hDevice):
+        self.hDevice = hDevice
+        self.lock = threading.RLock()
+        self.calls = 0
+        self.waits = 0    # calls that had to wait for another thread's call to finish
+        self.owner = None    # threading.get_ident() of the only thread that has called the device, or SHARED
+        self.active = False    # True while the owner is in a call made without the lock
+        self._claim_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def claim(self):
+        """ Called by a thread that is not the owner, before its call. The first thread becomes the
+        owner. Any other thread makes the device shared, then waits for a call the owner made
+        without the lock to finish. (The owner sets active before it checks that the device is not
+        shared, and this thread sets SHARED before it checks active, so one of them sees the other.)
+        It holds the lock while it waits, so the threads that see SHARED wait too.
+
+        Returns:
+            True if this thread is now the owner
+        """
+
+        with self._claim_lock:
+            if self.owner is None:
+                self.owner = threading.get_ident()
+                return True
+            with self.lock:
+                self.owner = SHARED
+                while self.active:
+                    time.sleep(0.0001)
+        return False
+
+    def call(self, function, *args):
+        """ Run function(*args) holding the device's lock
+        """
+
+        if self.owner is not SHARED:
+            # the whole function holds the lock, so the owner's calls must take it too
+            self.claim()
+            self.owner = SHARED
+        if not self.lock.acquire(blocking=False):
+            self.lock.acquire()
+            self.waits += 1
+        try:
+            self.calls += 1
+            return function(*args)
+        finally:
+            self.lock.release()
+
+    def submit(self, function, *args):
+        """ Queue function(*args) to run on the executor's thread, after the functions queued
+        before it. The whole function holds the device's lock, so a sequence of NGIO calls is not
+        interleaved with calls from other threads.
+
+        Returns:
+            future (concurrent.futures.Future): future.result() waits for the function's result
+        """
+
+        future = Future()
+        with self._thread_lock:
+            if self._thread is None:
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(target=config.in_current_session(self._run),
+                                                name="labquest-device-io", daemon=True)
+                self._thread.start()
+            self._queue.put((future, function, args))
+        return future
+
+    def shutdown(self):
+        """ Run the functions still queued, then stop the executor's thread
+        """
+
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def as_dict(self):
+        return {"calls":self.calls, "waits":self.waits}
+
+    def _run(self):
+        work = self._queue
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            future, function, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.call(function, *args))
+            except BaseException as error:
+                future.set_exception(error)
+
+
+class SerializedFunction:
+    """ Wrap an NGIO device function prototype so that each call runs through the executor of its
+    device handle (the first argument). The argtypes and restype the ngio_* modules set before each
+    call are kept here (a plain attribute is quicker to set than one passed through) and given to
+    the wrapped prototype when it is called, so the modules use it unchanged.
+    """
+
+    def __init__(self, function, executors):
+        self._function = function
+        self._executors = executors
+        self.argtypes = getattr(function, 'argtypes', None)
+        self.restype = getattr(function, 'restype', None)
+
+    def __call__(self, hDevice, *args):
+        executor = self._executors.get(hDevice)
+        if executor is None:
+            executor = self._executors.setdefault(hDevice, DeviceExecutor(hDevice))
+        owner = executor.owner
+        # the only thread to call this device so far: no lock
+        if owner is not SHARED and (owner == threading.get_ident() or executor.claim()):
+            executor.active = True
+            try:
+                if executor.owner is not SHARED:
+                    executor.calls += 1
+                    function = self._function
+                    function.argtypes = self.argtypes
+                    function.restype = self.restype
+                    return function(hDevice, *args)
+            finally:
+                executor.active = False
+        # DeviceExecutor.call(), inline: this runs for every NGIO call
+        lock = executor.lock
+        if not lock.acquire(blocking=False):
+            lock.acquire()
+            executor.waits += 1
+        try:
+            executor.calls += 1
+            function = self._function
+            function.argtypes = self.argtypes
+            function.restype = self.restype
+            return function(hDevice, *args)
+        finally:
+            lock.release()
+
+    def __getattr__(self, name):
+        return getattr(self._function, name)
+
+
+class DeviceIOLibrary:
+    """ Stand-in for config.dll that hands out SerializedFunction wrappers of the NGIO_Device_*
+    functions (the functions that take a device handle). The other functions are the library's own.
+    """
+
+    def __init__(self, dll, executors):
+        self._dll = dll
+        self._executors = executors
+
+    def __getattr__(self, name):
+        # only called the first time: the function is then an attribute of the instance
+        function = getattr(self._dll, name)
+        if name.startswith("NGIO_Device_") and name != "NGIO_Device_Open":
+            function = SerializedFunction(function, self._executors)
+        setattr(self, name, function)
+        return function
+
+    def __repr__(self):
+        return "<serialized " + repr(self._dll) + ">"
+
+
+def serialize_device_io(dll):
+    """ Return the library wrapped so that the calls to each device handle go through its executor
+    (config.device_executors). load_ngio_library_get_version() does this when the library is loaded.
+    """
+
+    return DeviceIOLibrary(dll, config.device_executors)
+
+def get_executor(hDevice):
+    """ The DeviceExecutor of a device handle, created the first time it is used
+    """
+
+    executor = config.device_executors.get(hDevice)
+    if executor is None:
+        executor = config.device_executors.setdefault(hDevice, DeviceExecutor(hDevice))
+    return executor
+
+def call_each_device(function, *args):
+    """ Call function(hDevice, *args) for every device: in parallel on the device executors when
+    there is more than one device, otherwise on this thread.
+
+    Returns:
+        results (list): the result for each device, in the order of config.hDevice
+    """
+
+    if len(config.hDevice) < 2:
+        return [function(hDevice, *args) for hDevice in config.hDevice]
+    futures = [get_executor(hDevice).submit(function, hDevice, *args) for hDevice in config.hDevice]
+    return [future.result() for future in futures]
+
+def shutdown_executors():
+    """ Stop the executors' threads (close() does this)
+    """
+
+    for executor in list(config.device_executors.values()):
+        executor.shutdown()
+    config.device_executors.clear()
+
+def reset_device_io():
+    for executor in config.device_executors.values():
+        executor.calls = 0
+        executor.waits = 0
+
+def get_device_io():
+    """ The calls and waits of each device's executor, keyed "dev0", "dev1", ...
+    """
+
+    results = {}
+    for device_index, hDevice in enumerate(config.hDevice):
+        executor = config.device_executors.get(hDevice)
+        results["dev" + str(device_index)] = executor.as_dict() if executor else {"calls":0, "waits":0}
+    return results
@@ -1,14 +1,36 @@
+import os
+
 from labquest import config
 from labquest import ngio_library_functions as ngio_lib
+from labquest import labquest_device_io_functions as device_io
 
 
-def load_ngio_library_get_version():
+def load_ngio_library_get_version(backend=None):
     """ Find and load the NGIO library and give it the variable name, "dll"
+
+    The backend is the NGIO shared library unless another one is selected with the backend 
+    argument or the LABQUEST_BACKEND environment variable: 'simulated' uses a SimulatedNGIO 
+    with its default settings, and a library object (such as a configured SimulatedNGIO) is 
+    used as it is. A function that returns the library object (such as 
+    functools.partial(SimulatedNGIO, num_devices=4)) is called.
     """
     
+    if backend is None:
+        backend = os.environ.get('LABQUEST_BACKEND')
     
     # save the dll object to the config file
-    config.dll = ngio_lib.load_library() 
+    if backend in (None, '', 'ngio'):
+        config.dll = ngio_lib.load_library() 
+    elif backend == 'simulated':
+        from labquest import ngio_simulated_library as ngio_sim
+        config.dll = ngio_sim.SimulatedNGIO()
+    elif callable(backend) and not hasattr(backend, 'NGIO_Init'):
+        config.dll = backend()
+    else:
+        config.dll = backend
+    config.logger.debug("NGIO backend: %s", config.dll)
+    # the calls to each device handle are serialized, so separate threads can use the devices
+    config.dll = device_io.serialize_device_io(config.dll)
     
     # save the Library Handle (hLib) to the config file
     config.hLib = ngio_lib.ngio_init()
@@ -0,0 +1,191 @@
+from time import perf_counter
+
+from labquest import config
+
+
+# Latency histogram buckets. Bucket 0 holds calls faster than 1 microsecond, bucket k holds
+# calls that took 2**(k-1) to 2**k microseconds. The last bucket holds everything slower.
+NUM_HISTOGRAM_BUCKETS = 24
+
+
+class CallStats:
+    """ Call counter and latency histogram for a single NGIO function.
+    """
+
+    __slots__ = ('calls', 'total_time', 'min_time', 'max_time', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.min_time = None
+        self.max_time = 0.0
+        self.histogram = [0]*NUM_HISTOGRAM_BUCKETS
+
+    def add(self, elapsed):
+        """ Record one call that took 'elapsed' seconds
+        """
+
+        self.calls += 1
+        self.total_time += elapsed
+        if self.min_time is None or elapsed < self.min_time:
+            self.min_time = elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        # int.bit_length() of the latency in microseconds gives the log2 bucket
+        bucket = min(int(elapsed*1000000).bit_length(), NUM_HISTOGRAM_BUCKETS - 1)
+        self.histogram[bucket] += 1
+
+    def as_dict(self):
+        return {"calls":self.calls, "total_time":self.total_time,
+                "mean_time":self.total_time/self.calls if self.calls else 0.0,
+                "min_time":self.min_time, "max_time":self.max_time,
+                "histogram_us":histogram_as_dict(self.histogram)}
+
+
+class PollStats:
+    """ Polling iterations and NGIO buffer depth for a single (device, channel).
+    """
+
+    __slots__ = ('polls', 'iterations', 'max_iterations', 'timeouts', 'last_depth', 'max_depth')
+
+    def __init__(self):
+        self.polls = 0
+        self.iterations = 0
+        self.max_iterations = 0
+        self.timeouts = 0
+        self.last_depth = 0
+        self.max_depth = 0
+
+    def add(self, iterations, depth):
+        """ Record one wait for data that took 'iterations' polls and found 'depth' measurements
+        """
+
+        self.polls += 1
+        self.iterations += iterations
+        if iterations > self.max_iterations:
+            self.max_iterations = iterations
+        if depth == 0:
+            self.timeouts += 1
+        self.last_depth = depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def as_dict(self):
+        return {"polls":self.polls, "iterations":self.iterations, "max_iterations":self.max_iterations,
+                "timeouts":self.timeouts, "last_depth":self.last_depth, "max_depth":self.max_depth}
+
+
+class Instrumentation:
+    """ All of the counters collected while instrumentation is enabled.
+    """
+
+    def __init__(self):
+        self.calls = {}    # {"NGIO_Device_ReadRawMeasurements":CallStats, ...}
+        self.polls = {}    # {(device_index, channel):PollStats, ...}
+
+    def record_call(self, name, elapsed):
+        call_stats = self.calls.get(name)
+        if call_stats is None:
+            call_stats = self.calls[name] = CallStats()
+        call_stats.add(elapsed)
+
+    def record_poll(self, device_index, channel, iterations, depth):
+        poll_stats = self.polls.get((device_index, channel))
+        if poll_stats is None:
+            poll_stats = self.polls[(device_index, channel)] = PollStats()
+        poll_stats.add(iterations, depth)
+
+    def as_dict(self):
+        return {"ngio_calls":{name:call_stats.as_dict() for name, call_stats in self.calls.items()},
+                "polling":{"dev" + str(device_index) + "_ch" + str(channel):poll_stats.as_dict()
+                            for (device_index, channel), poll_stats in self.polls.items()}}
+
+
+class InstrumentedFunction:
+    """ Wrap an NGIO function prototype so that every call is counted and timed. The argtypes and
+    restype are passed through to the wrapped prototype, so the ngio_* modules use it unchanged.
+    """
+
+    def __init__(self, name, function, instrumentation):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_function', function)
+        object.__setattr__(self, '_instrumentation', instrumentation)
+
+    def __call__(self, *args):
+        start_time = perf_counter()
+        try:
+            return self._function(*args)
+        finally:
+            self._instrumentation.record_call(self._name, perf_counter() - start_time)
+
+    def __getattr__(self, name):
+        return getattr(self._function, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._function, name, value)
+
+
+class InstrumentedLibrary:
+    """ Stand-in for config.dll that hands out InstrumentedFunction wrappers of the NGIO functions.
+    """
+
+    def __init__(self, dll, instrumentation):
+        self._dll = dll
+        self._instrumentation = instrumentation
+        self._functions = {}
+
+    def __getattr__(self, name):
+        function = self._functions.get(name)
+        if function is None:
+            function = InstrumentedFunction(name, getattr(self._dll, name), self._instrumentation)
+            self._functions[name] = function
+        return function
+
+
+def enable_instrumentation():
+    """ Start counting NGIO calls, latencies and polling. When instrumentation is disabled,
+    config.dll is not wrapped for timing and config.stats is None, so there is no overhead.
+    """
+
+    if config.stats is None:
+        config.stats = Instrumentation()
+    if config.dll is not None and not isinstance(config.dll, InstrumentedLibrary):
+        config.dll = InstrumentedLibrary(config.dll, config.stats)
+
+def disable_instrumentation():
+    """ Stop counting and restore the NGIO library
+    """
+
+    if isinstance(config.dll, InstrumentedLibrary):
+        config.dll = config.dll._dll
+    config.stats = None
+
+def reset_instrumentation():
+    """ Zero all of the counters
+    """
+
+    if config.stats is not None:
+        config.stats.calls.clear()
+        config.stats.polls.clear()
+
+def get_instrumentation():
+    """ Return the counters as a dictionary, or None if instrumentation is disabled
+    """
+
+    if config.stats is None:
+        return None
+    return config.stats.as_dict()
+
+def histogram_as_dict(histogram):
+    """ Label the non-empty histogram buckets with their upper bound in microseconds
+    """
+
+    histogram_dict = {}
+    for bucket, count in enumerate(histogram):
+        if count:
+            if bucket == NUM_HISTOGRAM_BUCKETS - 1:
+                label = ">" + str(2**(bucket - 1))
+            else:
+                label = "<" + str(2**bucket)
+            histogram_dict[label] = count
+    return histogram_dict
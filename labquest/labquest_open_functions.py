@@ -4,8 +4,9 @@ from labquest import config
 from labquest import ngio_open_functions as ngio_open
 from labquest import ngio_send_cmd_get_resp as ngio_send
 
-def open_labquest_devices():
-    """ Find connected LQ devices and open the handle (hDevice)
+def open_labquest_devices(device_number=None):
+    """ Find connected LQ devices and open the handle (hDevice). With device_number, only that
+    device (0 is the first found) is opened, for a shard worker process that owns one device.
     """
     
     # Determine what LabQuest device(s) are connected
@@ -16,7 +17,7 @@ def open_labquest_devices():
         config.logger.info("Found device type: " + str(device_type_name))
     
     # Get the device handle(s) and save as 'hDevice' in the config file
-    config.hDevice, number_found_devices = get_device_handle_and_num_devices()
+    config.hDevice, number_found_devices = get_device_handle_and_num_devices(device_number)
     if not config.hDevice:
         config.logger.info("No device handle (hDevice)")
         return "no_device"
@@ -58,14 +59,14 @@ def search_for_a_labquest_device():
 
     return device_type, device_type_name 
 
-def get_device_handle_and_num_devices():
+def get_device_handle_and_num_devices(device_number=None):
     """ Determine how many of the device types are connected. For each of these connected
-    devices, get a device handle (hDevice).
+    devices, or only device_number, get a device handle (hDevice).
     """
 
     config.logger.info("attempting to open device...")
     device_handle_list = []
-    index = 0
+    index = device_number or 0
     open_a_device = True
     while open_a_device:    
         # Get the Device List Handle (hDeviceList) and the number of devices connected.
@@ -86,10 +87,22 @@ def get_device_handle_and_num_devices():
         
         index += 1
         # Determine if another device is available to be opened
-        open_a_device = number_of_devices  > index  
+        open_a_device = number_of_devices  > index and device_number is None
     
     return device_handle_list, number_of_devices
 
+def count_labquest_devices():
+    """ Find the connected LQ devices without opening them. Returns the device_type and the
+    number of devices of that type.
+    """
+
+    config.device_type, device_type_name = search_for_a_labquest_device()
+    if not config.device_type:
+        return 0, 0
+    hDeviceList, number_of_devices = ngio_open.open_device_list_snapshot()
+    ngio_open.close_device_list_snapshot(hDeviceList)
+    return config.device_type, number_of_devices
+
 def set_lq_mini_led_green(hDevice):
     """ The LQ Mini has an LED. Turn this green to signify a proper connection
     """
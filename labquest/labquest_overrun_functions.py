@@ -0,0 +1,173 @@
+from time import perf_counter
+
+import numpy as np
+
+from labquest import config
+from labquest import labquest_start_functions as start
+
+
+# A step between time stamps more than (1 + GAP_TOLERANCE) sample periods is a gap
+GAP_TOLERANCE = 0.5
+
+
+class ChannelTiming:
+    """ Time stamp checks of one (device, channel): samples missing from the hardware sequence
+    (lost when the NGIO measurement buffer overflowed), repeated time stamps, how many samples
+    were waiting when the channel was read, and the latency from sample time to delivery.
+    """
+
+    __slots__ = ('packets', 'samples', 'dropped', 'gaps', 'duplicates', 'last_backlog', 'max_backlog',
+                 'last_latency', 'max_latency', 'total_latency', 'latencies', 'last_time_stamp')
+
+    def __init__(self):
+        self.packets = 0
+        self.samples = 0
+        self.dropped = 0    # samples missing between time stamps
+        self.gaps = 0    # number of places where samples were missing
+        self.duplicates = 0    # time stamps equal to (or earlier than) the one before
+        self.last_backlog = 0
+        self.max_backlog = 0
+        self.last_latency = None
+        self.max_latency = None
+        self.total_latency = 0.0
+        self.latencies = 0
+        self.last_time_stamp = None
+
+    def check(self, time_stamps, period, backlog, latency):
+        """ Check a packet of time stamps (int64, microseconds) against the period (microseconds).
+        The first time stamp is compared with the last one of the previous packet.
+
+        Returns:
+            (dropped, duplicates) in this packet
+        """
+
+        count = time_stamps.size
+        if self.last_time_stamp is None:
+            steps = np.diff(time_stamps)
+        else:
+            steps = np.diff(time_stamps, prepend=self.last_time_stamp)
+        duplicates = int(np.count_nonzero(steps <= 0))
+        late = steps[steps > period*(1 + GAP_TOLERANCE)]
+        dropped = int(np.rint(late/period).sum()) - late.size
+
+        self.packets += 1
+        self.samples += count
+        self.dropped += dropped
+        self.gaps += late.size
+        self.duplicates += duplicates
+        self.last_backlog = backlog
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+        self.last_time_stamp = int(time_stamps[-1])
+        if latency is not None:
+            self.last_latency = latency
+            if self.max_latency is None or latency > self.max_latency:
+                self.max_latency = latency
+            self.total_latency += latency
+            self.latencies += 1
+        return dropped, duplicates
+
+    def as_dict(self, period):
+        return {"packets":self.packets, "samples":self.samples, "dropped":self.dropped, "gaps":self.gaps,
+                "duplicates":self.duplicates, "last_backlog":self.last_backlog, "max_backlog":self.max_backlog,
+                "max_backlog_time":self.max_backlog*period if period else None,
+                "latency":self.last_latency, "max_latency":self.max_latency,
+                "mean_latency":self.total_latency/self.latencies if self.latencies else None}
+
+
+class OverrunMonitor:
+    """ The ChannelTiming of every channel read while overrun detection is enabled.
+    """
+
+    def __init__(self, warn=False):
+        self.warn = warn
+        self.channels = {}    # {(device_index, channel):ChannelTiming}
+
+    def reset(self):
+        self.channels.clear()
+
+
+def check_packet(device_index, channel, values, time_stamps, num_of_measurements):
+    """ Check the hardware time stamps of a packet just read from the NGIO measurement buffer.
+    The values and time stamps may be the ctypes arrays from ngio_read.read_raw_measurements()
+    or numpy arrays. Called from the read functions when config.overruns is not None.
+    """
+
+    monitor = config.overruns
+    if num_of_measurements <= 0 or not config.sample_period:
+        return
+    time_stamps = _as_array(time_stamps, num_of_measurements)
+    if channel in (5, 6):
+        sensor = config.device_dig_channel_dictionary[device_index].get(config.CHANNEL_NAMES[channel])
+        if sensor == 'photogate_timing':
+            return    # photogate edges are not periodic
+        if sensor == 'motion':
+            # the pings are periodic, each echo follows its ping
+            time_stamps = time_stamps[_as_array(values, num_of_measurements) == 0]
+            if not time_stamps.size:
+                return
+    time_stamps = time_stamps.astype(np.int64, copy=False)
+
+    latency = None
+    if device_index < len(config.start_times):
+        latency = perf_counter() - config.start_times[device_index] - int(time_stamps[-1])/1000000
+
+    timing = monitor.channels.get((device_index, channel))
+    if timing is None:
+        timing = monitor.channels[(device_index, channel)] = ChannelTiming()
+    period = start.channel_period(device_index, channel)*1000000
+    dropped, duplicates = timing.check(time_stamps, period, num_of_measurements, latency)
+
+    if monitor.warn and (dropped or duplicates):
+        config.logger.warning("dev%s ch%s: %s samples dropped, %s duplicate time stamps (%s waiting when read)",
+                              device_index, channel, dropped, duplicates, num_of_measurements)
+
+def enable_overrun_detection(warn=False):
+    """ Start checking the time stamps of every packet read. When disabled, config.overruns is
+    None and the read functions do not check anything.
+    """
+
+    if config.overruns is None:
+        config.overruns = OverrunMonitor(warn)
+    config.overruns.warn = warn
+
+def disable_overrun_detection():
+    config.overruns = None
+
+def reset_overruns():
+    """ Start the counts again (start() does this for each run)
+    """
+
+    if config.overruns is not None:
+        config.overruns.reset()
+
+def get_overruns(device_index=None, ch=None):
+    """ The counts of one channel, or of every channel checked (keyed "dev0_ch1", ...). Times
+    (max_backlog_time and the latencies) are in seconds. The latency is the host time when the
+    packet was read minus the sample time of its last sample, measured from the Start
+    Measurements command, so it is an estimate that includes any device clock drift.
+
+    Returns:
+        overruns (dict): {"packets", "samples", "dropped", "gaps", "duplicates", "last_backlog",
+        "max_backlog", "max_backlog_time", "latency", "max_latency", "mean_latency"}. None if
+        overrun detection is not enabled.
+    """
+
+    if config.overruns is None:
+        return None
+    if ch is not None:
+        channel = config.CHANNEL_NUMBERS.get(ch)
+        if channel is None:
+            config.logger.info("get_overruns() - unknown channel: " + str(ch))
+            return None
+        timing = config.overruns.channels.get((device_index or 0, channel))
+        return (timing or ChannelTiming()).as_dict(start.channel_period(device_index or 0, channel))
+    return {"dev" + str(device) + "_ch" + str(channel):timing.as_dict(start.channel_period(device, channel))
+            for (device, channel), timing in config.overruns.channels.items()
+            if device_index is None or device == device_index}
+
+def _as_array(array, count):
+    # a numpy view of a ctypes array (no copy)
+    if not isinstance(array, np.ndarray):
+        array = np.ctypeslib.as_array(array)
+    return array[:count]
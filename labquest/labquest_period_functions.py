@@ -0,0 +1,205 @@
+import time
+
+from labquest import config
+from labquest import ngio_sensor_functions as ngio_sensor
+from labquest import labquest_overrun_functions as overrun
+from labquest import labquest_start_functions as start
+from labquest import labquest_subscriber_functions as subscriber
+
+
+# Upper bound of the sample rate of any device (measurements/s, shared by all of the enabled
+# channels). It is not a per-device limit: only measure_throughput() finds what a device, the
+# link and this host actually sustain.
+MAX_RATE = 100000
+
+# The motion detector pings at most 50 times a second (each echo must return before the next ping)
+MOTION_MIN_PERIOD = 0.02
+# Typical period of the digital sensors (they have no DDS record)
+DIGITAL_TYP_PERIODS = {'motion':0.05, 'rotary_motion':0.02, 'rotary_motion_high_res':0.02, 'photogate_count':0.1}
+# measure_throughput(): a period is sustained if the last samples were read within this many seconds
+MAX_LATENCY = 0.1
+
+
+def measurements_per_period(device_index):
+    """ Number of measurements the device adds to its NGIO buffers each sample period: one for
+    each analog channel, rotary motion and photogate count, two (ping and echo) for motion.
+    """
+
+    count = 0
+    for device_index_, channel, key_value in subscriber.acquisition_channels():
+        if device_index_ == device_index:
+            count += 2 if key_value == 'motion' else 1
+    return count
+
+def device_min_period(device_index):
+    """ The shortest sample period (s) the device can sustain with its enabled channels: MAX_RATE
+    (or the rate measured by measure_throughput(), if lower) shared by the channels, and no
+    faster than the motion detector allows.
+    """
+
+    num_measurements = measurements_per_period(device_index)
+    if not num_measurements:
+        return 0.0
+    min_period = num_measurements/max_rate(device_index)
+    if any(key_value == 'motion' for device_index_, channel, key_value in subscriber.acquisition_channels()
+           if device_index_ == device_index):
+        min_period = max(min_period, MOTION_MIN_PERIOD)
+    return min_period
+
+def max_rate(device_index):
+    """ MAX_RATE (measurements/s), or the rate measured by measure_throughput() if that is lower
+    """
+
+    rate = MAX_RATE
+    sustained_rate = config.sustained_rates.get(device_index)
+    if sustained_rate is not None:
+        rate = min(rate, sustained_rate)
+    return rate
+
+def typical_period():
+    """ The shortest typical sample period (s) of the enabled sensors, from the DDS record of
+    each analog sensor. None if no sensor has one.
+    """
+
+    periods = []
+    for device_index, channel, key_value in subscriber.acquisition_channels():
+        if key_value is None:
+            period = ngio_sensor.ddsmem_get_typ_sample_period(config.hDevice[device_index], channel)
+        else:
+            period = DIGITAL_TYP_PERIODS.get(key_value)
+        if period and period > 0:
+            periods.append(period)
+    return min(periods) if periods else None
+
+def sustainable_period(oversample=1):
+    """ The fastest sustainable period (s) of all of the devices, which share one period. With
+    oversampling the hardware samples oversample times faster, so the effective period is longer.
+    """
+
+    min_period = 0.0
+    for device_index in range(len(config.hDevice)):
+        min_period = max(min_period, device_min_period(device_index))
+    return min_period*oversample
+
+def plan_period(period=None, oversample=1):
+    """ Check a sample period against the devices and enabled channels. Until measure_throughput()
+    has run, the limits come from MAX_RATE (and the motion detector) only, which no device type is
+    known to sustain on every host, so "min_period" and "feasible" are optimistic. Only
+    measure_throughput() sets a real limit for the devices in use.
+
+    Args:
+        period (float): the period asked for (ms), or None to only get the limits
+
+        oversample (int): hardware samples per sample, as in start(oversample=N)
+
+    Returns:
+        plan (dict): {"period", "min_period" (fastest sustainable), "typical_period" (shortest
+        typical period of the sensors), "suggested_period", "feasible", "devices":[{"device",
+        "measurements_per_period", "min_period"}]}. Periods are in ms, as in start(), and are
+        the effective period (the hardware samples oversample times faster).
+    """
+
+    devices = [{"device":device_index, "measurements_per_period":measurements_per_period(device_index),
+                "min_period":_ms(device_min_period(device_index))} for device_index in range(len(config.hDevice))]
+    min_period = sustainable_period(oversample)
+    typ_period = typical_period()
+    suggested_period = max(typ_period or min_period, min_period)
+    return {"period":period, "min_period":_ms(min_period),
+            "typical_period":_ms(typ_period) if typ_period else None,
+            "suggested_period":_ms(suggested_period),
+            "feasible":period is None or period >= _ms(min_period),
+            "devices":devices}
+
+def auto_period(oversample=1):
+    """ The period (ms) start(period='auto') uses: the shortest typical period of the enabled
+    sensors, or the fastest sustainable period if that is longer.
+    """
+
+    plan = plan_period(oversample=oversample)
+    config.logger.info("start() - period 'auto': " + str(plan["suggested_period"]) + " ms (fastest sustainable " +
+                       str(plan["min_period"]) + " ms)")
+    return plan["suggested_period"]
+
+def check_period():
+    """ Log a warning (with the fastest sustainable period) if the periods start() configured are
+    too short for the devices and enabled channels. Each channel counts at its own hardware period.
+    """
+
+    feasible = True
+    for device_index in range(len(config.hDevice)):
+        rate = 0.0
+        for device_index_, channel, key_value in subscriber.acquisition_channels():
+            if device_index_ != device_index:
+                continue
+            period = start.channel_period(device_index, channel)
+            rate += (2 if key_value == 'motion' else 1)/period
+            if key_value == 'motion' and period < MOTION_MIN_PERIOD:
+                feasible = False
+        if rate > max_rate(device_index)*1.000001:
+            feasible = False
+    if not feasible:
+        config.logger.warning("start() - the period is faster than the devices can sustain with these channels, " +
+                              "samples may be lost. Fastest sustainable period: " +
+                              str(_ms(sustainable_period(config.oversample))) + " ms")
+    return feasible
+
+def measure_throughput(lq, duration=1.0, max_steps=8):
+    """ Find the fastest period the devices, the link and this computer sustain with the enabled
+    channels. Starting at the fastest period MAX_RATE allows, each step collects for duration seconds,
+    reading every channel as fast as it can, and the period is doubled until no samples are lost
+    and the reads keep up (checked with the hardware time stamps). The rate found is used by
+    plan_period() and start() from then on.
+
+    Any recorder, subscribers and other packet sinks are set aside while measuring.
+
+    Returns:
+        throughput (dict): {"period" (ms, fastest sustained), "rates" ({device:measurements/s}),
+        "steps":[{"period", "samples", "dropped", "max_backlog", "latency"}]}. None if no period
+        was sustained.
+    """
+
+    packet_sinks, config.packet_sinks = config.packet_sinks, []
+    subscriptions, config.subscriptions = config.subscriptions, []
+    overruns = config.overruns
+    overrun.enable_overrun_detection()
+    config.sustained_rates = {}
+
+    steps = []
+    sustained = None
+    period = plan_period()["min_period"]
+    try:
+        for step in range(max_steps):
+            lq.start(period=period)
+            channels = subscriber.acquisition_channels()
+            end_time = time.perf_counter() + duration
+            while time.perf_counter() < end_time:
+                for device_index, channel, key_value in channels:
+                    subscriber.drain_channel(device_index, channel, key_value)
+            lq.stop()
+            counts = overrun.get_overruns().values()
+            result = {"period":period, "samples":sum(count["samples"] for count in counts),
+                      "dropped":sum(count["dropped"] for count in counts),
+                      "max_backlog":max((count["max_backlog"] for count in counts), default=0),
+                      "latency":max((count["latency"] or 0.0 for count in counts), default=0.0)}
+            steps.append(result)
+            config.logger.info("measure_throughput() - " + str(result))
+            # sustained: nothing was lost, and the reads were not falling behind at the end
+            if result["samples"] and not result["dropped"] and result["latency"] <= MAX_LATENCY:
+                sustained = period
+                break
+            period *= 2
+    finally:
+        config.packet_sinks = packet_sinks
+        config.subscriptions = subscriptions
+        config.overruns = overruns
+
+    if sustained is None:
+        return None
+    rates = {device_index:measurements_per_period(device_index)/(sustained/1000)
+             for device_index in range(len(config.hDevice))}
+    config.sustained_rates = rates
+    return {"period":sustained, "rates":rates, "steps":steps}
+
+def _ms(period):
+    # seconds to milliseconds, to the microsecond (the typical periods are stored as floats)
+    return round(period*1000, 3)
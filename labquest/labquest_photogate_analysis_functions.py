@@ -0,0 +1,143 @@
+import numpy as np
+
+
+# Structured array layouts returned by the analysis functions. All times are in seconds.
+GATE_DTYPE = np.dtype([('time', np.float64), ('gate_time', np.float64), ('speed', np.float64)])
+PULSE_DTYPE = np.dtype([('time', np.float64), ('pulse_time', np.float64), ('speed', np.float64)])
+PENDULUM_DTYPE = np.dtype([('time', np.float64), ('period', np.float64)])
+COUNT_RATE_DTYPE = np.dtype([('time', np.float64), ('count', np.int64), ('rate', np.float64)])
+
+
+def edge_times(time_stamps):
+    """ Convert the raw photogate time stamps (microseconds, as returned by read_photogate_timing)
+    into an array of edge times in seconds. As in convert_to_semi_period(), the first time stamp
+    is not used, so the returned array starts with a blocking edge and then alternates
+    blocked, unblocked, blocked, unblocked, etc..
+    """
+
+    time_stamps = np.asarray(time_stamps, dtype=np.int64)
+    if time_stamps.size < 2:
+        return np.empty(0, dtype=np.float64)
+
+    return time_stamps[1:] / 1000000
+
+def block_times(time_stamps):
+    """ Return the times (seconds) of the blocking edges only.
+    """
+
+    return edge_times(time_stamps)[0::2]
+
+def gate_mode(time_stamps, flag_width=None):
+    """ Gate timing. For each time the gate is blocked, return the time of the block (relative to
+    the first block), how long the gate stayed blocked, and the speed of a flag of known width
+    passing through the gate.
+
+    Args:
+        time_stamps: raw photogate time stamps (microseconds)
+
+        flag_width (float): width of the flag (m). If None, the speed field is NaN.
+
+    Returns:
+        structured array with the fields 'time', 'gate_time' and 'speed'
+    """
+
+    edges = edge_times(time_stamps)
+    # only complete blocked/unblocked pairs have a gate time
+    num_pairs = edges.size // 2
+    blocked = edges[0:2*num_pairs:2]
+    unblocked = edges[1:2*num_pairs:2]
+
+    result = np.empty(num_pairs, dtype=GATE_DTYPE)
+    if num_pairs == 0:
+        return result
+    result['time'] = blocked - blocked[0]
+    result['gate_time'] = unblocked - blocked
+    result['speed'] = _speed(flag_width, result['gate_time'])
+
+    return result
+
+def pulse_mode(time_stamps, distance=None):
+    """ Pulse timing. Return the time between successive blocks of the gate, and the speed of
+    an object that travels a known distance between those blocks.
+
+    Args:
+        time_stamps: raw photogate time stamps (microseconds)
+
+        distance (float): distance (m) travelled between blocks. If None, the speed field is NaN.
+
+    Returns:
+        structured array with the fields 'time', 'pulse_time' and 'speed'
+    """
+
+    blocks = block_times(time_stamps)
+    num_pulses = max(blocks.size - 1, 0)
+
+    result = np.empty(num_pulses, dtype=PULSE_DTYPE)
+    if num_pulses == 0:
+        return result
+    result['time'] = blocks[:-1] - blocks[0]
+    result['pulse_time'] = np.diff(blocks)
+    result['speed'] = _speed(distance, result['pulse_time'])
+
+    return result
+
+def pendulum_mode(time_stamps):
+    """ Pendulum timing. A pendulum blocks the gate twice per swing, so the period is the time
+    from one block to the block after next.
+
+    Args:
+        time_stamps: raw photogate time stamps (microseconds)
+
+    Returns:
+        structured array with the fields 'time' and 'period'
+    """
+
+    blocks = block_times(time_stamps)
+    num_periods = max(blocks.size - 2, 0)
+
+    result = np.empty(num_periods, dtype=PENDULUM_DTYPE)
+    if num_periods == 0:
+        return result
+    result['time'] = blocks[:-2] - blocks[0]
+    result['period'] = blocks[2:] - blocks[:-2]
+
+    return result
+
+def count_rate(time_stamps, bin_width=1.0):
+    """ Count the number of gate blocks in each bin of bin_width seconds.
+
+    Args:
+        time_stamps: raw photogate time stamps (microseconds)
+
+        bin_width (float): width of each counting interval (seconds)
+
+    Returns:
+        structured array with the fields 'time' (start of the bin), 'count' and 'rate' (counts/s)
+    """
+
+    blocks = block_times(time_stamps)
+    if blocks.size == 0:
+        return np.empty(0, dtype=COUNT_RATE_DTYPE)
+
+    relative = blocks - blocks[0]
+    bin_index = (relative // bin_width).astype(np.int64)
+    counts = np.bincount(bin_index)
+
+    result = np.empty(counts.size, dtype=COUNT_RATE_DTYPE)
+    result['time'] = np.arange(counts.size) * bin_width
+    result['count'] = counts
+    result['rate'] = counts / bin_width
+
+    return result
+
+def _speed(distance, times):
+    """ distance/time, or NaN if there is no distance or the time is zero
+    """
+
+    if distance is None:
+        return np.full(times.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = distance / times
+    speed[times == 0] = np.nan
+
+    return speed
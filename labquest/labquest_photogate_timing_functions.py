@@ -10,10 +10,20 @@ def get_photogate_timing(ch, samples, timeout, device_index):
 
     timing_values = []
 
-    if ch == 'dig1':
-            channel = 5
-    if ch == 'dig2':
-            channel = 6
+    timing = get_photogate_time_stamps(ch, samples, timeout, device_index)
+    if timing:
+        timing_values = convert_to_semi_period(timing)
+    
+    return timing_values
+
+def get_photogate_time_stamps(ch, samples, timeout, device_index):
+    """ When the number of photogate samples asked for are available, return the raw
+    time stamps (microseconds) of each photogate edge.
+    """
+
+    timing = []
+
+    channel = config.CHANNEL_NUMBERS[ch]
     # use the timeout as the sample_period in this instance
     sample_period = timeout
     num_measurements_needed = samples
@@ -24,11 +34,9 @@ def get_photogate_timing(ch, samples, timeout, device_index):
     if num_measurements_available == 0:
         config.logger.debug("Timed Out - no photogate measurements available to read")
     else:
-        #count, timing = read.read_photogate_data(num_measurements_available)
         timing = read_photogate_timing(num_measurements_available, device_index, channel)
-        timing_values = convert_to_semi_period(timing)
     
-    return timing_values
+    return timing
 
 def read_photogate_timing(num_measurements_available, device_index, channel):
     """ For each active channel, get the timestamp measurements.
@@ -0,0 +1,210 @@
+import json
+
+import numpy as np
+
+from labquest import config
+from labquest import ngio_read_functions as ngio_read
+from labquest import ngio_sensor_functions as ngio_sensor
+from labquest import labquest_calibration_functions as calibration
+from labquest import labquest_overrun_functions as overrun
+
+
+# raw counts from the two points are used to find the straight line of ConvertToVoltage()
+VOLTAGE_REFERENCE_COUNTS = (0, 4000)
+
+
+class RawCapture:
+    """ Raw A/D counts and hardware time stamps (microseconds) from one analog channel, along with
+    a snapshot of the channel's calibration. Storing a packet only copies the counts and time stamps;
+    the calibrated values are calculated, for all samples at once, the first time they are used.
+    Iterating, indexing or len() of a RawCapture uses the calibrated values, so it can be used
+    like the list returned by read_multi_pt().
+
+    Args:
+        calibration (dict): calibration snapshot, as returned by get_calibration_snapshot()
+    """
+
+    def __init__(self, calibration, raw=None, time_stamps=None):
+        self.calibration = dict(calibration)
+        self._raw_chunks = []
+        self._time_chunks = []
+        self._raw = None
+        self._time_stamps = None
+        self._values = None
+        if raw is not None:
+            self.append(raw, time_stamps)
+
+    def append(self, raw, time_stamps):
+        """ Add a packet of raw counts (int32) and time stamps (int64)
+        """
+
+        self._raw_chunks.append(np.asarray(raw, dtype=np.int32))
+        self._time_chunks.append(np.asarray(time_stamps, dtype=np.int64))
+        self._raw = None
+        self._time_stamps = None
+        self._values = None
+
+    @property
+    def raw(self):
+        """ raw A/D counts (numpy int32 array)
+        """
+
+        if self._raw is None:
+            self._raw = _join(self._raw_chunks, np.int32)
+            self._raw_chunks = [self._raw]
+        return self._raw
+
+    @property
+    def time_stamps(self):
+        """ hardware time stamps in microseconds (numpy int64 array)
+        """
+
+        if self._time_stamps is None:
+            self._time_stamps = _join(self._time_chunks, np.int64)
+            self._time_chunks = [self._time_stamps]
+        return self._time_stamps
+
+    @property
+    def voltages(self):
+        return calibration.counts_to_voltages(self.raw, self.calibration["volts_per_count"],
+                                              self.calibration["voltage_offset"])
+
+    @property
+    def values(self):
+        """ calibrated values in sensor units (numpy float64 array), calculated on first use
+        """
+
+        if self._values is None:
+            cal = self.calibration
+            self._values = calibration.calibrate_voltages(self.voltages, cal["equation"], cal["k0"],
+                                                          cal["k1"], cal["k2"], cal["calpage"])
+        return self._values
+
+    def recalibrate(self, **changes):
+        """ Change the calibration snapshot (for example equation=1, k0=0.0, k1=2.5) and discard the
+        calibrated values, so they are calculated again from the raw counts on next use.
+        """
+
+        for key in changes:
+            if key not in self.calibration:
+                config.logger.info("recalibrate() ignored unknown calibration value: %s", key)
+        self.calibration.update({key:value for key, value in changes.items() if key in self.calibration})
+        self._values = None
+        return self
+
+    def save(self, path):
+        """ Save the raw counts, time stamps and calibration snapshot to a .npz file
+        """
+
+        np.savez(path, raw=self.raw, time_stamps=self.time_stamps,
+                 calibration=np.array(json.dumps(self.calibration)))
+
+    def __len__(self):
+        return sum(chunk.size for chunk in self._raw_chunks)
+
+    def __iter__(self):
+        return iter(self.values.tolist())
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __repr__(self):
+        return ("<RawCapture device " + str(self.calibration.get("device")) + " ch" +
+                str(self.calibration.get("channel")) + ", " + str(len(self)) + " samples>")
+
+
+def load_raw_capture(path):
+    """ Load a RawCapture saved with RawCapture.save()
+    """
+
+    with np.load(path) as data:
+        return RawCapture(json.loads(str(data["calibration"])), data["raw"], data["time_stamps"])
+
+def get_calibration_snapshot(device_index, channel):
+    """ Read the channel's calibration from the sensor (DDS) memory, and find the straight line
+    that converts raw counts to voltage.
+
+    Returns:
+        calibration (dict): {"device", "channel", "equation", "k0", "k1", "k2", "calpage", "units",
+        "op_type", "probe_type", "volts_per_count", "voltage_offset"}
+    """
+
+    hDevice = config.hDevice[device_index]
+    equation = ngio_sensor.ddsmem_get_calibration_equation(hDevice, channel)
+    calpage = ngio_sensor.ddsmem_get_active_cal_page(hDevice, channel)
+    k0, k1, k2, units = ngio_sensor.ddsmem_get_cal_page(hDevice, channel, index=calpage)
+    op_type = ngio_sensor.ddsmem_get_operation_type(hDevice, channel)
+    if op_type == 2:
+        probe_type = 3   # an op_type = 2 (10V) means probe type = 3 (10 V)
+    else:
+        probe_type = 2   # an op_type = 14 (5V) means probe type = 2 (5 V)
+
+    low, high = VOLTAGE_REFERENCE_COUNTS
+    low_voltage = ngio_read.convert_to_voltage(hDevice, channel, low, probe_type)
+    high_voltage = ngio_read.convert_to_voltage(hDevice, channel, high, probe_type)
+    volts_per_count = (high_voltage - low_voltage)/(high - low)
+
+    return {"device":device_index, "channel":channel, "equation":equation,
+            "k0":k0, "k1":k1, "k2":k2, "calpage":calpage, "units":units,
+            "op_type":op_type, "probe_type":probe_type,
+            "volts_per_count":volts_per_count, "voltage_offset":low_voltage - low*volts_per_count}
+
+def get_packet_calibration(device_index, channel):
+    """ The calibration snapshot used for the packets of a channel. It is read from the sensor
+    the first time it is needed after start().
+    """
+
+    snapshot = config.calibration_snapshots.get((device_index, channel))
+    if snapshot is None:
+        snapshot = get_calibration_snapshot(device_index, channel)
+        config.calibration_snapshots[(device_index, channel)] = snapshot
+    return snapshot
+
+def start_raw_capture():
+    """ Create an empty RawCapture, with a calibration snapshot, for every enabled analog channel.
+    Called by LabQuest.start(raw_capture=True).
+    """
+
+    config.raw_captures = {}
+    for device_index, device_enabled_chs in enumerate(config.enabled_analog_channels):
+        for channel in device_enabled_chs:
+            config.raw_captures[(device_index, channel)] = RawCapture(get_packet_calibration(device_index, channel))
+
+def read_raw_arrays(device_index, channel, num_measurements):
+    """ Read a packet of raw measurements as numpy arrays of raw counts (int32) and
+    time stamps (int64, microseconds)
+    """
+
+    hDevice = config.hDevice[device_index]
+    num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
+            hDevice, channel, num_measurements)
+    num_of_measurements = max(num_of_measurements, 0)
+    # one copy of each ctypes array (the time stamps are c_ssize_t, so their size depends on the platform)
+    raw = np.ctypeslib.as_array(values)[:num_of_measurements].copy()
+    times = np.ctypeslib.as_array(time_stamps)[:num_of_measurements].astype(np.int64)
+    if config.overruns is not None:
+        overrun.check_packet(device_index, channel, raw, times, num_of_measurements)
+    return raw, times
+
+def read_raw_packet(device_index, channel, num_measurements):
+    """ Read a packet of raw measurements and return it as a RawCapture. In raw capture mode
+    the packet is also added to the channel's RawCapture.
+    """
+
+    raw, times = read_raw_arrays(device_index, channel, num_measurements)
+
+    if config.raw_capture:
+        capture = config.raw_captures.get((device_index, channel))
+        if capture is None:
+            capture = RawCapture(get_packet_calibration(device_index, channel))
+            config.raw_captures[(device_index, channel)] = capture
+        capture.append(raw, times)
+
+    return RawCapture(get_packet_calibration(device_index, channel), raw, times)
+
+def _join(chunks, dtype):
+    if not chunks:
+        return np.empty(0, dtype=dtype)
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
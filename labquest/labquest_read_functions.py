@@ -1,26 +1,73 @@
-from time import sleep
+from time import sleep, perf_counter
+import logging
 import math
 
+import numpy as np
+
 from labquest import config
 from labquest import ngio_read_functions as ngio_read
 from labquest import ngio_sensor_functions as ngio_sensor
 from labquest import labquest_buffer_functions as buffer
-buf = buffer.lq_buffer()
+from labquest import labquest_raw_capture_functions as raw_capture
+from labquest import labquest_calibration_functions as calibration
+from labquest import labquest_decimation_functions as decimation
+from labquest import labquest_overrun_functions as overrun
+from labquest import labquest_start_functions as start
+
+# Emptying the NGIO measurement buffers after stop: read until no channel has had a measurement
+# for DRAIN_QUIET_TIME seconds, checking every DRAIN_POLL_INTERVAL, and give up after DRAIN_TIMEOUT
+DRAIN_QUIET_TIME = 0.02
+DRAIN_POLL_INTERVAL = 0.002
+DRAIN_TIMEOUT = 1.0
+# The digital sensors that read(mode='latest') can read (photogate timing and the dcu have no samples)
+LATEST_DIG_SENSORS = ('motion', 'rotary_motion', 'rotary_motion_high_res', 'photogate_count')
+
+
+class LatestRead:
+    """ The sample age and discards of the read(mode='latest') calls of one (device, channel). The
+    age of a sample is the host time when it was returned minus its sample time, measured from the
+    Start Measurements command.
+    """
+
+    __slots__ = ('reads', 'discarded', 'last_discarded', 'last_time_stamp', 'last_age', 'max_age', 'total_age',
+                 'ages')
+
+    def __init__(self):
+        self.reads = 0
+        self.discarded = 0    # measurements skipped, waiting in the NGIO buffer or in lq_buffer
+        self.last_discarded = 0
+        self.last_time_stamp = None
+        self.last_age = None
+        self.max_age = None
+        self.total_age = 0.0
+        self.ages = 0
+
+    def record(self, time_stamp, age, num_discarded):
+        self.reads += 1
+        self.discarded += num_discarded
+        self.last_discarded = num_discarded
+        self.last_time_stamp = time_stamp
+        if age is not None:
+            self.last_age = age
+            if self.max_age is None or age > self.max_age:
+                self.max_age = age
+            self.total_age += age
+            self.ages += 1
+
+    def as_dict(self):
+        return {"reads":self.reads, "discarded":self.discarded, "last_discarded":self.last_discarded,
+                "time_stamp":self.last_time_stamp, "age":self.last_age, "max_age":self.max_age,
+                "mean_age":self.total_age/self.ages if self.ages else None}
+
 
 def get_measurement(device_index, ch):
     """ Get measurement from the specified channel (analog and digital)
     """
 
-    if ch == 'ch1':
-            channel = 1
-    if ch == 'ch2':
-            channel = 2
-    if ch == 'ch3':
-            channel = 3
-    if ch == 'dig1':
-            channel = 5
-    if ch == 'dig2':
-            channel = 6
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("read() - unknown channel: " + str(ch))
+        return None
     
     if ch in ('ch1', 'ch2', 'ch3'):
         analog_measurement = get_analog_measurement(device_index, channel)
@@ -35,14 +82,17 @@ def get_analog_measurement(device_index, ch):
     """
     
     # Are there data in the buffer? If so, read the buffer, not the sensor
+    buf = buffer.session_buffer()
     buffer_is_empty = buf.buffer_is_empty(device_index, ch)
     if not buffer_is_empty:
         measurement = buf.buffer_get(device_index, ch)
         return measurement 
 
-    # The buffer is empty, so get data
-    num_measurements_available = number_measurements_available(config.sample_period, device_index, ch)
-    config.logger.debug("number of measurements available " +str(ch) +": " +str(num_measurements_available))
+    # The buffer is empty, so get data. An oversampled or decimated channel waits for a complete block.
+    num_measurements_needed = decimation.samples_needed(device_index, ch) or 1
+    num_measurements_available = number_measurements_available(
+        start.channel_period(device_index, ch)*num_measurements_needed, device_index, ch, num_measurements_needed)
+    config.logger.debug("number of measurements available %s: %s", ch, num_measurements_available)
     if num_measurements_available == 0:
         config.logger.debug("Timed Out - no measurements available to read")
         measurement = None
@@ -56,6 +106,7 @@ def get_digital_measurement(device_index, ch, channel):
     """
 
     # Are there data in the buffer? If so, read the buffer, not the sensor
+    buf = buffer.session_buffer()
     buffer_is_empty = buf.buffer_is_empty(device_index, channel)
     if not buffer_is_empty:
         measurement = buf.buffer_get(device_index, channel)
@@ -70,10 +121,15 @@ def get_digital_measurement(device_index, ch, channel):
                 num_measurements_needed = 2
             else:
                 num_measurements_needed =1
+    wait_period = start.channel_period(device_index, channel)
+    block_size = decimation.samples_needed(device_index, channel)
+    if block_size is not None:
+        num_measurements_needed = block_size
+        wait_period = start.channel_period(device_index, channel)*block_size
     # make sure there are data available
     num_measurements_available = number_measurements_available(
-        config.sample_period, device_index, channel, num_measurements_needed)
-    config.logger.debug("number of measurements available ch" +str(channel) +": " +str(num_measurements_available))
+        wait_period, device_index, channel, num_measurements_needed)
+    config.logger.debug("number of measurements available ch%s: %s", channel, num_measurements_available)
     # data (for some reason) is not available
     if num_measurements_available == 0:
         config.logger.debug("Timed Out - no measurements available to read")
@@ -84,21 +140,120 @@ def get_digital_measurement(device_index, ch, channel):
     
     return measurement
 
+def get_latest_measurement(device_index, ch, wait=True):
+    """ Get the newest sample of a channel (analog and digital) and its time stamp. Everything
+    older, in the NGIO measurement buffer and in lq_buffer, is discarded: it is read from the
+    device in one call and only the newest sample (the newest block of an oversampled or
+    decimated channel, the newest ping and echo of a motion detector) is calibrated, so the time
+    does not grow with the backlog. If nothing new has arrived, wait for the next sample as
+    get_measurement() does, or return None at once if wait is False.
+
+    When packet sinks (a recorder, subscribers, shared rings) are attached, the whole packet is
+    calibrated and published as usual, so they still get every sample.
+
+    Returns:
+        (time_stamp, value): the sample time (microseconds) and calibrated value, or None if
+        no new sample arrived
+    """
+
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    key_value = None
+    if channel in (5, 6):
+        key_value = config.device_dig_channel_dictionary[device_index].get(ch)
+        if key_value not in LATEST_DIG_SENSORS:
+            config.logger.info("read(mode='latest') is not available for " + str(key_value))
+            return None
+    elif channel is None:
+        config.logger.info("read() - unknown channel: " + str(ch))
+        return None
+
+    # values read() has kept are older than anything still in the NGIO buffer
+    num_discarded = buffer.session_buffer().buffer_discard(device_index, channel)
+    # so are the samples of an incomplete oversampling or decimation block
+    for reducer in (config.oversamplers.get((device_index, channel)), config.decimators.get((device_index, channel))):
+        if reducer is not None:
+            reducer.reset()
+    block_size = 2 if key_value == 'motion' else decimation.samples_needed(device_index, channel) or 1
+
+    if wait:
+        num_measurements_available = number_measurements_available(
+            start.channel_period(device_index, channel)*block_size, device_index, channel, block_size)
+    else:
+        num_measurements_available = ngio_read.get_num_measurements_available(config.hDevice[device_index], channel)
+    if key_value == 'motion':
+        # a ping whose echo has not arrived is left for the next read
+        num_measurements_available -= num_measurements_available % 2
+    if num_measurements_available < block_size:
+        config.logger.debug("Timed Out - no measurements available to read")
+        return None
+
+    if config.packet_sinks:
+        packet = read_available_packet(device_index, channel, key_value)
+        if packet is None:
+            return None
+        time_stamps, values = packet
+        num_discarded += max(values.size - 1, 0)
+    elif key_value is None:
+        packet = raw_capture.read_raw_packet(device_index, channel, num_measurements_available)
+        first = max(packet.raw.size - block_size, 0)
+        newest = raw_capture.RawCapture(packet.calibration, packet.raw[first:], packet.time_stamps[first:])
+        time_stamps, values = calibrate_packet(device_index, channel, newest)
+        num_discarded += first
+    else:
+        raw, raw_time_stamps = raw_capture.read_raw_arrays(device_index, channel, num_measurements_available)
+        first = max(raw.size - block_size, 0)
+        time_stamps, values = calibrate_digital_packet(device_index, channel, key_value, raw[first:],
+                                                       raw_time_stamps[first:])
+        num_discarded += first
+    if not values.size:
+        return None
+
+    time_stamp = int(time_stamps[-1])
+    age = None
+    if device_index < len(config.start_times):
+        age = perf_counter() - config.start_times[device_index] - time_stamp/1000000
+    record_latest_read(device_index, channel, time_stamp, age, num_discarded)
+
+    return time_stamp, float(values[-1])
+
+def record_latest_read(device_index, channel, time_stamp, age, num_discarded):
+    latest = config.latest_reads.get((device_index, channel))
+    if latest is None:
+        latest = config.latest_reads[(device_index, channel)] = LatestRead()
+    latest.record(time_stamp, age, num_discarded)
+
+def get_latest_reads(device_index=None, ch=None):
+    """ The sample age and discards of read(mode='latest') for one channel, or for every channel
+    read that way (keyed "dev0_ch1", ...). Ages are in seconds.
+    """
+
+    if ch is not None:
+        channel = config.CHANNEL_NUMBERS.get(ch)
+        if channel is None:
+            config.logger.info("get_latest_reads() - unknown channel: " + str(ch))
+            return None
+        return config.latest_reads.get((device_index or 0, channel), LatestRead()).as_dict()
+    return {"dev" + str(device) + "_ch" + str(channel):latest.as_dict()
+            for (device, channel), latest in config.latest_reads.items()
+            if device_index is None or device == device_index}
+
 def get_multi_pt_measurements(device_index, ch, num_measurements_to_read):
     """ Get a packet of analog sensor measurements from the specified channel.
     """
 
-    if ch == 'ch1':
-            channel = 1
-    if ch == 'ch2':
-            channel = 2
-    if ch == 'ch3':
-            channel = 3
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel not in (1, 2, 3):
+        config.logger.info("read_multi_pt() - not an analog channel: " + str(ch))
+        return []
+
+    # an oversampled or decimated channel reads enough samples for the number of blocks asked for
+    num_measurements_to_read = decimation.samples_needed(
+            device_index, channel, num_measurements_to_read) or num_measurements_to_read
 
     # make sure there is at least one available, then ask to read all measurements
     num_measurements_available = number_measurements_available_multipt(
-            config.sample_period, device_index, channel, num_measurements_to_read)
-    config.logger.debug("multi-pt num msrmnts available = " + str(num_measurements_available))
+            start.channel_period(device_index, channel), device_index, channel, num_measurements_to_read)
+    config.logger.debug("multi-pt num msrmnts available = %s", num_measurements_available)
     if num_measurements_available == 0:
         config.logger.debug("Timed Out - no measurements available to read")
         measurements = []
@@ -109,6 +264,7 @@ def get_multi_pt_measurements(device_index, ch, num_measurements_to_read):
 
 def number_measurements_available(sample_period, device_index, channel, num_msrmnts_needed=1):
     """ Return a value for how many analog sensor measurements are availabe for the channel.
+    The sample_period sets how long to wait (a decimated channel passes the period of a block).
     """
     
     hDevice = config.hDevice[device_index]
@@ -122,6 +278,9 @@ def number_measurements_available(sample_period, device_index, channel, num_msrm
         # after each iteration, if no data has been found, sleep for 1/10 the sample period then try again.
         sleep(sample_period/10)   
         x+=1
+
+    if config.stats is not None:
+        config.stats.record_poll(device_index, channel, x + 1 if x < 30 else x, num_measurements_available)
     
     return num_measurements_available  
 
@@ -138,11 +297,14 @@ def number_measurements_available_multipt(sample_period, device_index, channel,
     while x < 30: 
         num_measurements_available = ngio_read.get_num_measurements_available(hDevice, channel)  
         if num_measurements_available >= num_msrmnts: 
-            config.logger.debug("ch = " + str(channel) + " num_measurements " + str(num_measurements_available))
+            config.logger.debug("ch = %s num_measurements %s", channel, num_measurements_available)
             break
         # after each iteration, if no data has been found, sleep for 1/10 the sample period then try again.
         sleep(sample_period/10)   
         x+=1
+
+    if config.stats is not None:
+        config.stats.record_poll(device_index, channel, x + 1 if x < 30 else x, num_measurements_available)
             
     return num_measurements_available
 
@@ -154,30 +316,47 @@ def read_and_calibrate_data(num_measurements_available, device_index, channel):
 
     calibrated_values = []
     hDevice = config.hDevice[device_index]
+    # only build the per-sample debug messages if they will be logged
+    debug = config.logger.isEnabledFor(logging.DEBUG)
+
+    # in raw capture mode, or when oversampling or decimating, calibrate the packet in one step
+    if config.raw_capture or (device_index, channel) in config.oversamplers or (device_index, channel) in config.decimators:
+        time_stamps, values = read_and_calibrate_packet(device_index, channel, num_measurements_available)
+        time_stamps = time_stamps.tolist()
+        calibrated_values = values.tolist()
+        if not calibrated_values:
+            return None
+    else:
+        # get the raw measurement(s) from the channel. There may be one value or many values
+        num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
+                hDevice, channel, num_measurements_available) 
+        if config.overruns is not None:
+            overrun.check_packet(device_index, channel, values, time_stamps, num_of_measurements)
 
-    # get the raw measurement(s) from the channel. There may be one value or many values
-    num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
-            hDevice, channel, num_measurements_available) 
+        for value in values:
+            if debug:
+                config.logger.debug("raw value to convert to voltage = %s", value)
+            op_type = ngio_sensor.ddsmem_get_operation_type(hDevice, channel)
+            if op_type == 2: 
+                probe_type = 3   # an op_type = 2 (10V) means probe type = 3 (10 V)
+            else:
+                probe_type = 2   # an op_type = 14 (5V) means probe type = 2 (5 V) 
+            voltage = ngio_read.convert_to_voltage(hDevice, channel, value, probe_type)
+            if debug:
+                config.logger.debug("voltage = %s", voltage)
+            calibrated_value = apply_calibration(voltage, hDevice, channel)
+            calibrated_values.append(calibrated_value)
 
-    for value in values:
-        config.logger.debug("raw value to convert to voltage = " + str(value))
-        op_type = ngio_sensor.ddsmem_get_operation_type(hDevice, channel)
-        if op_type == 2: 
-            probe_type = 3   # an op_type = 2 (10V) means probe type = 3 (10 V)
-        else:
-            probe_type = 2   # an op_type = 14 (5V) means probe type = 2 (5 V) 
-        voltage = ngio_read.convert_to_voltage(hDevice, channel, value, probe_type)
-        config.logger.debug("voltage = " + str(voltage))
-        calibrated_value = apply_calibration(voltage, hDevice, channel)
-        calibrated_values.append(calibrated_value)
+    if config.packet_sinks:
+        publish_packet(device_index, channel, time_stamps[:len(calibrated_values)], calibrated_values)
         
     # The calibrated_values list may be one value, or multiple (if fast sampling)
     # Pull the first value off the calibrated_values list
     measurement = calibrated_values.pop(0)
     # If, after popping off the first value, there are still data, put them in the buffer
     if calibrated_values:
-        config.logger.info("values to put in buffer, " + str(calibrated_values))
-        buf.buffer_put(device_index, channel, calibrated_values)
+        config.logger.info("values to put in buffer, %s", calibrated_values)
+        buffer.session_buffer().buffer_put(device_index, channel, calibrated_values)
 
     return measurement
 
@@ -187,16 +366,21 @@ def read_and_calibrate_digital_data(num_measurements_available, device_index, ch
 
     calibrated_values = []
     hDevice = config.hDevice[device_index]
+    # only build the per-sample debug messages if they will be logged
+    debug = config.logger.isEnabledFor(logging.DEBUG)
 
     # get the raw measurement(s) from the channel. There may be one value or many values
     num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
             hDevice, channel, num_measurements_available) 
+    if config.overruns is not None:
+        overrun.check_packet(device_index, channel, values, time_stamps, num_of_measurements)
 
     if key_value == 'motion':
         i = 0
         if i < len(values):
             for value, time_stamp in zip(values, time_stamps):
-                config.logger.debug("motion value, timestamp = " + str(value) +', ' +str(time_stamp))
+                if debug:
+                    config.logger.debug("motion value, timestamp = %s, %s", value, time_stamp)
                 if value == 0:
                     time1 = time_stamp
                 elif value == 1:
@@ -210,31 +394,57 @@ def read_and_calibrate_digital_data(num_measurements_available, device_index, ch
             # Divide by 2 to get distance from object to motion detector. 
             calibrated_value = v*t/2    # distance in meters
             calibrated_values.append(calibrated_value)
+            motion_time_stamps = [time1]
 
     if key_value == 'rotary_motion':
         for value in values:
-            config.logger.debug("rotary value = " + str(value))
+            if debug:
+                config.logger.debug("rotary value = %s", value)
             calibrated_value = value
             calibrated_values.append(calibrated_value)
 
     if key_value == 'rotary_motion_high_res':
         for value in values:
-            config.logger.debug("rotary value = " + str(value))
+            if debug:
+                config.logger.debug("rotary value = %s", value)
             calibrated_value = value/4
             calibrated_values.append(calibrated_value)
 
     if key_value == 'photogate_count':
         for value in values:
-            config.logger.debug("photogate count value = " + str(value))
+            if debug:
+                config.logger.debug("photogate count value = %s", value)
             calibrated_value = value
             calibrated_values.append(calibrated_value)
 
+    if key_value == 'motion':
+        # one distance is calculated from each ping and echo, time stamp it with the ping
+        time_stamps = motion_time_stamps
+    else:
+        time_stamps = time_stamps[:len(calibrated_values)]
+
+    oversampler = config.oversamplers.get((device_index, channel))
+    decimator = config.decimators.get((device_index, channel))
+    if oversampler is not None or decimator is not None:
+        values = calibrated_values
+        if oversampler is not None:
+            time_stamps, values = oversampler.process(time_stamps, values)
+        if decimator is not None:
+            time_stamps, values = decimator.process(time_stamps, values)
+        time_stamps = time_stamps.tolist()
+        calibrated_values = values.tolist()
+        if not calibrated_values:
+            return None
+
+    if config.packet_sinks:
+        publish_packet(device_index, channel, time_stamps[:len(calibrated_values)], calibrated_values)
+
     # The calibrated_values list may be one value, or multiple (if fast sampling)
     # Pull the first value off the calibrated_values list
     measurement = calibrated_values.pop(0)
     # If, after popping off the first value, there are still data, put them in the buffer
     if calibrated_values:
-        buf.buffer_put(device_index, channel, calibrated_values)
+        buffer.session_buffer().buffer_put(device_index, channel, calibrated_values)
 
     return measurement
 
@@ -244,27 +454,172 @@ def read_and_calibrate_multi_pt_data(device_index, channel, num_measurements):
     asked for are returned.
     """
 
+    # an oversampled or decimated channel calibrates the packet in one step, and returns the reduced values
+    if (device_index, channel) in config.oversamplers or (device_index, channel) in config.decimators:
+        time_stamps, values = read_and_calibrate_packet(device_index, channel, num_measurements)
+        if config.packet_sinks:
+            publish_packet(device_index, channel, time_stamps, values)
+        return values.tolist()
+
+    # in raw capture mode, only the raw counts are copied. The packet is returned as a RawCapture,
+    # which calculates the calibrated values when they are first used.
+    if config.raw_capture:
+        packet = raw_capture.read_raw_packet(device_index, channel, num_measurements)
+        if config.packet_sinks:
+            publish_packet(device_index, channel, packet.time_stamps, packet.values)
+        return packet
+
     calibrated_values = []
     hDevice = config.hDevice[device_index]
+    # only build the per-sample debug messages if they will be logged
+    debug = config.logger.isEnabledFor(logging.DEBUG)
         
     # get the raw measurement(s) from the channel. There may be one value or many values
     num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
             hDevice, channel, num_measurements) 
+    if config.overruns is not None:
+        overrun.check_packet(device_index, channel, values, time_stamps, num_of_measurements)
 
     for value in values:
-        config.logger.debug("raw value to convert to voltage = " + str(value))
+        if debug:
+            config.logger.debug("raw value to convert to voltage = %s", value)
         op_type = ngio_sensor.ddsmem_get_operation_type(hDevice, channel)
         if op_type == 2: 
             probe_type = 3   # an op_type = 2 (10V) means probe type = 3 (10 V)
         else:
             probe_type = 2   # an op_type = 14 (5V) means probe type = 2 (5 V) 
         voltage = ngio_read.convert_to_voltage(hDevice, channel, value, probe_type)
-        config.logger.debug("voltage = " + str(voltage))
+        if debug:
+            config.logger.debug("voltage = %s", voltage)
         calibrated_value = apply_calibration(voltage, hDevice, channel)
         calibrated_values.append(calibrated_value)    
 
+    if config.packet_sinks:
+        publish_packet(device_index, channel, time_stamps[:len(calibrated_values)], calibrated_values)
+
     return calibrated_values
 
+def read_and_calibrate_packet(device_index, channel, num_measurements):
+    """ Read a packet of raw measurements from an analog channel and return numpy arrays of the
+    time stamps and calibrated values. With oversampling, each group of raw counts is averaged before
+    the calibration; with decimation, the calibrated values are then reduced.
+    """
+
+    packet = raw_capture.read_raw_packet(device_index, channel, num_measurements)
+    return calibrate_packet(device_index, channel, packet)
+
+def calibrate_packet(device_index, channel, packet):
+    """ The time stamps and calibrated values of a RawCapture packet of an analog channel, through
+    the channel's oversampler and decimator
+    """
+
+    time_stamps = packet.time_stamps
+
+    oversampler = config.oversamplers.get((device_index, channel))
+    if oversampler is None:
+        values = packet.values
+    else:
+        time_stamps, counts = oversampler.process(time_stamps, packet.raw)
+        cal = packet.calibration
+        values = calibration.calibrate(counts, cal["equation"], cal["k0"], cal["k1"], cal["k2"], cal["calpage"],
+                                       cal["probe_type"], cal["volts_per_count"], cal["voltage_offset"])
+
+    decimator = config.decimators.get((device_index, channel))
+    if decimator is not None:
+        time_stamps, values = decimator.process(time_stamps, values)
+
+    return time_stamps, values
+
+def read_and_calibrate_digital_packet(device_index, channel, key_value, num_measurements):
+    """ Read a packet of measurements from a digital channel and return numpy arrays of the 
+    time stamps and calibrated values (one distance per ping and echo for the motion detector).
+    """
+
+    values, time_stamps = raw_capture.read_raw_arrays(device_index, channel, num_measurements)
+    return calibrate_digital_packet(device_index, channel, key_value, values, time_stamps)
+
+def calibrate_digital_packet(device_index, channel, key_value, values, time_stamps):
+    """ The time stamps and calibrated values of a packet of raw digital measurements (numpy 
+    arrays), through the channel's oversampler and decimator
+    """
+
+    if key_value == 'motion':
+        # each ping (0) followed by its echo (1) gives one distance, time stamped with the ping
+        pings = np.flatnonzero((values[:-1] == 0) & (values[1:] == 1))
+        t = (time_stamps[pings + 1] - time_stamps[pings])/1000
+        v = 340/1000
+        return time_stamps[pings], v*t/2
+    if key_value == 'rotary_motion_high_res':
+        values = values/4
+    else:
+        values = values.astype(np.float64)
+
+    oversampler = config.oversamplers.get((device_index, channel))
+    if oversampler is not None:
+        time_stamps, values = oversampler.process(time_stamps, values)
+    decimator = config.decimators.get((device_index, channel))
+    if decimator is not None:
+        time_stamps, values = decimator.process(time_stamps, values)
+
+    return time_stamps, values
+
+def read_available_packet(device_index, channel, key_value):
+    """ Read everything available on one channel (whole blocks of an oversampled or decimated
+    channel, whole ping/echo pairs of a motion detector) and publish it.
+
+    Returns:
+        time_stamps, values (numpy arrays), or None if nothing was available
+    """
+
+    hDevice = config.hDevice[device_index]
+    num_measurements_available = ngio_read.get_num_measurements_available(hDevice, channel)
+    block_size = decimation.samples_needed(device_index, channel) or 1
+    if key_value == 'motion':
+        num_measurements_available -= num_measurements_available % 2
+        block_size = 2
+    if num_measurements_available < block_size:
+        return None
+
+    if key_value is None:
+        time_stamps, values = read_and_calibrate_packet(device_index, channel, num_measurements_available)
+    else:
+        time_stamps, values = read_and_calibrate_digital_packet(
+                device_index, channel, key_value, num_measurements_available)
+    if values.size and config.packet_sinks:
+        publish_packet(device_index, channel, time_stamps, values)
+    return time_stamps, values
+
+def read_all(device_index):
+    """ Read everything available on every enabled channel of a device (not photogate timing or
+    dcu). Each channel has the values of its own period.
+
+    Returns:
+        {'ch1':(time_stamps, values), ...}: numpy arrays of the time stamps (microseconds) and
+        the calibrated values, which may be empty
+    """
+
+    packets = {}
+    for channel in config.enabled_all_channels[device_index]:
+        ch = config.CHANNEL_NAMES[channel]
+        key_value = None
+        if channel in (5, 6):
+            key_value = config.device_dig_channel_dictionary[device_index].get(ch)
+            if key_value not in ('motion', 'rotary_motion', 'rotary_motion_high_res', 'photogate_count'):
+                continue
+        packet = read_available_packet(device_index, channel, key_value)
+        if packet is None:
+            packet = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        packets[ch] = packet
+    return packets
+
+def publish_packet(device_index, channel, time_stamps, values):
+    """ Hand a packet of calibrated values, and their hardware time stamps, to each of the
+    packet sinks (such as a recorder) registered in config.packet_sinks.
+    """
+
+    for sink in config.packet_sinks:
+        sink(device_index, channel, time_stamps, values)
+
 def apply_calibration(voltage, hDevice, channel):
     """ Use the equation and calibration values to convert the
     sensor's reading in voltage to proper sensor units.
@@ -274,7 +629,7 @@ def apply_calibration(voltage, hDevice, channel):
     # {"equation":, "cal0":, "cal1":, "cal2":, "units":}
 
     equation = ngio_sensor.ddsmem_get_calibration_equation(hDevice, channel)
-    config.logger.debug("calibration equation ch" +str(channel) +": " + str(equation))
+    config.logger.debug("calibration equation ch%s: %s", channel, equation)
     active_calpage = ngio_sensor.ddsmem_get_active_cal_page(hDevice, channel)
     K0, K1, K2, active_units = ngio_sensor.ddsmem_get_cal_page(
             hDevice, channel, index=active_calpage)
@@ -313,30 +668,36 @@ def apply_calibration(voltage, hDevice, channel):
 
 def clear_the_lq_measurement_buffer():
     """ This function empties the measurement buffers. This should happen once measurements have been
-    stopped, and before starting measurements again. 
+    stopped, and before starting measurements again. The buffers are read until every channel has
+    had no measurements for DRAIN_QUIET_TIME (measurements still on their way from the device
+    arrive in that time), or for at most DRAIN_TIMEOUT seconds.
     """
-    
-    sleep(1)    # wait a second and then read the ngio buffer to clear it
-    if any(config.enabled_analog_channels):
-        for hDevice, device_enabled_chs in zip(config.hDevice, config.enabled_analog_channels):
-            for channel in device_enabled_chs:
-                num_measurements_available = ngio_read.get_num_measurements_available(hDevice, channel)  
-                if num_measurements_available >= 1: 
-                    num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
-                            hDevice, channel, num_measurements_available)    
-    
-    if config.motion or config.rotary_motion or config.rotary_motion_high_res:
-        for hDevice, dig_ch_dictionary in zip(config.hDevice, config.device_dig_channel_dictionary):
-            for key in dig_ch_dictionary:
-                if key == "dig1":
-                    dig_channel = 5
-                elif key == 'dig2':
-                    dig_channel = 6
-                else:
-                    break
-                
-                if dig_ch_dictionary[key] in ('motion', 'rotary_motion', 'rotary_motion_high_res'):
-                    num_measurements_available = ngio_read.get_num_measurements_available(hDevice, dig_channel)
-                    if num_measurements_available >= 1:
-                        num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
-                            hDevice, dig_channel, num_measurements_available) 
\ No newline at end of file
+
+    channels = []
+    for hDevice, device_enabled_chs in zip(config.hDevice, config.enabled_analog_channels):
+        for channel in device_enabled_chs:
+            channels.append((hDevice, channel))
+    for hDevice, dig_ch_dictionary in zip(config.hDevice, config.device_dig_channel_dictionary):
+        for key in dig_ch_dictionary:
+            if dig_ch_dictionary[key] in ('motion', 'rotary_motion', 'rotary_motion_high_res',
+                                          'photogate_count', 'photogate_timing'):
+                channels.append((hDevice, config.CHANNEL_NUMBERS[key]))
+
+    num_cleared = 0
+    start_time = perf_counter()
+    quiet_since = start_time
+    while True:
+        for hDevice, channel in channels:
+            num_measurements_available = ngio_read.get_num_measurements_available(hDevice, channel)
+            if num_measurements_available >= 1:
+                num_of_measurements, values, time_stamps = ngio_read.read_raw_measurements(
+                        hDevice, channel, num_measurements_available)
+                num_cleared += max(num_of_measurements, 0)
+                quiet_since = perf_counter()
+        now = perf_counter()
+        if now - quiet_since >= DRAIN_QUIET_TIME or now - start_time >= DRAIN_TIMEOUT:
+            break
+        sleep(DRAIN_POLL_INTERVAL)
+
+    config.logger.debug("cleared %s measurements in %s s", num_cleared, perf_counter() - start_time)
+    return num_cleared
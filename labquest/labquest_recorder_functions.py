@@ -0,0 +1,262 @@
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from labquest import config
+from labquest import labquest_sensor_info_functions as info
+from labquest import labquest_start_functions as start
+
+
+# Each column file starts with a fixed size header: magic, number of valid samples, numpy dtype.
+# The samples follow the header. The count is updated after the samples are written, so a reader
+# never sees a sample that is not complete.
+COLUMN_MAGIC = b'LQCOL001'
+COLUMN_HEADER = struct.Struct('<8sQ8s')
+COLUMN_HEADER_SIZE = 64
+METADATA_FILE = "metadata.json"
+
+TIME_DTYPE = np.dtype('<i8')    # hardware time stamps (microseconds)
+VALUE_DTYPE = np.dtype('<f8')    # calibrated values
+
+
+class ColumnFile:
+    """ A preallocated, memory-mapped column of samples that grows in large extents.
+    """
+
+    def __init__(self, path, dtype, extent):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.extent = extent
+        self.count = 0
+        self.capacity = extent
+        self.file = open(path, 'w+b')
+        self.file.truncate(self._file_size(self.capacity))
+        self.map = mmap.mmap(self.file.fileno(), self._file_size(self.capacity))
+        self._write_header()
+
+    def append(self, samples):
+        """ Copy an array of samples to the end of the column
+        """
+
+        samples = np.ascontiguousarray(samples, dtype=self.dtype)
+        if self.count + samples.size > self.capacity:
+            self._grow(self.count + samples.size)
+        start = COLUMN_HEADER_SIZE + self.count*self.dtype.itemsize
+        self.map[start:start + samples.nbytes] = samples.tobytes()
+        self.count += samples.size
+        self._write_header()
+
+    def close(self):
+        """ Trim the unused part of the last extent and close the file
+        """
+
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self._file_size(self.count))
+        self.file.close()
+
+    def _grow(self, needed):
+        while self.capacity < needed:
+            self.capacity += self.extent
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self._file_size(self.capacity))
+        self.map = mmap.mmap(self.file.fileno(), self._file_size(self.capacity))
+
+    def _file_size(self, num_samples):
+        return COLUMN_HEADER_SIZE + num_samples*self.dtype.itemsize
+
+    def _write_header(self):
+        self.map[0:COLUMN_HEADER.size] = COLUMN_HEADER.pack(COLUMN_MAGIC, self.count,
+                                                            self.dtype.str.encode('ascii'))
+
+
+class ColumnRecorder:
+    """ Record the calibrated values and hardware time stamps of every enabled channel to
+    memory-mapped column files, one pair of files (time and value) per device and channel.
+    The data is handed to a dedicated writer thread, so recording does not slow down the
+    reads, and host memory stays flat no matter how long the run is.
+
+    The files can be opened with open_recording() (as numpy memmaps) while recording continues.
+
+    Args:
+        directory (str): folder for the recording. It is created if it does not exist.
+
+        extent (int): number of samples the column files grow by
+
+        max_pending (int): number of packets that can wait for the writer thread before
+        the reads wait for the writer
+    """
+
+    def __init__(self, directory, extent=1048576, max_pending=1024):
+        self.directory = directory
+        self.extent = extent
+        self.columns = {}    # {"dev0_ch1":(time ColumnFile, value ColumnFile)}
+        self.metadata = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self.error = None
+
+    def open(self):
+        """ Create the column files and the metadata for the channels that are enabled, and
+        start the writer thread. Called by LabQuest.start().
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.metadata = {"format":"labquest-columns-1", "created":time.strftime("%Y-%m-%dT%H:%M:%S"),
+                         "sample_period":config.sample_period*config.oversample,
+                         "oversample":config.oversample, "time_units":"microseconds",
+                         "header_size":COLUMN_HEADER_SIZE, "channels":{}}
+
+        for device_index, channel_names in enumerate(config.channel_name_list):
+            for ch in channel_names:
+                key = column_key(device_index, ch)
+                time_file = key + ".time.col"
+                value_file = key + ".value.col"
+                self.columns[key] = (ColumnFile(os.path.join(self.directory, time_file), TIME_DTYPE, self.extent),
+                                     ColumnFile(os.path.join(self.directory, value_file), VALUE_DTYPE, self.extent))
+                channel_metadata = get_channel_metadata(device_index, ch)
+                channel_metadata["columns"] = {"time":{"file":time_file, "dtype":TIME_DTYPE.str},
+                                               "value":{"file":value_file, "dtype":VALUE_DTYPE.str}}
+                # channels started with their own period differ from the sample_period of the recording
+                channel_metadata["sample_period"] = start.output_period(
+                    device_index, config.CHANNEL_NUMBERS[ch])
+                self.metadata["channels"][key] = channel_metadata
+
+        with open(os.path.join(self.directory, METADATA_FILE), 'w') as file:
+            json.dump(self.metadata, file, indent=2)
+
+        self._thread = threading.Thread(target=config.in_current_session(self._writer), name="labquest-recorder", daemon=True)
+        self._thread.start()
+
+    def __call__(self, device_index, channel, time_stamps, values):
+        """ Queue a packet of time stamps and calibrated values. This is the packet sink that
+        the read functions call.
+        """
+
+        # copy now, the caller's arrays may be reused
+        self._queue.put((column_key(device_index, channel_name(channel)),
+                         np.array(time_stamps, dtype=TIME_DTYPE), np.array(values, dtype=VALUE_DTYPE)))
+
+    def close(self):
+        """ Write everything that is queued, then close the column files
+        """
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        for time_column, value_column in self.columns.values():
+            time_column.close()
+            value_column.close()
+        self.columns = {}
+
+    def _writer(self):
+        while True:
+            packet = self._queue.get()
+            if packet is None:
+                break
+            key, time_stamps, values = packet
+            columns = self.columns.get(key)
+            if columns is None:
+                continue
+            try:
+                # write the value first; a reader uses the shorter of the two columns
+                columns[1].append(values)
+                columns[0].append(time_stamps)
+            except Exception as error:    # keep draining the queue so the reads are never blocked
+                self.error = error
+                config.logger.info("Recorder write failed: %s", error)
+
+
+def attach_recorder(recorder):
+    """ Open a recorder (a ColumnRecorder, or a folder name for a new one) and add it to the
+    packet sinks, so every packet that is read is recorded
+    """
+
+    if config.recorder is not None:
+        detach_recorder()
+    if not isinstance(recorder, ColumnRecorder):
+        recorder = ColumnRecorder(recorder)
+    recorder.open()
+    config.recorder = recorder
+    config.packet_sinks.append(recorder)
+    config.logger.info("Recording to %s", recorder.directory)
+    return recorder
+
+def detach_recorder():
+    """ Remove the recorder from the packet sinks and close its files
+    """
+
+    recorder = config.recorder
+    if recorder is None:
+        return
+    if recorder in config.packet_sinks:
+        config.packet_sinks.remove(recorder)
+    config.recorder = None
+    recorder.close()
+    if recorder.error is not None:
+        config.logger.info("Recording to %s is incomplete: %s", recorder.directory, recorder.error)
+
+def open_recording(directory):
+    """ Open a recording made by ColumnRecorder (it may still be recording).
+
+    Returns:
+        recording (dict): {"dev0_ch1":{"time":memmap, "value":memmap, "metadata":dict}, ...}.
+        The memmaps hold the samples written so far; call again to see newer samples.
+    """
+
+    with open(os.path.join(directory, METADATA_FILE), 'r') as file:
+        metadata = json.load(file)
+
+    recording = {}
+    for key, channel_metadata in metadata["channels"].items():
+        time_column = read_column(os.path.join(directory, channel_metadata["columns"]["time"]["file"]))
+        value_column = read_column(os.path.join(directory, channel_metadata["columns"]["value"]["file"]))
+        count = min(time_column.size, value_column.size)
+        recording[key] = {"time":time_column[:count], "value":value_column[:count], "metadata":channel_metadata}
+    return recording
+
+def read_column(path):
+    """ Return the valid samples of a column file as a read-only numpy memmap
+    """
+
+    with open(path, 'rb') as file:
+        magic, count, dtype = COLUMN_HEADER.unpack(file.read(COLUMN_HEADER.size))
+    if magic != COLUMN_MAGIC:
+        raise ValueError(path + " is not a labquest column file")
+    dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=COLUMN_HEADER_SIZE, shape=(count,))
+
+def get_channel_metadata(device_index, ch):
+    """ Sensor name, units and calibration of a channel, from the configuration in config.py
+    """
+
+    channel_metadata = {"device":device_index, "channel":ch,
+                        "name_and_units":info.get_sensor_long_name_and_units(device_index, ch)}
+    if ch in ('ch1', 'ch2', 'ch3'):
+        try:
+            sensor_info = config.device_channel_dictionary[device_index][ch]
+        except (IndexError, KeyError):
+            sensor_info = {}
+        channel_metadata["sensor_info"] = dict(sensor_info)
+    else:
+        channel_metadata["sensor"] = config.device_dig_channel_dictionary[device_index].get(ch)
+    return channel_metadata
+
+def column_key(device_index, ch):
+    return "dev" + str(device_index) + "_" + ch
+
+def channel_name(channel):
+    """ 'ch1', 'ch2', 'ch3', 'dig1' or 'dig2' for channel number 1, 2, 3, 5 or 6
+    """
+
+    return config.CHANNEL_NAMES[channel]
@@ -6,12 +6,7 @@ def get_sensor_long_name_and_units(device_index, ch):
     """ Return a string that combines the sensor's long name with units
     """
     
-    if ch == 'ch1':
-            channel = 1
-    if ch == 'ch2':
-            channel = 2
-    if ch == 'ch3':
-            channel = 3
+    channel = config.CHANNEL_NUMBERS.get(ch)
     
     hDevice = config.hDevice[device_index]
 
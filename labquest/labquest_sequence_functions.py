@@ -0,0 +1,180 @@
+import threading
+import time
+
+from labquest import config
+from labquest import labquest_dcu_functions as dcu
+from labquest import ngio_send_cmd_get_resp as ngio_send
+
+
+SEQUENCE_OUTPUTS = ('dcu', 'pwm')
+# The player sleeps until this many seconds before each step, then waits for the deadline
+# without sleeping (a sleep can end a millisecond or more late)
+SPIN_TIME = 0.002
+
+
+class SequencePlayer:
+    """ Plays a schedule of DCU line states or PWM settings on its own thread. Every command is
+    encoded before the first step, so a step only sends its command. The steps are timed from the
+    start of the schedule (not from the step before), so the errors do not add up, and a step that
+    is late is sent at once.
+
+    The actual send time of each step is in the log, also as a time stamp of the acquisition
+    (microseconds from the Start Measurements command, like the sensor data) while measurements run.
+
+    Args:
+        steps: [(time, value)] for output='dcu' (value 0-15), or [(time, frequency_Hz, duty_cycle)]
+        for output='pwm', with the times in seconds from the start, in order
+
+        device_index (int)
+
+        output (str): 'dcu' or 'pwm'
+
+        output_ch (str): the DCU's channel, 'dig1' or 'dig2' (the PWM output is on dig1)
+
+        repeat (int): number of times the schedule is played. Each time starts at the time of the
+        previous start plus period.
+
+        period (float): seconds between repeats. None uses the time of the last step.
+    """
+
+    def __init__(self, steps, device_index, output='dcu', output_ch='dig1', repeat=1, period=None):
+        self.device_index = device_index
+        self.output = output
+        self.output_ch = output_ch
+        self.repeat = repeat
+        self.times = [step[0] for step in steps]
+        self.period = self.times[-1] if period is None else period
+        self.commands = [self._encode(step) for step in steps]
+        self.log = []    # {"step", "repeat", "time", "sent", "late", "command_time", "time_stamp"} of each step sent
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=config.in_current_session(self._run), name="labquest-sequence",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop before the next step. The output is left as it is (LabQuest.stop() turns the DCU
+        lines and the PWM off).
+        """
+
+        self._stop.set()
+        self.wait()
+
+    def wait(self, timeout=None):
+        """ Wait for the schedule to finish (or stop()). Returns True if it has.
+        """
+
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+        return True
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def as_dict(self):
+        """ The number of steps sent, and the mean and max lateness and command time (seconds)
+        """
+
+        late = [entry["late"] for entry in self.log]
+        command_times = [entry["command_time"] for entry in self.log]
+        return {"steps":len(self.log), "errors":self.errors,
+                "mean_late":sum(late)/len(late) if late else None, "max_late":max(late, default=None),
+                "mean_command_time":sum(command_times)/len(command_times) if command_times else None,
+                "max_command_time":max(command_times, default=None)}
+
+    def _encode(self, step):
+        if self.output == 'dcu':
+            command, parameters, param_bytes = dcu.encode_io_line(self.output_ch, step[1])
+        else:
+            command, parameters, param_bytes = dcu.encode_pwm(step[1], step[2])
+        return command, ngio_send.encode_parameters(parameters), param_bytes
+
+    def _run(self):
+        hDevice = config.hDevice[self.device_index]
+        start_times = config.start_times
+        start_time = time.perf_counter()
+        for repeat in range(self.repeat):
+            repeat_start = start_time + repeat*self.period
+            for step, (step_time, (command, parameters, param_bytes)) in enumerate(zip(self.times, self.commands)):
+                deadline = repeat_start + step_time
+                remaining = deadline - time.perf_counter() - SPIN_TIME
+                if remaining > 0 and self._stop.wait(remaining):
+                    return
+                if self._stop.is_set():
+                    return
+                while time.perf_counter() < deadline:
+                    pass
+                sent = time.perf_counter()
+                try:
+                    ngio_send.send_encoded_cmd_get_response(hDevice, command, parameters, param_bytes)
+                except Exception as error:
+                    self.errors += 1
+                    config.logger.info("Sequence step " + str(step) + " failed: " + str(error))
+                done = time.perf_counter()
+                time_stamp = None
+                if config.acquiring and self.device_index < len(start_times):
+                    time_stamp = int((sent - start_times[self.device_index])*1000000)
+                self.log.append({"step":step, "repeat":repeat, "time":step_time, "sent":sent - repeat_start,
+                                 "late":sent - deadline, "command_time":done - sent, "time_stamp":time_stamp})
+
+
+def play_sequence(steps, device_index, output='dcu', output_ch='dig1', repeat=1, period=None):
+    """ Check the schedule and the output channel, then start a SequencePlayer and add it to
+    config.sequence_players.
+
+    Returns:
+        player (SequencePlayer), or None if the schedule or the channel is not valid
+    """
+
+    if output not in SEQUENCE_OUTPUTS:
+        config.logger.info("play_sequence() - output must be 'dcu' or 'pwm'")
+        return None
+    if device_index >= len(config.hDevice):
+        config.logger.info("play_sequence() - no device " + str(device_index))
+        return None
+    steps = list(steps)
+    if not steps:
+        config.logger.info("play_sequence() - the schedule is empty")
+        return None
+    if any(len(step) != (2 if output == 'dcu' else 3) for step in steps):
+        config.logger.info("play_sequence() - each step must be (time, value) for 'dcu', " +
+                           "(time, frequency_Hz, duty_cycle) for 'pwm'")
+        return None
+    times = [step[0] for step in steps]
+    if times[0] < 0 or any(later < earlier for earlier, later in zip(times, times[1:])):
+        config.logger.info("play_sequence() - the step times must start at 0 or later and be in order")
+        return None
+    if output == 'dcu' and any(not 0 <= step[1] <= 15 for step in steps):
+        config.logger.info("play_sequence() - the DCU values must be 0-15")
+        return None
+    if output == 'pwm' and any(step[1] <= 0 for step in steps):
+        config.logger.info("play_sequence() - the PWM frequencies must be more than 0 Hz")
+        return None
+    if output == 'pwm':
+        output_ch = 'dig1'
+    sensor = config.device_dig_channel_dictionary[device_index].get(output_ch)
+    if sensor != dcu.OUTPUT_SENSORS[output]:
+        config.logger.info("play_sequence() - select_sensors() has not set " + output_ch + " to '" +
+                           dcu.OUTPUT_SENSORS[output] + "'")
+        return None
+
+    player = SequencePlayer(steps, device_index, output, output_ch, repeat, period)
+    config.sequence_players.append(player)
+    player.start()
+    return player
+
+def stop_sequence_players():
+    """ Stop every sequence player (LabQuest.stop() and close() do this)
+    """
+
+    for player in config.sequence_players:
+        player.stop()
+    config.sequence_players = []
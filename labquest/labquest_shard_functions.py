@@ -0,0 +1,373 @@
+import multiprocessing
+import os
+import pickle
+import time
+
+import numpy as np
+
+from labquest import config
+from labquest import labquest_init_functions as init
+from labquest import labquest_open_functions as open_functions
+from labquest import labquest_read_functions as read
+from labquest import labquest_shared_memory_functions as shared
+
+
+# The LabQuest methods a shard worker runs for the parent (the device argument is always 0 in
+# the worker, which has only its own device)
+SHARD_METHODS = ('select_sensors', 'sensor_info', 'enabled_sensor_info', 'start', 'restart', 'stop', 'dcu',
+                 'dcu_pwm_dig1')
+# A worker drains its channels every half sample period, but at least this often (s)
+SHARD_MAX_POLL_INTERVAL = 0.05
+# Seconds to wait for a worker to exit after close, before it is terminated
+SHARD_CLOSE_TIMEOUT = 5.0
+RING_CAPACITY = 1048576
+
+
+class ShardChannel:
+    """ The parent's end of one channel of a shard: the shared memory ring the worker writes the
+    calibrated data to, and the values taken from the ring that read() has not returned yet.
+    """
+
+    def __init__(self, name, sample_period):
+        # the worker was started by this process, so they share the resource tracker
+        self.reader = shared.RingReader(name, from_start=True, track=True)
+        self.sample_period = sample_period
+        self.times = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+
+    def fetch(self):
+        """ Move the new samples from the ring to the pending values. Returns how many are pending.
+        """
+
+        time_stamps, values = self.reader.read()
+        if values.size:
+            # copies: the ring's views are overwritten once the worker wraps around
+            self.times = np.concatenate((self.times, time_stamps))
+            self.values = np.concatenate((self.values, values))
+        return self.values.size
+
+    def wait(self, count, timeout):
+        """ Wait up to timeout seconds for count samples to be pending
+        """
+
+        end_time = time.perf_counter() + timeout
+        while self.fetch() < count and time.perf_counter() < end_time:
+            time.sleep(min(self.sample_period/10, 0.01) or 0.001)
+        return self.values.size
+
+    def take(self, count=None):
+        """ Remove and return (time_stamps, values) of the first count pending samples (all if None)
+        """
+
+        if count is None:
+            count = self.values.size
+        time_stamps, self.times = self.times[:count], self.times[count:]
+        values, self.values = self.values[:count], self.values[count:]
+        return time_stamps, values
+
+    def close(self):
+        self.reader.close()
+
+
+class DeviceShard:
+    """ A worker process that owns one device and runs its acquisition and calibration. Commands
+    go to the worker through a pipe, the data come back through a shared memory ring for each
+    channel. If the worker dies, only this device is lost: its reads return None.
+    """
+
+    def __init__(self, device_index, backend, prefix, context):
+        self.device_index = device_index
+        self.prefix = prefix + "_shard" + str(device_index)
+        self.channels = {}    # {'ch1':ShardChannel} of the channels started
+        self.failed = False
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=shard_worker, args=(worker_connection, device_index, backend, self.prefix),
+                                       name="labquest-shard" + str(device_index), daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+    def send(self, method, *args, **kwargs):
+        if self.failed:
+            return False
+        try:
+            self.connection.send((method, args, kwargs))
+        except (OSError, ValueError):
+            self.fail()
+            return False
+        return True
+
+    def receive(self):
+        """ The worker's reply to the last command sent, or None if the worker failed
+        """
+
+        if self.failed:
+            return None
+        try:
+            status, result = self.connection.recv()
+        except (EOFError, OSError):
+            self.fail()
+            return None
+        if status == 'error':
+            config.logger.info("Device " + str(self.device_index) + ": " + result)
+            return None
+        return result
+
+    def call(self, method, *args, **kwargs):
+        if not self.send(method, *args, **kwargs):
+            return None
+        return self.receive()
+
+    def attach(self, rings):
+        """ Attach to the rings the worker created when it started, {'ch1':(name, sample_period)}
+        """
+
+        self.close_channels()
+        for ch, (name, sample_period) in (rings or {}).items():
+            self.channels[ch] = ShardChannel(name, sample_period)
+
+    def fail(self):
+        """ The worker has died (or its pipe is broken). Log it, and drop its channels.
+        """
+
+        if self.failed:
+            return
+        self.failed = True
+        self.process.join(0.5)
+        config.logger.error("Device " + str(self.device_index) + ": the worker process exited (exit code " +
+                            str(self.process.exitcode) + "). The other devices carry on.")
+        names = [channel.reader.name for channel in self.channels.values()]
+        self.close_channels()
+        # the worker could not remove its rings
+        for name in names:
+            try:
+                memory = shared.attach_shared_memory(name, track=True)
+                memory.close()
+                memory.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close_channels(self):
+        for channel in self.channels.values():
+            channel.close()
+        self.channels = {}
+
+    def close(self):
+        self.close_channels()
+        if not self.failed:
+            self.call('close')
+        self.process.join(SHARD_CLOSE_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+
+class ShardedDevices:
+    """ The shards of a LabQuest opened with sharded=True, one per device. The LabQuest methods
+    call these with the same arguments.
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+
+    def shard(self, device_index):
+        if device_index >= len(self.shards):
+            config.logger.info("No device " + str(device_index))
+            return None
+        return self.shards[device_index]
+
+    def call(self, device_index, method, *args, **kwargs):
+        shard = self.shard(device_index)
+        if shard is None:
+            return None
+        return shard.call(method, *args, **kwargs)
+
+    def start(self, method='start', **kwargs):
+        """ Start (or restart) every device at the same time, then attach to the rings
+        """
+
+        recorder = kwargs.get('recorder')
+        if recorder is not None and not isinstance(recorder, str):
+            config.logger.info("start() - sharded devices record to a directory (one for each device), " +
+                               "the recorder is not used")
+            kwargs['recorder'] = recorder = None
+        sending = []
+        for shard in self.shards:
+            shard_kwargs = dict(kwargs)
+            if recorder is not None:
+                shard_kwargs['recorder'] = os.path.join(recorder, "dev" + str(shard.device_index))
+            if isinstance(kwargs.get('period'), dict):
+                shard_kwargs['period'] = shard_period(kwargs['period'], shard.device_index)
+            if shard.send(method, **shard_kwargs):
+                sending.append(shard)
+        for shard in sending:
+            shard.attach(shard.receive())
+
+    def stop(self, **kwargs):
+        sending = [shard for shard in self.shards if shard.send('stop', **kwargs)]
+        for shard in sending:
+            shard.receive()
+
+    def read(self, ch, device_index, count=None):
+        """ The next value (or the next count values) of a channel, waiting for them like read()
+        """
+
+        channel = self.channel(ch, device_index)
+        if channel is None:
+            return None
+        needed = 1 if count is None else count
+        # 3 sample periods, as read() waits, plus the time for a worker poll
+        timeout = channel.sample_period*(needed + 2) + 2*SHARD_MAX_POLL_INTERVAL
+        if channel.wait(needed, timeout) == 0:
+            shard = self.shards[device_index]
+            if not shard.process.is_alive():
+                shard.fail()
+            config.logger.debug("Timed Out - no measurements available to read")
+            return None
+        time_stamps, values = channel.take(needed)
+        if count is None:
+            return float(values[0])
+        return values.tolist()
+
+    def read_latest(self, ch, device_index):
+        """ The newest (time_stamp, value) of a channel, discarding the older values, like
+        read(mode='latest'). The sample age is not known here (it is the worker's).
+        """
+
+        channel = self.channel(ch, device_index)
+        if channel is None:
+            return None
+        if channel.fetch() == 0 and channel.wait(1, 3*channel.sample_period + 2*SHARD_MAX_POLL_INTERVAL) == 0:
+            config.logger.debug("Timed Out - no measurements available to read")
+            return None
+        time_stamps, values = channel.take()
+        read.record_latest_read(device_index, config.CHANNEL_NUMBERS[ch], int(time_stamps[-1]), None, values.size - 1)
+        return int(time_stamps[-1]), float(values[-1])
+
+    def read_all(self, device_index):
+        shard = self.shard(device_index)
+        if shard is None or shard.failed:
+            return None
+        packets = {}
+        for ch, channel in shard.channels.items():
+            channel.fetch()
+            packets[ch] = channel.take()
+        return packets
+
+    def channel(self, ch, device_index):
+        shard = self.shard(device_index)
+        if shard is None or shard.failed:
+            return None
+        channel = shard.channels.get(ch)
+        if channel is None:
+            config.logger.info("read() - " + str(ch) + " of device " + str(device_index) + " is not started")
+        return channel
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+
+
+def open_shards(backend, prefix=None):
+    """ Find the connected devices, and start a worker process for each one.
+
+    Args:
+        backend: None or 'ngio' (the NGIO library), 'simulated', or a function that returns the
+        library object (such as functools.partial(SimulatedNGIO, num_devices=4)). Each worker
+        calls it, so it must be picklable.
+
+    Returns:
+        ShardedDevices, or None if no device was found
+    """
+
+    try:
+        pickle.dumps(backend)
+    except Exception:
+        config.logger.error("open() - sharded devices need a backend that can be sent to the worker processes: " +
+                            "None, 'simulated', or a function that returns the library")
+        return None
+
+    init.load_ngio_library_get_version(backend)
+    device_type, number_of_devices = open_functions.count_labquest_devices()
+    if not number_of_devices:
+        return None
+
+    if prefix is None:
+        prefix = "labquest" + str(os.getpid())
+    context = multiprocessing.get_context('spawn')
+    shards = [DeviceShard(device_index, backend, prefix, context) for device_index in range(number_of_devices)]
+    # the first reply of each worker is whether it opened its device
+    opened = [shard.receive() for shard in shards]
+    config.logger.info("Sharded devices opened: " + str(opened.count(True)) + " of " + str(number_of_devices))
+    if not any(opened):
+        for shard in shards:
+            shard.close()
+        return None
+    return ShardedDevices(shards)
+
+def shard_period(period, device_index):
+    # the periods of one device, from a start(period={...}) keyed by channel or by (device, channel)
+    periods = {}
+    for key, value in period.items():
+        if isinstance(key, tuple):
+            if key[0] == device_index:
+                periods[key[1]] = value
+        else:
+            periods[key] = value
+    return periods
+
+def shard_worker(connection, device_number, backend, prefix):
+    """ The worker process of one device: open it, run the commands from the parent, and while
+    the measurements run, drain and calibrate every channel into its shared memory ring.
+    """
+
+    from labquest import LabQuest
+    from labquest import labquest_subscriber_functions as subscriber
+    from labquest import labquest_start_functions as start
+
+    lq = LabQuest(backend=backend)
+    with config.use_session(lq.session):
+        lq.load_library()
+        opened = open_functions.open_labquest_devices(device_number) != "no_device"
+        connection.send(('ok', opened))
+        if not opened:
+            lq.close()
+            return
+
+        channels = []
+        poll_interval = None
+        try:
+            while True:
+                if connection.poll(poll_interval):
+                    method, args, kwargs = connection.recv()
+                    if method == 'close':
+                        connection.send(('ok', None))
+                        break
+                    if method not in SHARD_METHODS:
+                        connection.send(('error', "unknown method " + str(method)))
+                        continue
+                    if method == 'stop':
+                        # the parent reads everything collected before the stop
+                        for device_index, channel, key_value in channels:
+                            read.read_available_packet(device_index, channel, key_value)
+                        channels = []
+                        poll_interval = None
+                    try:
+                        result = getattr(lq, method)(*args, **kwargs)
+                    except Exception as error:
+                        connection.send(('error', method + "() failed: " + repr(error)))
+                        continue
+                    if method in ('start', 'restart') and config.acquiring:
+                        names = lq.share(prefix, RING_CAPACITY)
+                        result = {ch:(name, start.output_period(device_index, config.CHANNEL_NUMBERS[ch]))
+                                  for (device_index, ch), name in names.items()}
+                        channels = subscriber.acquisition_channels()
+                        poll_interval = min(max(config.sample_period*config.oversample/2, 0.001), SHARD_MAX_POLL_INTERVAL)
+                    connection.send(('ok', result))
+                for device_index, channel, key_value in channels:
+                    read.read_available_packet(device_index, channel, key_value)
+        except (EOFError, OSError):
+            pass    # the parent has gone
+        finally:
+            lq.close()
@@ -0,0 +1,245 @@
+from multiprocessing import shared_memory
+import struct
+import sys
+
+import numpy as np
+
+from labquest import config
+from labquest import labquest_start_functions as start
+
+
+# Each ring is one shared memory block: a header, then capacity time stamps (int64, microseconds),
+# then capacity calibrated values (float64). Sample n is stored at position n % capacity. The
+# header has two counters, as in a seqlock: the write sequence (the total number of samples once
+# the packet being written is complete) is updated before the samples are copied, and the
+# sequence (the total number of samples written) after them. A reader never reads past the
+# sequence, so it never sees a sample that is not complete, and it checks the samples it copied
+# against the write sequence, so it sees if the writer was overwriting them at the same time.
+RING_MAGIC = b'LQRING02'
+RING_HEADER = struct.Struct('<8sQQiidQ')    # magic, capacity, sequence, device, channel, sample period (s), write sequence
+RING_HEADER_SIZE = 64
+SEQUENCE_OFFSET = 16
+WRITE_SEQUENCE_OFFSET = 40
+
+
+class SharedRing:
+    """ The writing end of a channel's shared memory ring. Used as a packet sink by the process
+    that owns the LabQuest.
+    """
+
+    def __init__(self, name, device_index, channel, capacity=1048576):
+        self.name = name
+        self.device_index = device_index
+        self.channel = channel
+        self.capacity = capacity
+        size = RING_HEADER_SIZE + capacity*16
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # another process may be sharing with the same prefix, so the block is not removed
+            raise FileExistsError("Shared memory " + name + " already exists: it is in use by another process, " +
+                                  "or was not closed. Use another prefix in share()") from None
+        self.sequence = 0
+        self.times, self.values = ring_arrays(self.memory, capacity)
+        RING_HEADER.pack_into(self.memory.buf, 0, RING_MAGIC, capacity, 0, device_index, channel,
+                              start.output_period(device_index, channel) if config.sample_period else 0.0, 0)
+
+    def write(self, time_stamps, values):
+        """ Publish the write sequence, copy a packet into the ring, then publish the new sequence
+        """
+
+        time_stamps = np.asarray(time_stamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if values.size > self.capacity:
+            self.sequence += values.size - self.capacity
+            time_stamps = time_stamps[-self.capacity:]
+            values = values[-self.capacity:]
+
+        struct.pack_into('<Q', self.memory.buf, WRITE_SEQUENCE_OFFSET, self.sequence + values.size)
+        start = self.sequence % self.capacity
+        first = min(values.size, self.capacity - start)
+        self.times[start:start + first] = time_stamps[:first]
+        self.values[start:start + first] = values[:first]
+        # wrap around to the start of the ring
+        self.times[:values.size - first] = time_stamps[first:]
+        self.values[:values.size - first] = values[first:]
+
+        self.sequence += values.size
+        struct.pack_into('<Q', self.memory.buf, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        self.times = None
+        self.values = None
+        self.memory.close()
+        self.memory.unlink()
+
+
+class RingReader:
+    """ The reading end of a shared memory ring, for any process. Each reader has its own cursor.
+
+    Args:
+        name (str): the name of the ring, as returned by LabQuest.share()
+
+        from_start (bool): if True, start with the oldest sample still in the ring, otherwise
+        only read samples written after attaching.
+
+        track (bool): as in attach_shared_memory()
+    """
+
+    def __init__(self, name, from_start=False, track=False):
+        self.name = name
+        self.memory = attach_shared_memory(name, track)
+        magic, capacity, sequence, device_index, channel, sample_period, write_sequence = RING_HEADER.unpack_from(self.memory.buf, 0)
+        if magic != RING_MAGIC:
+            self.memory.close()
+            raise ValueError(name + " is not a labquest shared memory ring")
+        self.capacity = capacity
+        self.device_index = device_index
+        self.channel = channel
+        self.sample_period = sample_period
+        self.times, self.values = ring_arrays(self.memory, capacity)
+        self.times.flags.writeable = False
+        self.values.flags.writeable = False
+        self.cursor = max(sequence - capacity, 0) if from_start else sequence
+        self.overruns = 0    # number of times the writer overwrote samples before they were read
+        self.lost = 0    # number of samples overwritten before they were read
+
+    @property
+    def sequence(self):
+        """ Total number of samples the writer has published
+        """
+
+        return struct.unpack_from('<Q', self.memory.buf, SEQUENCE_OFFSET)[0]
+
+    @property
+    def write_sequence(self):
+        """ Total number of samples once the writer's current packet is complete. The samples before
+        write_sequence - capacity may be being overwritten.
+        """
+
+        return struct.unpack_from('<Q', self.memory.buf, WRITE_SEQUENCE_OFFSET)[0]
+
+    def available(self):
+        return self.sequence - self.cursor
+
+    def read(self, max_count=None):
+        """ Return the time stamps and values written since the last read, and move the cursor.
+        When the samples do not wrap around the end of the ring, the arrays are read-only views of
+        the shared memory (no copy). The writer may overwrite them once it has written another
+        capacity samples; call overrun_since() to check a view that was kept for a while.
+
+        If the writer got more than capacity samples ahead, the overwritten samples are skipped,
+        and counted in overruns and lost.
+        """
+
+        sequence = self.sequence
+        if sequence - self.cursor > self.capacity:
+            self.overruns += 1
+            self.lost += sequence - self.capacity - self.cursor
+            self.cursor = sequence - self.capacity
+        count = sequence - self.cursor
+        if max_count is not None:
+            count = min(count, max_count)
+
+        start = self.cursor % self.capacity
+        if start + count <= self.capacity:
+            time_stamps = self.times[start:start + count]
+            values = self.values[start:start + count]
+        else:
+            first = self.capacity - start
+            time_stamps = np.concatenate((self.times[start:], self.times[:count - first]))
+            values = np.concatenate((self.values[start:], self.values[:count - first]))
+        first_sequence = self.cursor
+        self.cursor += count
+
+        # samples the writer overwrote, or started to overwrite, while they were being read are
+        # not returned
+        overwritten = self.write_sequence - self.capacity - first_sequence
+        if overwritten > 0:
+            self.overruns += 1
+            self.lost += min(overwritten, count)
+            time_stamps = time_stamps[overwritten:]
+            values = values[overwritten:]
+
+        return time_stamps, values
+
+    def overrun_since(self, sequence):
+        """ True if the sample with this sequence number has been (or is being) overwritten
+        """
+
+        return self.write_sequence - self.capacity > sequence
+
+    def close(self):
+        self.times = None
+        self.values = None
+        self.memory.close()
+
+
+def ring_arrays(memory, capacity):
+    """ numpy views of the time stamps and values in a ring's shared memory
+    """
+
+    times = np.ndarray((capacity,), dtype=np.int64, buffer=memory.buf, offset=RING_HEADER_SIZE)
+    values = np.ndarray((capacity,), dtype=np.float64, buffer=memory.buf, offset=RING_HEADER_SIZE + capacity*8)
+    return times, values
+
+def attach_shared_memory(name, track=False):
+    """ Attach to an existing shared memory block without taking ownership of it. (Before Python
+    3.13, the resource tracker of the attaching process would otherwise remove the block when that
+    process exits.) A process started by the writer with multiprocessing shares the writer's
+    resource tracker, and attaches with track=True so that the writer's registration is kept.
+    """
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=track)
+    memory = shared_memory.SharedMemory(name=name)
+    if sys.platform != 'win32' and not track:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(memory._name, 'shared_memory')
+    return memory
+
+def ring_name(prefix, device_index, channel):
+    ch = config.CHANNEL_NAMES[channel]
+    return prefix + "_dev" + str(device_index) + "_" + ch
+
+def share_channels(prefix='labquest', capacity=1048576):
+    """ Create a shared memory ring for every enabled channel, and publish every packet to it.
+    Raises FileExistsError (and shares nothing) if one of the names is already in use.
+
+    Returns:
+        names (dict): {(device_index, 'ch1'):ring name, ...}
+    """
+
+    unshare_channels()
+    names = {}
+    try:
+        for device_index, device_enabled_chs in enumerate(config.enabled_all_channels):
+            for channel in device_enabled_chs:
+                name = ring_name(prefix, device_index, channel)
+                config.shared_rings[(device_index, channel)] = SharedRing(name, device_index, channel, capacity)
+                names[(device_index, name.rsplit('_', 1)[1])] = name
+    except FileExistsError:
+        unshare_channels()
+        raise
+    if config.shared_rings and write_shared_rings not in config.packet_sinks:
+        config.packet_sinks.append(write_shared_rings)
+    config.logger.info("Shared memory rings: " + str(list(names.values())))
+    return names
+
+def write_shared_rings(device_index, channel, time_stamps, values):
+    """ Packet sink that writes each packet to its channel's ring
+    """
+
+    ring = config.shared_rings.get((device_index, channel))
+    if ring is not None:
+        ring.write(time_stamps, values)
+
+def unshare_channels():
+    """ Remove the shared memory rings
+    """
+
+    if write_shared_rings in config.packet_sinks:
+        config.packet_sinks.remove(write_shared_rings)
+    for ring in config.shared_rings.values():
+        ring.close()
+    config.shared_rings = {}
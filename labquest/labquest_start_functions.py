@@ -1,18 +1,22 @@
+from time import perf_counter
+
 from labquest import config
 from labquest import ngio_start_functions as ngio_start
 from labquest import ngio_send_cmd_get_resp as ngio_send
+from labquest import labquest_device_io_functions as device_io
 
 
-def configure_channels_to_start(period, reset_dig_counter):
+def configure_channels_to_start(period, reset_dig_counter, channel_periods=None):
     """
     Prior to starting data collection, there are a few steps that need to happen, depending
     on what sensors are connected: Configure analog channel as 5V or 10V, set the mask value, 
     set the digital sampling mode, reset the digital counter, and configure io lines as output, 
-    as needed.
+    as needed. channel_periods are the hardware periods of channels that are sampled slower
+    than period ({(device_index, channel):seconds}).
     """
 
     config.sample_period = period
-    set_the_sampling_period()
+    set_the_sampling_period(channel_periods)
 
     # Set the analog input value. Configure as a 5V channel or a 10V channel
     if any(config.enabled_analog_channels):
@@ -40,20 +44,92 @@ def configure_channels_to_start(period, reset_dig_counter):
         if config.dcu or config.dcu_pwm:
             set_dig_io_lines_as_outputs()
 
-def set_the_sampling_period():
-    """ Set the sampling period for all channels
+def set_the_sampling_period(channel_periods=None):
+    """ Set the sampling period for all channels. Channels with their own (slower) period get it
+    from the device if the device keeps a period for each channel, otherwise every channel is
+    sampled at the fastest period and the slower channels keep one value for every N samples
+    (see set_period_factors()).
     """
 
-    for hDevice in config.hDevice:
+    config.channel_periods = {}
+    config.period_factors = {}
+    for device_index, hDevice in enumerate(config.hDevice):
         # set the measurment period for all channels = -1
         channel = -1
         # note that the period is the desired measurement period in seconds
         ngio_start.set_measurement_period(hDevice, channel, config.sample_period)
         sampling_rate = 1/float(ngio_start.get_measurement_period(hDevice, channel))
 
+        device_periods = {channel:period for (device_index_, channel), period in (channel_periods or {}).items()
+                          if device_index_ == device_index and period != config.sample_period}
+        if device_periods:
+            for channel, period in device_periods.items():
+                ngio_start.set_measurement_period(hDevice, channel, period)
+            # the device keeps a period for each channel only if every channel reads back its own
+            if all(abs(float(ngio_start.get_measurement_period(hDevice, channel)) -
+                       device_periods.get(channel, config.sample_period)) < 0.000001
+                   for channel in config.enabled_all_channels[device_index]):
+                for channel, period in device_periods.items():
+                    config.channel_periods[(device_index, channel)] = period
+                    config.logger.info("Measurment period ch" + str(channel) + ":" + str(period) + " seconds/sample")
+            else:
+                ngio_start.set_measurement_period(hDevice, -1, config.sample_period)
+                set_period_factors(device_index, device_periods)
+
     config.logger.info("Measurment period:" + str(config.sample_period) + " seconds/sample") 
     config.logger.info("Sampling rate:" + str(sampling_rate) + " samples/sec")
 
+def set_period_factors(device_index, device_periods):
+    """ For a device that samples every channel at the same period: keep one value for every N
+    samples of each slower channel (the oversamplers average the N raw counts of an analog channel)
+    """
+
+    for channel, period in device_periods.items():
+        factor = max(int(round(period/config.sample_period)), 1)
+        if factor == 1:
+            continue
+        if channel in (5, 6) and config.device_dig_channel_dictionary[device_index].get(
+                config.CHANNEL_NAMES[channel]) == 'motion':
+            config.logger.info("start() - the motion detector is sampled at the fastest period, " + 
+                               str(config.sample_period) + " seconds/sample")
+            continue
+        config.period_factors[(device_index, channel)] = factor
+        config.logger.info("Measurment period ch" + str(channel) + ":" + str(factor*config.sample_period) + 
+                           " seconds/sample (1 of every " + str(factor) + " samples)")
+
+def channel_period(device_index, channel):
+    """ The hardware sample period (s) of a channel
+    """
+
+    return config.channel_periods.get((device_index, channel), config.sample_period)
+
+def output_period(device_index, channel):
+    """ The period (s) of the values of a channel, after oversampling (and the period factor of a
+    channel sampled slower than the device). Decimation is not included.
+    """
+
+    oversampler = config.oversamplers.get((device_index, channel))
+    return channel_period(device_index, channel)*(oversampler.factor if oversampler is not None else 1)
+
+def hardware_periods(periods, oversample=1):
+    """ Convert the periods given to start() ({'ch1':ms} for every device, or {(device, 'ch1'):ms})
+    to {(device_index, channel):seconds} of the enabled channels, for the hardware (oversample
+    times faster)
+    """
+
+    channel_periods = {}
+    # a period for one device's channel takes the place of the period for that channel on every device
+    for key, period in sorted(periods.items(), key=lambda item: isinstance(item[0], tuple)):
+        device_index, ch = key if isinstance(key, tuple) else (None, key)
+        channel = config.CHANNEL_NUMBERS.get(ch)
+        if channel is None:
+            config.logger.info("start() - unknown channel: " + str(ch))
+            continue
+        for device_index_, device_enabled_chs in enumerate(config.enabled_all_channels):
+            if (device_index is None or device_index == device_index_) and channel in device_enabled_chs:
+                channel_periods[(device_index_, channel)] = period/1000/oversample
+    return channel_periods
+
 def configure_channels_as_5V_or_10V():
     """ Configure each active analog channel as a 5V channel or a 10V channel
     """
@@ -216,11 +292,20 @@ def set_dig_io_lines_as_outputs():
             
 
 def start_measurements():
-    """ Send the Start Measurements command
+    """ Send the Start Measurements command. With more than one device the commands are sent at
+    the same time, on the device executors, so the devices start together.
     """
 
-    for hDevice in config.hDevice:
-        parameters = [0]*14    # the ngio function is expecting up to 14 values in the parameters
-        command = 0x18    #define NGIO_CMD_ID_START_MEASUREMENTS 0x18
-        param_bytes = 0
-        ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
+    config.start_times = device_io.call_each_device(start_device)
+
+def start_device(hDevice):
+    """ Send the Start Measurements command to one device. Returns the perf_counter() time the
+    device's time stamps count from.
+    """
+
+    parameters = [0]*14    # the ngio function is expecting up to 14 values in the parameters
+    command = 0x18    #define NGIO_CMD_ID_START_MEASUREMENTS 0x18
+    param_bytes = 0
+    ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
+    # the time stamps of this device count from here
+    return perf_counter()
@@ -0,0 +1,260 @@
+from collections import deque
+import math
+
+import numpy as np
+
+from labquest import config
+
+
+class RunningStatistics:
+    """ Count, mean, variance, min and max of every value since start(), updated one packet at
+    a time (Welford's algorithm, with Chan's formula to merge a whole packet in one step).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.nan
+        self.max = math.nan
+        self.first_time = None
+        self.first_value = None
+        self.last_time = None
+        self.last_value = None
+
+    def update(self, time_stamps, values):
+        count = values.size
+        if count == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean)**2).sum())
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta*count/total
+        self.m2 += m2 + delta*delta*self.count*count/total
+        if self.count == 0:
+            self.min = float(values.min())
+            self.max = float(values.max())
+            self.first_time = int(time_stamps[0])
+            self.first_value = float(values[0])
+        else:
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+        self.count = total
+        self.last_time = int(time_stamps[-1])
+        self.last_value = float(values[-1])
+
+    def as_dict(self):
+        return summary(self.count, self.mean, self.m2, self.min, self.max,
+                       self.first_time, self.first_value, self.last_time, self.last_value)
+
+
+class RollingWindow:
+    """ Mean, variance, min and max of the last size values. The sums are updated as values enter
+    and leave the window (and recalculated each time the window wraps, so rounding errors do not
+    build up), and the min and max are kept in monotonic queues, so each update and each query
+    costs O(1). The sums are of the values minus a shift (the window's mean when they were last
+    recalculated), so the variance keeps its precision when the offset is large compared to the
+    noise.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = np.zeros(size, dtype=np.float64)
+        self.times = np.zeros(size, dtype=np.int64)
+        self.count = 0    # number of values seen
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.shift = 0.0    # subtracted from the values in the sums
+        self._min = deque()    # (index, value), values increasing
+        self._max = deque()    # (index, value), values decreasing
+
+    def update(self, time_stamps, values):
+        if values.size == 0:
+            return
+        if self.count == 0:
+            self.shift = float(values[0])
+        # only the last size values of a packet can be in the window
+        if values.size > self.size:
+            skipped = values.size - self.size
+            time_stamps = time_stamps[skipped:]
+            values = values[skipped:]
+            self.count += skipped
+            self._min.clear()
+            self._max.clear()
+
+        start = self.count
+        positions = np.arange(start, start + values.size) % self.size
+        if start >= self.size:
+            leaving = self.values[positions] - self.shift
+            self.total -= float(leaving.sum())
+            self.total_squares -= float((leaving*leaving).sum())
+        self.values[positions] = values
+        self.times[positions] = time_stamps
+        shifted = values - self.shift
+        self.total += float(shifted.sum())
+        self.total_squares += float((shifted*shifted).sum())
+
+        for index, value in enumerate(values.tolist(), start):
+            while self._min and self._min[-1][1] >= value:
+                self._min.pop()
+            self._min.append((index, value))
+            while self._max and self._max[-1][1] <= value:
+                self._max.pop()
+            self._max.append((index, value))
+        self.count = start + values.size
+
+        oldest = self.count - self.size
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+
+        # recalculate the sums once per trip around the window
+        if self.count//self.size != start//self.size:
+            window = self.values if self.count >= self.size else self.values[:self.count]
+            self.shift = float(window.mean())
+            shifted = window - self.shift
+            self.total = float(shifted.sum())
+            self.total_squares = float((shifted*shifted).sum())
+
+    def as_dict(self):
+        count = min(self.count, self.size)
+        if count == 0:
+            return summary(0, 0.0, 0.0, math.nan, math.nan, None, None, None, None)
+        shifted_mean = self.total/count
+        mean = self.shift + shifted_mean
+        m2 = max(self.total_squares - count*shifted_mean*shifted_mean, 0.0)
+        first = (self.count - count) % self.size
+        last = (self.count - 1) % self.size
+        return summary(count, mean, m2, self._min[0][1], self._max[0][1],
+                       int(self.times[first]), float(self.values[first]),
+                       int(self.times[last]), float(self.values[last]))
+
+
+class History:
+    """ The last size values and time stamps of a channel
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = np.zeros(size, dtype=np.float64)
+        self.times = np.zeros(size, dtype=np.int64)
+        self.count = 0
+
+    def update(self, time_stamps, values):
+        if values.size > self.size:
+            self.count += values.size - self.size
+            time_stamps = time_stamps[-self.size:]
+            values = values[-self.size:]
+        positions = np.arange(self.count, self.count + values.size) % self.size
+        self.values[positions] = values
+        self.times[positions] = time_stamps
+        self.count += values.size
+
+    def last(self, count):
+        """ The last count time stamps and values (oldest first)
+        """
+
+        count = min(count, self.count, self.size)
+        positions = np.arange(self.count - count, self.count) % self.size
+        return self.times[positions], self.values[positions]
+
+
+class ChannelStatistics:
+    """ The running statistics of one channel, and a history of its last values that a new
+    rolling window is filled from.
+    """
+
+    def __init__(self, history):
+        self.running = RunningStatistics()
+        self.history = History(history)
+        self.windows = {}    # {size:RollingWindow}
+
+    def update(self, time_stamps, values):
+        self.running.update(time_stamps, values)
+        self.history.update(time_stamps, values)
+        for window in self.windows.values():
+            window.update(time_stamps, values)
+
+    def get_window(self, size):
+        window = self.windows.get(size)
+        if window is None:
+            # start the window with the values already seen (only once, when it is first asked for)
+            window = RollingWindow(size)
+            window.update(*self.history.last(size))
+            self.windows[size] = window
+        return window
+
+
+class StatisticsSink:
+    """ Packet sink that keeps the statistics of every channel that is read.
+
+    Args:
+        history (int): number of recent values kept for filling new rolling windows. This is
+        also the largest window that starts out full.
+    """
+
+    def __init__(self, history=100000):
+        self.history = history
+        self.channels = {}    # {(device_index, channel):ChannelStatistics}
+
+    def __call__(self, device_index, channel, time_stamps, values):
+        channel_statistics = self.channels.get((device_index, channel))
+        if channel_statistics is None:
+            channel_statistics = ChannelStatistics(self.history)
+            self.channels[(device_index, channel)] = channel_statistics
+        channel_statistics.update(np.asarray(time_stamps, dtype=np.int64), np.asarray(values, dtype=np.float64))
+
+    def reset(self):
+        self.channels = {}
+
+
+def summary(count, mean, m2, minimum, maximum, first_time, first_value, last_time, last_value):
+    """ The dictionary returned by get_statistics(). The rate of change is the change from the
+    first to the last value, per second.
+    """
+
+    if count > 1 and last_time != first_time:
+        rate = (last_value - first_value)/((last_time - first_time)/1000000)
+    else:
+        rate = math.nan
+    return {"count":count, "mean":mean if count else math.nan,
+            "std":math.sqrt(m2/(count - 1)) if count > 1 else math.nan,
+            "min":minimum, "max":maximum, "rate":rate, "last":last_value,
+            "time":last_time/1000000 if last_time is not None else None}
+
+def enable_statistics(history=100000):
+    """ Add a StatisticsSink to the packet sinks (once)
+    """
+
+    if config.statistics is None:
+        config.statistics = StatisticsSink(history)
+        config.packet_sinks.append(config.statistics)
+        config.logger.info("Channel statistics enabled")
+    return config.statistics
+
+def get_statistics(device_index, ch, window=None):
+    """ Statistics of a channel, either since start() (window=None) or of its last window values.
+    The first request for a window size starts that window from the history, after that the
+    window is updated with each packet. The statistics are kept from start() when it was called
+    with stats=True, otherwise from the first of these calls.
+
+    Returns:
+        statistics (dict): {"count", "mean", "std", "min", "max", "rate" (units/s), "last",
+        "time" (s, of the last value)}
+    """
+
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("stats() - unknown channel: " + str(ch))
+        return None
+    sink = enable_statistics()
+    channel_statistics = sink.channels.get((device_index, channel))
+    if channel_statistics is None:
+        channel_statistics = ChannelStatistics(sink.history)
+        sink.channels[(device_index, channel)] = channel_statistics
+
+    if window is None:
+        return channel_statistics.running.as_dict()
+    return channel_statistics.get_window(int(window)).as_dict()
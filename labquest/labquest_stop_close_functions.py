@@ -1,35 +1,55 @@
-from time import sleep
-
 from labquest import config
 from labquest import ngio_stop_functions as ngio_stop
 from labquest import ngio_send_cmd_get_resp as ngio_send
 from labquest import labquest_read_functions as read
 from labquest import labquest_buffer_functions as buffer
-buf = buffer.lq_buffer()
+from labquest import labquest_device_io_functions as device_io
 
 
 def stop_measurements_clear_buffer():
     """ Stop data collection and clear both the NGIO buffer and the buffer (queue)
     """
 
-    # Stop the measurements
-    for hDevice in config.hDevice:
-        parameters = [0]*14
-        command = 0x19   #STOP MEASUREMENTS = 19
-        param_bytes = 0
-        ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)       
+    # Stop the measurements (on every device at the same time)
+    device_io.call_each_device(stop_device)
 
-    # Clear the NGIO measurement buffer by reading any values remaining
-    sleep(1)
+    # Clear the NGIO measurement buffer by reading any values remaining (and any still arriving)
     read.clear_the_lq_measurement_buffer()
 
     # Clear the buffer
-    buf.buffer_clear()
+    buffer.session_buffer().buffer_clear()
+
+def stop_device(hDevice):
+    """ Send the Stop Measurements command to one device
+    """
+
+    parameters = [0]*14
+    command = 0x19   #STOP MEASUREMENTS = 19
+    param_bytes = 0
+    ngio_send.send_cmd_get_response(hDevice, command, parameters, param_bytes)
 
 def close():
-    """ Close any LabQuest handles, call NGIO Uninit, and reset the variables in the config file
+    """ Close any LabQuest handles, call NGIO Uninit, and reset the variables in the session
     """
 
+    # stop the acquisition loop and the subscriber threads before the handles are closed,
+    # they may still be reading the devices
+    if config.acquisition_loop is not None:
+        config.acquisition_loop.stop()
+    for subscription in config.subscriptions:
+        subscription.close()
+
+    # remove the shared memory rings
+    for ring in config.shared_rings.values():
+        ring.close()
+
+    # finish a recording that was not closed by stop()
+    if config.recorder is not None:
+        config.recorder.close()
+
+    # stop the device executors' threads
+    device_io.shutdown_executors()
+
     # if no devices, no device handle, or no sensors then do not try to close
     if not config.device_type or not config.hDevice or not any(config.enabled_all_channels):
         pass
@@ -38,32 +58,11 @@ def close():
         for hDevice in config.hDevice:
             closed = ngio_stop.device_close(hDevice) 
 
-    # Call NGIO_Uninit() once to 'undo' NGIO_Init()
-    ngio_stop.ngio_uninit()  
-
-    # clear all the variables in the config.py file   
-    config.logger = None 
-    config.dll = None   
-    config.hLib = None   
-    config.hDevice = []    
-    config.device_type = None    
-    config.auto_id_list = []
-    config.enabled_analog_channels = []  
-    config.enabled_dig_channels = []    
-    config.enabled_all_channels = [] 
-    config.channel_name_list = []   
-    config.motion = False    
-    config.photogate = False   
-    config.photogate_timing = False
-    config.rotary_motion = False  
-    config.rotary_motion_high_res = False 
-    config.dcu = False  
-    config.dcu_pwm = False
-    config.sample_period = None
-    config.op_type_list = []   
-    config.probe_type_list = []
-    config.sensor_cal_list = []   
-    config.device_dig_channel_dictionary = []   
-    config.device_channel_dictionary = []
+    # Call NGIO_Uninit() once to 'undo' NGIO_Init(). The library is not loaded until the first open()
+    if config.dll is not None:
+        ngio_stop.ngio_uninit()  
+
+    # clear all the variables of this LabQuest's session (see config.Session)
+    config.current_session().reset()
 
 
@@ -0,0 +1,303 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from labquest import config
+from labquest import labquest_read_functions as read
+
+
+class Subscription:
+    """ A consumer of one channel's data. Batches of time stamps (microseconds) and calibrated values
+    are delivered as read-only numpy arrays, either to a callback, callback(time_stamps, values), that
+    runs on the subscription's own thread, or to a queue as (time_stamps, values) tuples.
+
+    A batch is delivered when it has batch_size values, or when its first value has waited max_latency
+    seconds. If the consumer falls more than max_pending batches behind, new batches are dropped (and
+    counted) instead of holding up the acquisition or the other subscribers.
+    """
+
+    def __init__(self, device_index, channel, callback=None, queue_=None, batch_size=1, max_latency=0.1,
+                 max_pending=100):
+        self.device_index = device_index
+        self.channel = channel
+        self.callback = callback
+        self.batch_size = max(int(batch_size), 1)
+        self.max_latency = max_latency
+        self.delivered = 0    # batches delivered
+        self.dropped = 0    # batches dropped because the consumer was behind
+        self.dropped_values = 0
+        self.errors = 0    # exceptions raised by the callback
+        self._times = []
+        self._values = []
+        self._pending_count = 0
+        self._pending_since = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if callback is not None:
+            self.queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=config.in_current_session(self._call_back), name="labquest-subscriber", daemon=True)
+            self._thread.start()
+        elif queue_ is not None:
+            self.queue = queue_
+        else:
+            self.queue = queue.Queue(maxsize=max_pending)
+
+    def offer(self, time_stamps, values):
+        """ Add a packet, and deliver the batches that are complete
+        """
+
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = time.perf_counter()
+            self._times.append(time_stamps)
+            self._values.append(values)
+            self._pending_count += values.size
+            while self._pending_count >= self.batch_size:
+                self._deliver(self.batch_size)
+
+    def flush(self, now=None, force=False):
+        """ Deliver the waiting values if the oldest has waited max_latency (or if force)
+        """
+
+        with self._lock:
+            if not self._pending_count:
+                return
+            if now is None:
+                now = time.perf_counter()
+            if force or now - self._pending_since >= self.max_latency:
+                self._deliver(self._pending_count)
+
+    def close(self):
+        """ Deliver what is waiting and stop the callback thread
+        """
+
+        self.flush(force=True)
+        if self._thread is not None:
+            # the thread exits once it reaches the sentinel, after the batches before it
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _deliver(self, count):
+        time_stamps = _take(self._times, count)
+        values = _take(self._values, count)
+        self._pending_count -= count
+        self._pending_since = time.perf_counter() if self._pending_count else None
+        try:
+            self.queue.put_nowait((time_stamps, values))
+            self.delivered += 1
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_values += count
+
+    def _call_back(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            try:
+                self.callback(*batch)
+            except Exception as error:
+                self.errors += 1
+                config.logger.info("Subscriber callback failed: %s", error)
+
+    def as_dict(self):
+        return {"device":self.device_index, "channel":self.channel, "delivered":self.delivered,
+                "dropped":self.dropped, "dropped_values":self.dropped_values, "errors":self.errors}
+
+
+class AcquisitionLoop:
+    """ A thread that drains the NGIO measurement buffers of the channels that have subscribers,
+    once, and publishes each packet to the packet sinks (the subscribers, and any recorder,
+    statistics or trigger). The other channels are left for read().
+
+    Args:
+        poll_interval (float): seconds between polls. If None, half of the sample period
+        (between 1 ms and 50 ms).
+    """
+
+    def __init__(self, poll_interval=None):
+        if poll_interval is None:
+            poll_interval = min(max(config.sample_period*config.oversample/2, 0.001), 0.05)
+        self.poll_interval = poll_interval
+        self.iterations = 0
+        self.channels = set()    # {(device_index, channel)} drained by the last iteration
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=config.in_current_session(self._run), name="labquest-acquisition", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            # a subscription can be added or removed while the loop runs
+            channels = subscribed_channels()
+            self.channels = {(device_index, channel) for device_index, channel, key_value in channels}
+            for device_index, channel, key_value in channels:
+                try:
+                    drain_channel(device_index, channel, key_value)
+                except Exception as error:    # keep the other channels going
+                    config.logger.info("Acquisition loop: %s", error)
+            now = time.perf_counter()
+            for subscription in list(config.subscriptions):
+                subscription.flush(now)
+            self.iterations += 1
+            self._stop.wait(self.poll_interval)
+
+
+def acquisition_channels():
+    """ [(device_index, channel, sensor)] of the channels the acquisition loop drains. The sensor
+    is None for analog channels, otherwise 'motion', 'rotary_motion', etc..
+    """
+
+    channels = []
+    for device_index, hDevice in enumerate(config.hDevice):
+        if device_index < len(config.enabled_all_channels):
+            device_enabled_chs = config.enabled_all_channels[device_index]
+        else:
+            device_enabled_chs = []
+        for channel in device_enabled_chs:
+            if channel in (1, 2, 3):
+                channels.append((device_index, channel, None))
+                continue
+            key_value = config.device_dig_channel_dictionary[device_index].get(config.CHANNEL_NAMES[channel])
+            if key_value in ('motion', 'rotary_motion', 'rotary_motion_high_res', 'photogate_count'):
+                channels.append((device_index, channel, key_value))
+    return channels
+
+def subscribed_channels():
+    """ The acquisition_channels() that have at least one subscriber
+    """
+
+    subscribed = {(subscription.device_index, subscription.channel) for subscription in config.subscriptions}
+    return [(device_index, channel, key_value) for device_index, channel, key_value in acquisition_channels()
+            if (device_index, channel) in subscribed]
+
+def drain_channel(device_index, channel, key_value):
+    """ Read everything available on one channel and publish it
+    """
+
+    read.read_available_packet(device_index, channel, key_value)
+
+def dispatch_packet(device_index, channel, time_stamps, values):
+    """ Packet sink that offers each packet to the subscribers of its channel. The subscribers share
+    one read-only copy of the packet.
+    """
+
+    subscriptions = [subscription for subscription in config.subscriptions
+                     if subscription.device_index == device_index and subscription.channel == channel]
+    if not subscriptions:
+        return
+    time_stamps = np.array(time_stamps, dtype=np.int64)
+    values = np.array(values, dtype=np.float64)
+    time_stamps.flags.writeable = False
+    values.flags.writeable = False
+    for subscription in subscriptions:
+        subscription.offer(time_stamps, values)
+
+def keep_latest_sample(device_index, channel, time_stamps, values):
+    """ Packet sink that keeps the newest sample of each channel, and the number of values that
+    arrived since it was last taken, for the control loops (which can not read a channel that the
+    acquisition loop drains)
+    """
+
+    if values.size:
+        key = (device_index, channel)
+        previous = config.latest_samples.get(key)
+        count = values.size + (previous[2] if previous is not None else 0)
+        config.latest_samples[key] = (int(time_stamps[-1]), float(values[-1]), count)
+
+def take_latest_sample(device_index, channel):
+    """ The newest (time_stamp, value) kept by keep_latest_sample(), recorded as a
+    read(mode='latest'), or None if no value has arrived since the last one taken
+    """
+
+    sample = config.latest_samples.pop((device_index, channel), None)
+    if sample is None:
+        return None
+    time_stamp, value, count = sample
+    age = None
+    if device_index < len(config.start_times):
+        age = time.perf_counter() - config.start_times[device_index] - time_stamp/1000000
+    read.record_latest_read(device_index, channel, time_stamp, age, count - 1)
+    return time_stamp, value
+
+def subscribe(device_index, ch, callback=None, queue_=None, batch_size=1, max_latency=0.1, max_pending=100):
+    """ Add a subscription to a channel's data. The acquisition loop is started if measurements
+    are running.
+    """
+
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("subscribe() - unknown channel: " + str(ch))
+        return None
+
+    subscription = Subscription(device_index, channel, callback, queue_, batch_size, max_latency, max_pending)
+    config.subscriptions.append(subscription)
+    for sink in (dispatch_packet, keep_latest_sample):
+        if sink not in config.packet_sinks:
+            config.packet_sinks.append(sink)
+    if config.acquiring and config.acquisition_loop is None:
+        start_acquisition_loop()
+    return subscription
+
+def unsubscribe(subscription):
+    """ Remove a subscription. The batch that is waiting is delivered first.
+    """
+
+    if subscription in config.subscriptions:
+        config.subscriptions.remove(subscription)
+    subscription.close()
+    if not config.subscriptions:
+        stop_acquisition_loop()
+
+def start_acquisition_loop(poll_interval=None):
+    if config.acquisition_loop is None:
+        config.acquisition_loop = AcquisitionLoop(poll_interval)
+        config.acquisition_loop.start()
+        config.logger.info("Acquisition loop started")
+
+def stop_acquisition_loop():
+    """ Stop the acquisition loop, and deliver the batches that are waiting
+    """
+
+    if config.acquisition_loop is not None:
+        config.acquisition_loop.stop()
+        config.acquisition_loop = None
+        config.logger.info("Acquisition loop stopped")
+    for subscription in list(config.subscriptions):
+        subscription.flush(force=True)
+
+def _take(chunks, count):
+    """ Remove the first count values from a list of arrays and return them as one array
+    """
+
+    if chunks[0].size == count:
+        return chunks.pop(0)
+    taken = []
+    needed = count
+    while needed:
+        chunk = chunks[0]
+        if chunk.size <= needed:
+            taken.append(chunks.pop(0))
+            needed -= chunk.size
+        else:
+            taken.append(chunk[:needed])
+            chunks[0] = chunk[needed:]
+            needed = 0
+    if len(taken) == 1:
+        return taken[0]
+    batch = np.concatenate(taken)
+    batch.flags.writeable = False
+    return batch
@@ -0,0 +1,197 @@
+import numpy as np
+
+from labquest import config
+
+
+TRIGGER_CONDITIONS = ('level', 'rising', 'falling', 'window', 'change')
+
+
+class Trigger:
+    """ Watch one channel for an event, and keep only the data around each event: pre values
+    before the trigger (from a ring of the most recent values), the value that triggered, and post
+    values after it. The condition is evaluated on whole packets with numpy.
+
+    Conditions:
+        'level': the value is at or above level. Re-armed when the value drops below level - hysteresis.
+        'rising': the value rises through level, after being below level - hysteresis.
+        'falling': the value falls through level, after being above level + hysteresis.
+        'window': the value leaves the window from low to high. Re-armed when the value is back
+        inside the window by at least hysteresis.
+        'change': the value changes (for example a digital state on dig1 or dig2).
+
+    Args:
+        count (int): number of captures. The trigger re-arms after each capture until count
+        captures have been made. None re-arms forever.
+    """
+
+    def __init__(self, condition='rising', level=0.0, hysteresis=0.0, low=None, high=None,
+                 pre=100, post=100, count=1):
+        self.condition = condition
+        self.level = level
+        self.hysteresis = hysteresis
+        self.low = low
+        self.high = high
+        self.pre = int(pre)
+        self.post = int(post)
+        self.count = count
+        self.captures = []    # completed captures, see get_captures()
+        self.reset()
+
+    def reset(self):
+        """ Empty the pre-trigger ring and arm the trigger. Called by start().
+        """
+
+        self.armed = self.condition in ('level', 'window', 'change')
+        self.remaining = self.count
+        self._tail_times = np.empty(0, dtype=np.int64)
+        self._tail_values = np.empty(0, dtype=np.float64)
+        self._previous = None
+        self._pending = None    # [time chunks, value chunks, trigger index, trigger time, values still needed]
+
+    def process(self, time_stamps, values):
+        """ Look for events in a packet and build the captures
+        """
+
+        time_stamps = np.asarray(time_stamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+
+        arm_mask, fire_mask = self._masks(values)
+        arm_index = np.flatnonzero(arm_mask)
+        fire_index = np.flatnonzero(fire_mask)
+
+        # the ring and the packet together, so the pre-trigger data can reach into earlier packets
+        base = self._tail_values.size
+        all_times = np.concatenate((self._tail_times, time_stamps))
+        all_values = np.concatenate((self._tail_values, values))
+
+        i = 0
+        if self._pending is not None:
+            i = self._continue_capture(time_stamps, values)
+
+        while self._pending is None and self.remaining != 0 and i < values.size:
+            event = self._next_event(arm_index, fire_index, i)
+            if event < 0:
+                break
+            start = max(base + event - self.pre, 0)
+            end = base + event + self.post + 1
+            self._pending = [[all_times[start:end]], [all_values[start:end]], base + event - start,
+                             int(all_times[base + event]), max(end - all_values.size, 0)]
+            if self.remaining is not None:
+                self.remaining -= 1
+            i = event + self.post + 1
+            if self._pending[4] == 0:
+                self._finish_capture()
+
+        if self.pre:
+            self._tail_times = all_times[-self.pre:]
+            self._tail_values = all_values[-self.pre:]
+        self._previous = values[-1]
+
+    def _masks(self, values):
+        """ Boolean arrays of the values that arm the trigger and the values that fire it
+        """
+
+        if self.condition == 'change':
+            previous = values[0] if self._previous is None else self._previous
+            fire = values != np.concatenate(([previous], values[:-1]))
+            return np.ones(values.size, dtype=bool), fire
+        if self.condition == 'window':
+            fire = (values < self.low) | (values > self.high)
+            arm = (values >= self.low + self.hysteresis) & (values <= self.high - self.hysteresis)
+            return arm, fire
+        if self.condition == 'falling':
+            return values > self.level + self.hysteresis, values <= self.level
+        # level and rising
+        if self.hysteresis:
+            arm = values < self.level - self.hysteresis
+        else:
+            arm = values < self.level
+        return arm, values >= self.level
+
+    def _next_event(self, arm_index, fire_index, start):
+        """ Index of the next value (from start) that fires the trigger, or -1
+        """
+
+        if not self.armed:
+            position = np.searchsorted(arm_index, start)
+            if position == arm_index.size:
+                return -1
+            start = arm_index[position]
+            self.armed = True
+        position = np.searchsorted(fire_index, start)
+        if position == fire_index.size:
+            return -1
+        # a change trigger is ready again as soon as the capture is done
+        self.armed = self.condition == 'change'
+        return int(fire_index[position])
+
+    def _continue_capture(self, time_stamps, values):
+        needed = self._pending[4]
+        self._pending[0].append(time_stamps[:needed])
+        self._pending[1].append(values[:needed])
+        self._pending[4] = max(needed - values.size, 0)
+        if self._pending[4] == 0:
+            self._finish_capture()
+        return min(needed, values.size)
+
+    def _finish_capture(self):
+        time_chunks, value_chunks, trigger_index, trigger_time, needed = self._pending
+        self._pending = None
+        self.captures.append({"time_stamps":np.concatenate(time_chunks), "values":np.concatenate(value_chunks),
+                              "trigger_index":trigger_index, "trigger_time":trigger_time})
+        config.logger.info("Trigger capture: " + self.condition + " at " + str(trigger_time) + " us")
+
+
+def trigger_sink(device_index, channel, time_stamps, values):
+    """ Packet sink that hands each packet to the trigger of its channel
+    """
+
+    trigger = config.triggers.get((device_index, channel))
+    if trigger is not None:
+        trigger.process(time_stamps, values)
+
+def set_trigger(device_index, ch, condition='rising', level=0.0, hysteresis=0.0, low=None, high=None,
+                pre=100, post=100, count=1):
+    """ Set (or with condition=None, remove) the trigger of a channel
+    """
+
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("set_trigger() - unknown channel: " + str(ch))
+        return
+    if condition is None:
+        config.triggers.pop((device_index, channel), None)
+        return
+    if condition not in TRIGGER_CONDITIONS:
+        config.logger.info("set_trigger() - condition must be one of " + str(TRIGGER_CONDITIONS))
+        return
+    if condition == 'window' and (low is None or high is None):
+        config.logger.info("set_trigger() - a window trigger needs low and high")
+        return
+
+    config.triggers[(device_index, channel)] = Trigger(condition, level, hysteresis, low, high, pre, post, count)
+    if trigger_sink not in config.packet_sinks:
+        config.packet_sinks.append(trigger_sink)
+    config.logger.info("Trigger: device " + str(device_index) + " " + ch + " " + condition)
+
+def reset_triggers():
+    for trigger in config.triggers.values():
+        trigger.reset()
+
+def get_captures(device_index, ch, clear=True):
+    """ The completed captures of a channel's trigger, oldest first
+    """
+
+    channel = config.CHANNEL_NUMBERS.get(ch)
+    if channel is None:
+        config.logger.info("get_captures() - unknown channel: " + str(ch))
+        return []
+    trigger = config.triggers.get((device_index, channel))
+    if trigger is None:
+        return []
+    captures = trigger.captures
+    if clear:
+        trigger.captures = []
+    return captures
@@ -8,6 +8,23 @@ def send_cmd_get_response(hDevice, command, parameters, param_bytes):
     Send a command to the specified device hardware and wait for a response.
     """
     
+    return send_encoded_cmd_get_response(hDevice, command, encode_parameters(parameters), param_bytes)
+
+def encode_parameters(parameters):
+    """
+    The 14 parameter bytes of a command, as the ctypes array SendCmdAndGetResponse takes. A command
+    sent many times (such as the steps of a DCU sequence) can be encoded once.
+    """
+
+    return (c_int8 * 14)(parameters[0], parameters[1], parameters[2], parameters[3],
+        parameters[4], parameters[5], parameters[6], parameters[7], parameters[8], parameters[9], parameters[10],
+        parameters[11], parameters[12], parameters[13])
+
+def send_encoded_cmd_get_response(hDevice, command, parameters_new, param_bytes):
+    """
+    Send a command, with parameters from encode_parameters(), and wait for a response.
+    """
+
     # Get a pointer to the SendCmdAndGetResponse function
     p_send_cmd_get_response = config.dll.NGIO_Device_SendCmdAndGetResponse
     # Configure the the SendCmdAndGetResponse function
@@ -17,9 +34,6 @@ def send_cmd_get_response(hDevice, command, parameters, param_bytes):
     p_send_cmd_get_response.restype = c_int32
     # Set parameters
     command = c_uint8(command) 
-    parameters_new = (c_int8 * 14)(parameters[0], parameters[1], parameters[2], parameters[3],
-        parameters[4], parameters[5], parameters[6], parameters[7], parameters[8], parameters[9], parameters[10],
-        parameters[11], parameters[12], parameters[13])
     param_bytes = c_uint32(param_bytes) #size of parameter array
     resp_buffer = (c_int8 *256)(0)
     resp_bytes = c_uint32(256)
@@ -42,7 +42,7 @@ def ddsmem_get_long_name(hDevice, channel):
     # Check the DDS_GetLongName command return value.  If a 0 returned, success, else -1!
     if ddsmem_get_long_name_return == -1:
         config.logger.debug("ERROR calling DDSMem GetLongName")
-    config.logger.debug("sensor long name = " + str(p_long_name.value))
+    config.logger.debug("sensor long name = %s", p_long_name.value)
     return str(p_long_name.value.decode('utf-8'))
 
 
@@ -84,7 +84,7 @@ def ddsmem_get_short_name(hDevice, channel):
     # Check the DDS_GetShortName command return value.  If a 0 returned, success, else -1!
     if ddsmem_get_short_name_return == -1:
         config.logger.debug("ERROR calling DDSMem GetShortName")
-    config.logger.debug("sensor short name = " + str(p_short_name.value))
+    config.logger.debug("sensor short name = %s", p_short_name.value)
     return str(p_short_name.value.decode('utf-8'))
 
 
@@ -127,7 +127,7 @@ def ddsmem_get_typ_sample_period(hDevice, channel):
     # Check the DDS_GetTypSamplePeriod command return value.  If a 0 returned, success, else -1!
     if ddsmem_get_typ_sample_period_return == -1:
         config.logger.debug("ERROR calling DDSMem GetTypSamplePeriod")
-    config.logger.debug("typical sample period = " + str(p_typ_sample_period.value))
+    config.logger.debug("typical sample period = %s", p_typ_sample_period.value)
     return p_typ_sample_period.value
 
 
@@ -192,7 +192,7 @@ def ddsmem_get_active_cal_page(hDevice, channel):
     # Check the DDS_GetActiveCalPage command return value.  If a 0 returned, success, else -1!
     if p_ddsmem_get_active_cal_page_return == -1:
         config.logger.debug("ERROR calling DDSMem GetActiveCalPage")
-    config.logger.debug("Active Cal Page = " + str(p_active_cal_page.value))
+    config.logger.debug("Active Cal Page = %s", p_active_cal_page.value)
     return p_active_cal_page.value
 
 def ddsmem_set_active_cal_page(hDevice, channel, active_calpage):
@@ -236,7 +236,7 @@ def ddsmem_get_highest_valid_cal_page_index(hDevice, channel):
     # Check the return value.  If a 0 returned, success, else -1!
     if p_ddsmem_get_highest_valid_cal_page_index_return == -1:
         config.logger.debug("ERROR calling DDSMem GetHighestValidCalPageIndex")
-    config.logger.debug("Highest Valid Cal Page Index = " + str(p_highest_valid_cal_page_index.value))
+    config.logger.debug("Highest Valid Cal Page Index = %s", p_highest_valid_cal_page_index.value)
     return p_highest_valid_cal_page_index.value
 
 def ddsmem_set_highest_valid_cal_page_index(hDevice, channel, highest_calpage_index):
@@ -289,10 +289,10 @@ def ddsmem_get_cal_page(hDevice, channel, index):
     if p_ddsmem_get_cal_page_return == -1:
         config.logger.debug("ERROR calling DDSMem GetCalPage")
 
-    config.logger.debug("Coefficient A = " + str(p_calibration_coefficient_a.value))
-    config.logger.debug("Coefficient B = " + str(p_calibration_coefficient_b.value))
-    config.logger.debug("Coefficient C = " + str(p_calibration_coefficient_c.value))
-    config.logger.debug("Units = " + str(p_units.value))
+    config.logger.debug("Coefficient A = %s", p_calibration_coefficient_a.value)
+    config.logger.debug("Coefficient B = %s", p_calibration_coefficient_b.value)
+    config.logger.debug("Coefficient C = %s", p_calibration_coefficient_c.value)
+    config.logger.debug("Units = %s", p_units.value)
 
     return (p_calibration_coefficient_a.value, p_calibration_coefficient_b.value, 
        p_calibration_coefficient_c.value, p_units.value.decode('utf-8'))
@@ -342,7 +342,7 @@ def ddsmem_get_operation_type(hDevice, channel):
     # Check the DDS_GetOperationType command return value.  If a 0 returned, success, else -1!
     if p_ddsmem_get_operation_type_return == -1:
         config.logger.debug("ERROR calling DDSMem GetOperationType")
-    config.logger.debug("Operation Type = " + str(p_operation_type.value))
+    config.logger.debug("Operation Type = %s", p_operation_type.value)
     return p_operation_type.value 
 
 def ddsmem_set_operation_type(hDevice, channel, op_type):
@@ -0,0 +1,647 @@
+from ctypes import *
+import math
+import random
+import struct
+import threading
+import time
+
+import numpy as np
+
+from labquest import labquest_calibration_functions as calibration
+
+
+# Raw count to voltage conversion used by the simulated LabQuest (12 bit ADC).
+# Probe type 2 is a 5V probe (0 to 5 V), probe type 3 is a 10V probe (-10 to +10 V).
+SIMULATED_VOLTAGE_SCALE = calibration.NOMINAL_VOLTAGE_SCALE    # {probe_type:(volts_per_count, volts_offset)}
+SIMULATED_MAX_COUNT = 4095
+
+# DDS records of the simulated auto-id sensors (sensor id >= 20). Resistor id sensors (id < 20) are
+# loaded by the labquest module from resistorsensorlist.txt, just as they are with real hardware.
+SIMULATED_DDS_RECORDS = {
+    75:{"long_name":"Force", "short_name":"F", "op_type":2, "typ_sample_period":0.02, "equation":1,
+        "highest_cal_page":1, "active_cal_page":0,
+        "cal_pages":[(0.0, 4.9, 0.0, "(N)"), (0.0, 1.1016, 0.0, "(lb)"), (0.0, 1.0, 0.0, "(V)")]},
+    76:{"long_name":"Temperature", "short_name":"Temp", "op_type":14, "typ_sample_period":0.5, "equation":12,
+        "highest_cal_page":2, "active_cal_page":0,
+        "cal_pages":[(0.00102119, 0.000222468, 1.33342e-07, "(C)"), (0.00102119, 0.000222468, 1.33342e-07, "(F)"),
+                     (0.00102119, 0.000222468, 1.33342e-07, "(K)")]},
+}
+
+# The sensors connected when no analog_sensors argument is given: ch1 = Temperature Probe
+# (resistor id 10, Steinhart-Hart), ch2 = simulated Force sensor (auto-id, linear)
+DEFAULT_ANALOG_SENSORS = {1:10, 2:75}
+
+# Waveform of each analog channel, in volts: offset + amplitude*sin(2*pi*frequency*t) + noise
+DEFAULT_WAVEFORM = {"offset":2.0, "amplitude":0.5, "frequency":0.5, "noise":0.002}
+
+# NGIO sampling modes (NGIO_CMD_ID_SET_SAMPLING_MODE)
+SAMPLING_MODE_APERIODIC_EDGE_DETECT = 1
+SAMPLING_MODE_PERIODIC_PULSE_COUNT = 2
+SAMPLING_MODE_PERIODIC_MOTION_DETECT = 3
+SAMPLING_MODE_PERIODIC_ROTATION_COUNTER = 4
+SAMPLING_MODE_PERIODIC_ROTATION_COUNTER_X4 = 5
+
+# ctypes signatures of the simulated NGIO functions (the same as the ngio_* modules configure)
+NGIO_SIGNATURES = {
+    "NGIO_Init":(None, c_ssize_t),
+    "NGIO_Uninit":([c_ssize_t], c_int32),
+    "NGIO_GetDLLVersion":([c_ssize_t, POINTER(c_uint16), POINTER(c_uint16)], c_int32),
+    "NGIO_SearchForDevices":([c_ssize_t, c_uint32, c_uint32, c_int32, POINTER(c_uint32)], c_int32),
+    "NGIO_OpenDeviceListSnapshot":([c_ssize_t, c_uint32, POINTER(c_uint32), POINTER(c_uint32)], c_ssize_t),
+    "NGIO_DeviceListSnapshot_GetNthEntry":([c_ssize_t, c_uint32, c_char_p, c_uint32, POINTER(c_uint32)], c_int32),
+    "NGIO_CloseDeviceListSnapshot":([c_ssize_t], c_int32),
+    "NGIO_Device_Open":([c_ssize_t, c_char_p, c_uint8], c_ssize_t),
+    "NGIO_Device_Close":([c_ssize_t], c_int32),
+    "NGIO_Device_AcquireExclusiveOwnership":([c_ssize_t, c_uint32], c_int32),
+    "NGIO_Device_SendCmdAndGetResponse":([c_ssize_t, c_ubyte, POINTER(c_int8), c_uint32, POINTER(c_int8),
+                                          POINTER(c_uint32), c_uint32], c_int32),
+    "NGIO_Device_SetMeasurementPeriod":([c_ssize_t, c_byte, c_double, c_uint32], c_int32),
+    "NGIO_Device_GetMeasurementPeriod":([c_ssize_t, c_byte, POINTER(c_double), c_uint32], c_int32),
+    "NGIO_Device_GetNumMeasurementsAvailable":([c_ssize_t, c_byte], c_int32),
+    "NGIO_Device_ReadRawMeasurements":([c_ssize_t, c_byte, POINTER(c_int32), POINTER(c_ssize_t), c_uint32], c_int32),
+    "NGIO_Device_ConvertToVoltage":([c_ssize_t, c_byte, c_int32, c_int32], c_float),
+    "NGIO_Device_DDSMem_ReadRecord":([c_ssize_t, c_byte, c_bool, c_uint32], c_int32),
+    "NGIO_Device_DDSMem_GetLongName":([c_ssize_t, c_byte, c_char_p, c_uint16], c_int32),
+    "NGIO_Device_DDSMem_SetLongName":([c_ssize_t, c_byte, c_char_p], c_int32),
+    "NGIO_Device_DDSMem_GetShortName":([c_ssize_t, c_byte, c_char_p, c_uint16], c_int32),
+    "NGIO_Device_DDSMem_SetShortName":([c_ssize_t, c_byte, c_char_p], c_int32),
+    "NGIO_Device_DDSMem_GetTypSamplePeriod":([c_ssize_t, c_byte, POINTER(c_float)], c_int32),
+    "NGIO_Device_DDSMem_GetCalibrationEquation":([c_ssize_t, c_byte, POINTER(c_byte)], c_int32),
+    "NGIO_Device_DDSMem_SetCalibrationEquation":([c_ssize_t, c_byte, c_char], c_int32),
+    "NGIO_Device_DDSMem_GetActiveCalPage":([c_ssize_t, c_byte, POINTER(c_ubyte)], c_int32),
+    "NGIO_Device_DDSMem_SetActiveCalPage":([c_ssize_t, c_byte, c_ubyte], c_int32),
+    "NGIO_Device_DDSMem_GetHighestValidCalPageIndex":([c_ssize_t, c_byte, POINTER(c_ubyte)], c_int32),
+    "NGIO_Device_DDSMem_SetHighestValidCalPageIndex":([c_ssize_t, c_byte, c_ubyte], c_int32),
+    "NGIO_Device_DDSMem_GetCalPage":([c_ssize_t, c_byte, c_ubyte, POINTER(c_float), POINTER(c_float),
+                                      POINTER(c_float), c_char_p, c_uint16], c_int32),
+    "NGIO_Device_DDSMem_SetCalPage":([c_ssize_t, c_byte, c_ubyte, c_float, c_float, c_float, c_char_p], c_int32),
+    "NGIO_Device_DDSMem_GetOperationType":([c_ssize_t, c_byte, POINTER(c_ubyte)], c_int32),
+    "NGIO_Device_DDSMem_SetOperationType":([c_ssize_t, c_byte, c_ubyte], c_int32),
+}
+
+
+class SimulatedFunction:
+    """ A simulated NGIO function. Like a ctypes function prototype it is callable, and it has
+    argtypes and restype attributes (these are stored, but the arguments are not converted).
+    """
+
+    def __init__(self, name, function, library):
+        self.__name__ = name
+        self.argtypes, self.restype = NGIO_SIGNATURES[name]
+        self._function = function
+        self._library = library
+        # the calls that take a device handle, when the library counts overlapping calls to a device
+        self._device_call = library.check_overlaps and name.startswith("NGIO_Device_") and name != "NGIO_Device_Open"
+
+    def __call__(self, *args):
+        if not self._device_call:
+            self._library.ffi_delay()
+            return self._function(*args)
+        hDevice = value(args[0])
+        self._library.enter_device(hDevice)
+        try:
+            self._library.ffi_delay()
+            return self._function(*args)
+        finally:
+            self._library.exit_device(hDevice)
+
+
+class SimulatedChannel:
+    """ The NGIO measurement buffer and signal generator state of one channel.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.period = 1.0
+        self.sampling_mode = 0
+        self.enabled = False
+        self.consumed = 0    # measurements read out of the NGIO measurement buffer
+        self.dropped = 0    # measurements lost because the NGIO measurement buffer overflowed
+        self.counter_offset = 0
+        self.waveform = dict(DEFAULT_WAVEFORM)
+        self.rng = None
+
+
+class SimulatedDevice:
+    """ A simulated LabQuest: its sensors, DDS memory, channels and digital outputs.
+    """
+
+    def __init__(self, name, analog_sensors, seed):
+        self.name = name
+        self.lock = threading.Lock()
+        self.open = False
+        self.started = False
+        self.start_time = 0.0
+        self.stop_time = None
+        self.sensor_ids = dict(analog_sensors)
+        self.dds = {channel:empty_dds_record() for channel in (1, 2, 3)}
+        self.channels = {channel:SimulatedChannel(channel) for channel in (1, 2, 3, 5, 6)}
+        for channel in self.channels.values():
+            channel.rng = np.random.default_rng(None if seed is None else seed + channel.channel)
+        self.io_lines = {5:0, 6:0}    # last value written to the dig1/dig2 output lines
+        self.pwm = {}    # {dig_channel:(running, period_ns, numerator, denominator)}
+        self.led = None
+
+
+class SimulatedNGIO:
+    """ A drop-in, hardware-free replacement for the NGIO shared library (config.dll). Every NGIO_*
+    function used by the labquest module is available with the same name and ctypes signature.
+
+    Measurements are generated from the elapsed time since the Start Measurements command was
+    received: a sine wave (plus noise) on the analog channels, echoes on a motion detector, a
+    steadily turning rotary motion sensor, and photogate edges at a fixed rate. Time stamps are in
+    microseconds since the start. If the measurements are not read quickly enough, the oldest are
+    dropped once buffer_size measurements are waiting, like the real NGIO measurement buffer.
+
+    Args:
+        device_type (int): OriginalLQ = 5, Mini = 12, LQ2 = 14, LQStream = 17, LQ3 = 19
+
+        num_devices (int): number of simulated LabQuests connected
+
+        analog_sensors (dict): {channel:sensor id} of the sensors connected to ch1, ch2 and ch3.
+        Ids below 20 are resistor id sensors from resistorsensorlist.txt, the ids in
+        SIMULATED_DDS_RECORDS are auto-id sensors.
+
+        waveforms (dict): {channel:{"offset", "amplitude", "frequency", "noise"}} in volts and Hz
+
+        motion_distance (tuple): (mean, amplitude, frequency) of the motion detector target (m, m, Hz)
+
+        rotation_rate (float): rotary motion sensor speed (degrees/s)
+
+        edge_rate (float): photogate blocks per second (photogate count and photogate timing)
+
+        block_time (float): how long the photogate stays blocked (s)
+
+        latency (float): seconds added to every NGIO call, to model the USB/FFI round trip
+
+        jitter (float): up to this many extra seconds (uniformly distributed) added to every call
+
+        buffer_size (int): capacity of each channel's NGIO measurement buffer
+
+        min_period (float): the fastest measurement period (s) the simulated device accepts
+
+        per_channel_periods (bool): if True the device keeps a separate measurement period for
+        each channel, otherwise setting any channel's period sets all of them
+
+        seed (int): seed for the noise generator and jitter, for reproducible runs
+
+        check_overlaps (bool): if True, count the calls made to a device while another call to
+        the same device is running (overlapping_calls). The labquest functions serialize the
+        calls to each device, so this stays 0.
+    """
+
+    def __init__(self, device_type=12, num_devices=1, analog_sensors=None, waveforms=None,
+                 motion_distance=(1.0, 0.5, 0.5), rotation_rate=90.0, edge_rate=5.0, block_time=0.05,
+                 latency=0.0, jitter=0.0, buffer_size=1048576, min_period=0.00001,
+                 per_channel_periods=False, seed=None, check_overlaps=False):
+        self.device_type = device_type
+        self.motion_distance = motion_distance
+        self.rotation_rate = rotation_rate
+        self.edge_rate = edge_rate
+        self.block_time = block_time
+        self.latency = latency
+        self.jitter = jitter
+        self.buffer_size = buffer_size
+        self.min_period = min_period
+        self.per_channel_periods = per_channel_periods
+        self.clock = time.perf_counter
+        self.check_overlaps = check_overlaps
+        self.overlapping_calls = 0    # calls made to a device while another call to it was running
+        self._busy = {}    # {hDevice:calls running}
+        self._busy_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._snapshots = {}
+        self._next_handle = 1
+
+        if analog_sensors is None:
+            analog_sensors = DEFAULT_ANALOG_SENSORS
+        self.devices = {}    # {hDevice:SimulatedDevice}
+        self._device_names = []
+        for index in range(num_devices):
+            name = ("SimulatedLabQuest" + str(index)).encode('utf-8')
+            self._device_names.append(name)
+            device = SimulatedDevice(name, analog_sensors, None if seed is None else seed + 10*index)
+            for channel, waveform in (waveforms or {}).items():
+                device.channels[channel].waveform.update(waveform)
+            self.devices[1000 + index] = device
+
+        # Expose every NGIO function as an attribute, like a ctypes CDLL
+        for name in NGIO_SIGNATURES:
+            method = getattr(self, "_" + name)
+            setattr(self, name, SimulatedFunction(name, method, self))
+
+    def ffi_delay(self):
+        """ Model the time spent in the NGIO call (USB round trip). No delay by default.
+        """
+
+        if self.latency or self.jitter:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if delay > 0:
+                time.sleep(delay)
+
+    def enter_device(self, hDevice):
+        with self._busy_lock:
+            running = self._busy.get(hDevice, 0)
+            if running:
+                self.overlapping_calls += 1
+            self._busy[hDevice] = running + 1
+
+    def exit_device(self, hDevice):
+        with self._busy_lock:
+            self._busy[hDevice] -= 1
+
+    # ---- library ----
+
+    def _NGIO_Init(self, *args):
+        return 1
+
+    def _NGIO_Uninit(self, hLib):
+        return 0
+
+    def _NGIO_GetDLLVersion(self, hLib, p_major, p_minor):
+        target(p_major).value = 1
+        target(p_minor).value = 99
+        return 0
+
+    def _NGIO_SearchForDevices(self, hLib, device_type, comm_transport_id, p_params, p_device_list_signature):
+        if value(device_type) == self.device_type and self.devices:
+            target(p_device_list_signature).value = 1
+        else:
+            target(p_device_list_signature).value = 0
+        return 0
+
+    def _NGIO_OpenDeviceListSnapshot(self, hLib, device_type, p_num_devices, p_device_list_signature):
+        if value(device_type) != self.device_type:
+            target(p_num_devices).value = 0
+            return 0
+        hDeviceList = self._next_handle
+        self._next_handle += 1
+        self._snapshots[hDeviceList] = list(self._device_names)
+        target(p_num_devices).value = len(self._device_names)
+        target(p_device_list_signature).value = 1
+        return hDeviceList
+
+    def _NGIO_DeviceListSnapshot_GetNthEntry(self, hDeviceList, n, p_devname_buf, buf_size, p_device_status_mask):
+        names = self._snapshots.get(value(hDeviceList), [])
+        n = value(n)
+        if n >= len(names):
+            return -1
+        target(p_devname_buf).value = names[n]
+        return 0
+
+    def _NGIO_CloseDeviceListSnapshot(self, hDeviceList):
+        self._snapshots.pop(value(hDeviceList), None)
+        return 0
+
+    # ---- device ----
+
+    def _NGIO_Device_Open(self, hLib, p_name, demand_exclusive_ownership):
+        name = string(p_name)
+        for hDevice, device in self.devices.items():
+            if device.name == name:
+                device.open = True
+                return hDevice
+        return 0
+
+    def _NGIO_Device_Close(self, hDevice):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return -1
+        with device.lock:
+            device.open = False
+            device.started = False
+        return 0
+
+    def _NGIO_Device_AcquireExclusiveOwnership(self, hDevice, timeout):
+        return 0 if value(hDevice) in self.devices else -1
+
+    def _NGIO_Device_SendCmdAndGetResponse(self, hDevice, command, parameters, param_bytes,
+                                           resp_buffer, p_resp_bytes, timeout_ms):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return -1
+        command = value(command)
+        params = [p & 0xFF for p in parameters]
+        response = b''
+        with device.lock:
+            if command == 0x18:    # NGIO_CMD_ID_START_MEASUREMENTS
+                # the counters carry on from the previous run (unless they were reset)
+                for channel in device.channels.values():
+                    channel.counter_offset += int(self._digital_count(device, channel, self._elapsed(device)))
+                device.started = True
+                device.start_time = self.clock()
+                device.stop_time = None
+                for channel in device.channels.values():
+                    channel.consumed = 0
+                    channel.dropped = 0
+            elif command == 0x19:    # NGIO_CMD_ID_STOP_MEASUREMENTS
+                if device.started:
+                    device.stop_time = self.clock()
+                device.started = False
+            elif command == 0x28:    # NGIO_CMD_ID_GET_SENSOR_ID
+                response = struct.pack('<l', device.sensor_ids.get(params[0], 0))
+            elif command == 0x2C:    # NGIO_CMD_ID_SET_SENSOR_CHANNEL_ENABLE_MASK
+                mask = params[0]
+                for channel in device.channels.values():
+                    channel.enabled = bool(mask & (1 << channel.channel))
+            elif command == 0x29:    # NGIO_CMD_ID_SET_SAMPLING_MODE
+                if params[0] in device.channels:
+                    device.channels[params[0]].sampling_mode = params[1]
+            elif command == 0x32:    # NGIO_CMD_ID_SET_DIGITAL_COUNTER
+                if params[0] in device.channels:
+                    channel = device.channels[params[0]]
+                    channel.counter_offset = -int(self._digital_count(device, channel, self._elapsed(device)))
+            elif command == 0x39:    # NGIO_CMD_ID_WRITE_IO
+                if params[0] in device.io_lines:
+                    device.io_lines[params[0]] = params[2] & params[1]
+            elif command == 0x40:    # NGIO_CMD_ID_SET_PWM_CONFIG
+                unsigned = bytes(params)
+                device.pwm[params[0]] = (params[1], struct.unpack('<L', unsigned[2:6])[0],
+                        struct.unpack('<L', unsigned[6:10])[0], struct.unpack('<L', unsigned[10:14])[0])
+            elif command == 0x1D:    # NGIO_CMD_ID_SET_LED_STATE
+                device.led = (params[1], params[2])
+        memmove(resp_buffer, response, len(response))
+        target(p_resp_bytes).value = len(response)
+        return 0
+
+    def _NGIO_Device_SetMeasurementPeriod(self, hDevice, channel, period, timeout_ms):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return -1
+        channel = value(channel)
+        period = max(float(value(period)), self.min_period)
+        # the device has a 1 microsecond time base
+        period = round(period*1000000)/1000000
+        with device.lock:
+            if channel == -1 or not self.per_channel_periods:
+                for simulated_channel in device.channels.values():
+                    simulated_channel.period = period
+            elif channel in device.channels:
+                device.channels[channel].period = period
+            else:
+                return -1
+        return 0
+
+    def _NGIO_Device_GetMeasurementPeriod(self, hDevice, channel, p_period, timeout_ms):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return -1
+        channel = value(channel)
+        if channel == -1:
+            channel = 1
+        target(p_period).value = device.channels[channel].period
+        return 0
+
+    def _NGIO_Device_GetNumMeasurementsAvailable(self, hDevice, channel):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return -1
+        with device.lock:
+            return self._num_available(device, device.channels[value(channel)])
+
+    def _NGIO_Device_ReadRawMeasurements(self, hDevice, channel, p_measurements_buf, p_time_stamps, max_count):
+        device = self.devices.get(value(hDevice))
+        if device is None or not device.open:
+            return -1
+        with device.lock:
+            simulated_channel = device.channels[value(channel)]
+            count = min(self._num_available(device, simulated_channel), value(max_count))
+            if count <= 0:
+                return 0
+            first = simulated_channel.consumed + simulated_channel.dropped
+            values, time_stamps = self._generate(device, simulated_channel, first, count)
+            simulated_channel.consumed += count
+        np.ctypeslib.as_array(target(p_measurements_buf))[:count] = values
+        np.ctypeslib.as_array(target(p_time_stamps))[:count] = time_stamps
+        return count
+
+    def _NGIO_Device_ConvertToVoltage(self, hDevice, channel, raw_measurement, probe_type):
+        volts_per_count, volts_offset = SIMULATED_VOLTAGE_SCALE.get(value(probe_type), SIMULATED_VOLTAGE_SCALE[2])
+        return value(raw_measurement)*volts_per_count + volts_offset
+
+    # ---- DDS memory ----
+
+    def _NGIO_Device_DDSMem_ReadRecord(self, hDevice, channel, strict_dds_validation_flag, timeout_ms):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return -1
+        channel = value(channel)
+        record = SIMULATED_DDS_RECORDS.get(device.sensor_ids.get(channel, 0))
+        if record is None:
+            return -1
+        device.dds[channel] = {key:(list(item) if key == "cal_pages" else item) for key, item in record.items()}
+        return 0
+
+    def _NGIO_Device_DDSMem_GetLongName(self, hDevice, channel, p_long_name, max_num_bytes):
+        return self._get_string(hDevice, channel, "long_name", p_long_name)
+
+    def _NGIO_Device_DDSMem_SetLongName(self, hDevice, channel, p_long_name):
+        return self._set_dds(hDevice, channel, "long_name", string(p_long_name).decode('utf-8'))
+
+    def _NGIO_Device_DDSMem_GetShortName(self, hDevice, channel, p_short_name, max_num_bytes):
+        return self._get_string(hDevice, channel, "short_name", p_short_name)
+
+    def _NGIO_Device_DDSMem_SetShortName(self, hDevice, channel, p_short_name):
+        return self._set_dds(hDevice, channel, "short_name", string(p_short_name).decode('utf-8'))
+
+    def _NGIO_Device_DDSMem_GetTypSamplePeriod(self, hDevice, channel, p_typ_sample_period):
+        return self._get_value(hDevice, channel, "typ_sample_period", p_typ_sample_period)
+
+    def _NGIO_Device_DDSMem_GetCalibrationEquation(self, hDevice, channel, p_calibration_equation):
+        return self._get_value(hDevice, channel, "equation", p_calibration_equation)
+
+    def _NGIO_Device_DDSMem_SetCalibrationEquation(self, hDevice, channel, calibration_equation):
+        return self._set_dds(hDevice, channel, "equation", value(calibration_equation))
+
+    def _NGIO_Device_DDSMem_GetActiveCalPage(self, hDevice, channel, p_active_cal_page):
+        return self._get_value(hDevice, channel, "active_cal_page", p_active_cal_page)
+
+    def _NGIO_Device_DDSMem_SetActiveCalPage(self, hDevice, channel, active_cal_page):
+        return self._set_dds(hDevice, channel, "active_cal_page", value(active_cal_page))
+
+    def _NGIO_Device_DDSMem_GetHighestValidCalPageIndex(self, hDevice, channel, p_highest_valid_cal_page_index):
+        return self._get_value(hDevice, channel, "highest_cal_page", p_highest_valid_cal_page_index)
+
+    def _NGIO_Device_DDSMem_SetHighestValidCalPageIndex(self, hDevice, channel, highest_valid_cal_page_index):
+        return self._set_dds(hDevice, channel, "highest_cal_page", value(highest_valid_cal_page_index))
+
+    def _NGIO_Device_DDSMem_GetCalPage(self, hDevice, channel, cal_page_index, p_a, p_b, p_c, p_units, max_num_bytes):
+        record = self._dds(hDevice, channel)
+        if record is None:
+            return -1
+        a, b, c, units = record["cal_pages"][min(value(cal_page_index), 2)]
+        target(p_a).value = a
+        target(p_b).value = b
+        target(p_c).value = c
+        target(p_units).value = units.encode('utf-8')
+        return 0
+
+    def _NGIO_Device_DDSMem_SetCalPage(self, hDevice, channel, cal_page_index, a, b, c, p_units):
+        record = self._dds(hDevice, channel)
+        if record is None:
+            return -1
+        # store the coefficients with the same (float) precision the real DDS record has
+        a, b, c = (c_float(value(coefficient)).value for coefficient in (a, b, c))
+        record["cal_pages"][min(value(cal_page_index), 2)] = (a, b, c, string(p_units).decode('utf-8'))
+        return 0
+
+    def _NGIO_Device_DDSMem_GetOperationType(self, hDevice, channel, p_operation_type):
+        return self._get_value(hDevice, channel, "op_type", p_operation_type)
+
+    def _NGIO_Device_DDSMem_SetOperationType(self, hDevice, channel, op_type):
+        return self._set_dds(hDevice, channel, "op_type", value(op_type))
+
+    def _dds(self, hDevice, channel):
+        device = self.devices.get(value(hDevice))
+        if device is None:
+            return None
+        return device.dds.get(value(channel))
+
+    def _get_value(self, hDevice, channel, key, pointer):
+        record = self._dds(hDevice, channel)
+        if record is None:
+            return -1
+        target(pointer).value = record[key]
+        return 0
+
+    def _get_string(self, hDevice, channel, key, pointer):
+        record = self._dds(hDevice, channel)
+        if record is None:
+            return -1
+        target(pointer).value = record[key].encode('utf-8')
+        return 0
+
+    def _set_dds(self, hDevice, channel, key, item):
+        record = self._dds(hDevice, channel)
+        if record is None:
+            return -1
+        record[key] = item
+        return 0
+
+    # ---- signal generation ----
+
+    def _elapsed(self, device):
+        """ Seconds of acquisition so far (frozen once measurements are stopped)
+        """
+
+        if device.stop_time is not None:
+            return device.stop_time - device.start_time
+        if not device.started:
+            return 0.0
+        return self.clock() - device.start_time
+
+    def _measurements_per_period(self, device, channel):
+        if channel.channel in (5, 6) and channel.sampling_mode == SAMPLING_MODE_PERIODIC_MOTION_DETECT:
+            return 2    # the ping and the echo
+        return 1
+
+    def _num_generated(self, device, channel):
+        """ Total number of measurements the device has produced on the channel since the start
+        """
+
+        if not channel.enabled or (not device.started and device.stop_time is None):
+            return 0
+        elapsed = self._elapsed(device)
+        if channel.channel in (5, 6):
+            if channel.sampling_mode == SAMPLING_MODE_APERIODIC_EDGE_DETECT:
+                # the initial state, then a block and an unblock edge for each object passing through
+                blocks = int(elapsed*self.edge_rate)
+                edges = 2*blocks
+                if blocks and blocks/self.edge_rate + self.block_time > elapsed:
+                    edges -= 1
+                return 1 + edges
+            if channel.sampling_mode not in (SAMPLING_MODE_PERIODIC_PULSE_COUNT, SAMPLING_MODE_PERIODIC_MOTION_DETECT,
+                                             SAMPLING_MODE_PERIODIC_ROTATION_COUNTER,
+                                             SAMPLING_MODE_PERIODIC_ROTATION_COUNTER_X4):
+                return 0
+        return int(elapsed/channel.period)*self._measurements_per_period(device, channel)
+
+    def _num_available(self, device, channel):
+        available = self._num_generated(device, channel) - channel.consumed - channel.dropped
+        if available > self.buffer_size:
+            # the NGIO measurement buffer is full, the oldest measurements are lost
+            channel.dropped += available - self.buffer_size
+            available = self.buffer_size
+        return max(available, 0)
+
+    def _generate(self, device, channel, first, count):
+        """ Generate the raw values and time stamps (microseconds) of measurements first to first+count
+        """
+
+        index = np.arange(first, first + count, dtype=np.int64)
+
+        if channel.channel in (1, 2, 3):
+            t = (index + 1)*channel.period
+            waveform = channel.waveform
+            volts = waveform["offset"] + waveform["amplitude"]*np.sin(2*math.pi*waveform["frequency"]*t)
+            if waveform["noise"]:
+                volts = volts + channel.rng.normal(0.0, waveform["noise"], count)
+            op_type = device.dds[channel.channel]["op_type"]
+            volts_per_count, volts_offset = SIMULATED_VOLTAGE_SCALE[3 if op_type == 2 else 2]
+            values = np.clip(np.rint((volts - volts_offset)/volts_per_count), 0, SIMULATED_MAX_COUNT)
+            return values.astype(np.int32), np.rint(t*1000000).astype(np.int64)
+
+        if channel.sampling_mode == SAMPLING_MODE_APERIODIC_EDGE_DETECT:
+            edge = index - 1
+            t = (edge//2 + 1)/self.edge_rate + (edge % 2)*self.block_time
+            t[index == 0] = 0.0
+            values = np.where(index == 0, 0, 1 - (edge % 2))    # 1 = blocked, 0 = unblocked
+            return values.astype(np.int32), np.rint(t*1000000).astype(np.int64)
+
+        if channel.sampling_mode == SAMPLING_MODE_PERIODIC_MOTION_DETECT:
+            sample = index//2
+            t = (sample + 1)*channel.period
+            mean, amplitude, frequency = self.motion_distance
+            distance = mean + amplitude*np.sin(2*math.pi*frequency*t)
+            # the echo returns after the round trip at 340 m/s
+            echo_delay = 2*distance/340
+            t = t + (index % 2)*echo_delay
+            values = index % 2    # 0 = ping, 1 = echo
+            return values.astype(np.int32), np.rint(t*1000000).astype(np.int64)
+
+        t = (index + 1)*channel.period
+        counts = self._digital_count(device, channel, t) + channel.counter_offset
+        return np.asarray(counts).astype(np.int32), np.rint(t*1000000).astype(np.int64)
+
+    def _digital_count(self, device, channel, t):
+        """ Photogate count or rotary motion counter at time t
+        """
+
+        if channel.sampling_mode == SAMPLING_MODE_PERIODIC_PULSE_COUNT:
+            return np.floor(np.asarray(t)*self.edge_rate).astype(np.int64)
+        if channel.sampling_mode == SAMPLING_MODE_PERIODIC_ROTATION_COUNTER_X4:
+            return np.floor(np.asarray(t)*self.rotation_rate*4).astype(np.int64)
+        return np.floor(np.asarray(t)*self.rotation_rate).astype(np.int64)
+
+
+def empty_dds_record():
+    """ The DDS memory of a channel with no sensor information loaded
+    """
+
+    return {"long_name":"", "short_name":"", "op_type":14, "typ_sample_period":1.0, "equation":1,
+            "highest_cal_page":0, "active_cal_page":0,
+            "cal_pages":[(0.0, 1.0, 0.0, ""), (0.0, 1.0, 0.0, ""), (0.0, 1.0, 0.0, "")]}
+
+def target(argument):
+    """ The ctypes object behind a pointer argument (byref() or the object itself)
+    """
+
+    return getattr(argument, '_obj', argument)
+
+def value(argument):
+    """ The Python value of a ctypes argument
+    """
+
+    argument = target(argument)
+    argument = getattr(argument, 'value', argument)
+    if isinstance(argument, bytes):
+        return argument[0] if argument else 0
+    return argument
+
+def string(argument):
+    """ The bytes of a c_char_p argument
+    """
+
+    argument = target(argument)
+    argument = getattr(argument, 'value', argument)
+    return argument or b''
@@ -0,0 +1,241 @@
+""" Stream LabQuest data to TCP clients.
+
+    python -m labquest serve --ch1 lq_sensor --dig1 motion --period 10 [--port 5025] [--backend simulated]
+
+The server owns the device through the LabQuest API. It subscribes to every enabled channel and
+sends each batch to the clients that asked for that channel, optionally decimated per client. Frames
+are described in labquest.server.protocol; labquest.server.client.LabQuestClient is the Python client.
+"""
+
+import asyncio
+from collections import deque
+
+from labquest import config
+from labquest import labquest_decimation_functions as decimation
+from labquest import labquest_start_functions as start
+from labquest.server import protocol
+
+
+DEFAULT_PORT = 5025
+
+
+class ClientConnection:
+    """ A connected client: its subscriptions and its bounded send queue. When the queue is full the
+    oldest frame is dropped, so a slow client only loses its own data.
+    """
+
+    def __init__(self, reader, writer, max_queue):
+        self.reader = reader
+        self.writer = writer
+        self.subscriptions = {}    # {(device_index, channel):Decimator or None}
+        self.frames = deque()
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.ready = asyncio.Event()
+
+    def send(self, frame):
+        if len(self.frames) >= self.max_queue:
+            self.frames.popleft()
+            self.dropped += 1
+        self.frames.append(frame)
+        self.ready.set()
+
+    def send_data(self, device_index, channel, time_stamps, values):
+        key = (device_index, channel)
+        if key not in self.subscriptions:
+            return
+        decimator = self.subscriptions[key]
+        if decimator is not None:
+            time_stamps, values = decimator.process(time_stamps, values)
+            if not values.size:
+                return
+        self.send(protocol.data_frame(device_index, channel, time_stamps, values))
+
+    async def write_frames(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            if self.dropped != self.reported_dropped:
+                self.writer.write(protocol.message_frame({"type":"dropped", "frames":self.dropped}))
+                self.reported_dropped = self.dropped
+            while self.frames:
+                self.writer.write(self.frames.popleft())
+            await self.writer.drain()
+
+
+class LabQuestServer:
+    """ asyncio TCP server that streams the data of an opened, configured LabQuest.
+
+    Args:
+        lq (LabQuest): opened, with select_sensors() done. The server calls start(period) and stop().
+
+        max_queue (int): frames waiting for each client before the oldest is dropped
+
+        batch_size (int), max_latency (float): how the channel data are batched into frames
+    """
+
+    def __init__(self, lq, host='127.0.0.1', port=DEFAULT_PORT, period=10, max_queue=256, batch_size=100,
+                 max_latency=0.05):
+        self.lq = lq
+        self.host = host
+        self.port = port
+        self.period = period
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.clients = []
+        self.subscriptions = []
+        self.server = None
+        self.loop = None
+
+    async def start(self):
+        """ Start listening, subscribe to every enabled channel and start the measurements
+        """
+
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        for device_index, channel in self.channels():
+            self.subscriptions.append(self.lq.subscribe(protocol.CHANNEL_NAMES[channel], self._callback(device_index, channel),
+                                                        batch_size=self.batch_size, max_latency=self.max_latency,
+                                                        max_pending=self.max_queue, device=device_index))
+        self.lq.start(period=self.period)
+        config.logger.info("Serving on " + self.host + ":" + str(self.port))
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """ Stop the measurements and disconnect the clients
+        """
+
+        if self.server is None:
+            return
+        self.server.close()
+        for client in list(self.clients):
+            client.writer.close()
+        self.lq.stop()
+        for subscription in self.subscriptions:
+            self.lq.unsubscribe(subscription)
+        self.subscriptions = []
+        self.server = None
+
+    def channels(self):
+        """ [(device_index, channel)] of the enabled channels, without photogate timing and dcu
+        """
+
+        channels = []
+        with config.use_session(self.lq.session):
+            for device_index, device_enabled_chs in enumerate(config.enabled_all_channels):
+                for channel in device_enabled_chs:
+                    if channel in (5, 6):
+                        sensor = config.device_dig_channel_dictionary[device_index].get(protocol.CHANNEL_NAMES[channel])
+                        if sensor not in ('motion', 'rotary_motion', 'rotary_motion_high_res', 'photogate_count'):
+                            continue
+                    channels.append((device_index, channel))
+        return channels
+
+    def _callback(self, device_index, channel):
+        # runs on the subscription's thread; hand the batch to the event loop
+        def callback(time_stamps, values):
+            self.loop.call_soon_threadsafe(self._publish, device_index, channel, time_stamps, values)
+        return callback
+
+    def _publish(self, device_index, channel, time_stamps, values):
+        for client in self.clients:
+            client.send_data(device_index, channel, time_stamps, values)
+
+    def _hello(self):
+        channels = []
+        with config.use_session(self.lq.session):
+            for device_index, channel in self.channels():
+                ch = protocol.CHANNEL_NAMES[channel]
+                channels.append({"device":device_index, "ch":ch, "channel":channel,
+                                 "name_and_units":self.lq.enabled_sensor_info(ch, device_index),
+                                 "sample_period":start.output_period(device_index, channel)})
+            sample_period = config.sample_period*config.oversample
+        return {"type":"hello", "channels":channels, "sample_period":sample_period}
+
+    async def _handle_client(self, reader, writer):
+        client = ClientConnection(reader, writer, self.max_queue)
+        self.clients.append(client)
+        client.send(protocol.message_frame(self._hello()))
+        writing = asyncio.ensure_future(client.write_frames())
+        try:
+            while True:
+                header = await reader.readexactly(protocol.LENGTH.size)
+                size = protocol.LENGTH.unpack(header)[0]
+                if size > protocol.MAX_FRAME_SIZE:
+                    break
+                kind, message = protocol.decode(await reader.readexactly(size))
+                if kind == 'message':
+                    self._handle_message(client, message)
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, ValueError):
+            pass
+        finally:
+            writing.cancel()
+            self.clients.remove(client)
+            writer.close()
+
+    def _handle_message(self, client, message):
+        if message.get("type") not in ("subscribe", "unsubscribe"):
+            return
+        available = self.channels()
+        changed = []
+        for request in message.get("channels", []):
+            key = (request.get("device", 0), protocol.CHANNEL_NUMBERS.get(request.get("ch")))
+            if key not in available:
+                continue
+            if message.get("type") == "subscribe":
+                factor = request.get("decimate", 1)
+                mode = request.get("mode", 'mean')
+                if mode not in decimation.DECIMATION_MODES:
+                    continue
+                client.subscriptions[key] = decimation.Decimator(factor, mode) if factor > 1 else None
+            elif message.get("type") == "unsubscribe":
+                client.subscriptions.pop(key, None)
+            changed.append(request)
+        client.send(protocol.message_frame({"type":message.get("type") + "d", "channels":changed}))
+
+
+def serve(lq, host='127.0.0.1', port=DEFAULT_PORT, period=10, max_queue=256, batch_size=100, max_latency=0.05):
+    """ Run a LabQuestServer until interrupted (Ctrl-C)
+    """
+
+    server = LabQuestServer(lq, host, port, period, max_queue, batch_size, max_latency)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+def main(argv=None):
+    import argparse
+    from labquest import LabQuest
+
+    parser = argparse.ArgumentParser(prog="python -m labquest serve",
+                                     description="Stream LabQuest data to TCP clients.")
+    parser.add_argument("--host", default='127.0.0.1', help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port (default %(default)s, 0 for any)")
+    parser.add_argument("--period", type=float, default=10, help="milliseconds between samples (default 10)")
+    for ch in config.CHANNEL_NUMBERS:
+        parser.add_argument("--" + ch, default='no_sensor', help="sensor on " + ch + ", as in select_sensors()")
+    parser.add_argument("--backend", default=None, help="'simulated' to run without hardware")
+    parser.add_argument("--queue", type=int, default=256, help="frames queued for each client (default 256)")
+    parser.add_argument("--batch", type=int, default=100, help="values in each frame (default 100)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds before a partial frame is sent (default 0.05)")
+    args = parser.parse_args(argv)
+
+    lq = LabQuest(backend=args.backend)
+    lq.open()
+    lq.select_sensors(ch1=args.ch1, ch2=args.ch2, ch3=args.ch3, dig1=args.dig1, dig2=args.dig2)
+    try:
+        serve(lq, args.host, args.port, args.period, args.queue, args.batch, args.latency)
+    finally:
+        lq.close()
+    return 0
@@ -0,0 +1,88 @@
+import socket
+
+from labquest.server import protocol
+
+
+class LabQuestClient:
+    """ Client for the labquest streaming server (python -m labquest serve).
+
+    Example:
+        client = LabQuestClient('127.0.0.1', 5025)
+        client.subscribe('ch1', decimate=10)
+        for device, ch, time_stamps, values in client.frames():
+            ...
+
+    Args:
+        timeout (float): seconds to wait for a frame before socket.timeout is raised. None waits forever.
+    """
+
+    def __init__(self, host='127.0.0.1', port=5025, timeout=None):
+        self.socket = socket.create_connection((host, port))
+        self.socket.settimeout(timeout)
+        self.file = self.socket.makefile('rb')
+        self.dropped = 0    # frames the server dropped because this client was behind
+        self.messages = []    # messages received while waiting for data (other than "dropped")
+        kind, self.hello = self._receive()
+        # {"type":"hello", "channels":[{"device", "ch", "channel", "name_and_units", "sample_period"}], "sample_period"}
+
+    def subscribe(self, ch, device=0, decimate=1, mode='mean'):
+        """ Ask for a channel's data, optionally decimated by the server (see LabQuest.set_decimation())
+        """
+
+        self._send({"type":"subscribe", "channels":[{"device":device, "ch":ch, "decimate":decimate, "mode":mode}]})
+
+    def unsubscribe(self, ch, device=0):
+        self._send({"type":"unsubscribe", "channels":[{"device":device, "ch":ch}]})
+
+    def receive(self):
+        """ Wait for the next data frame.
+
+        Returns:
+            (device, ch, time_stamps, values): time stamps (int64, microseconds) and values (float64)
+            arrays. None when the server closes the connection.
+        """
+
+        while True:
+            frame = self._receive()
+            if frame is None:
+                return None
+            kind, content = frame
+            if kind == 'data':
+                return content
+            if content.get("type") == "dropped":
+                self.dropped = content["frames"]
+            else:
+                self.messages.append(content)
+
+    def frames(self):
+        """ Generator of data frames, until the server closes the connection
+        """
+
+        while True:
+            frame = self.receive()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _send(self, message):
+        self.socket.sendall(protocol.message_frame(message))
+
+    def _receive(self):
+        header = self.file.read(protocol.LENGTH.size)
+        if len(header) < protocol.LENGTH.size:
+            return None
+        size = protocol.LENGTH.unpack(header)[0]
+        payload = self.file.read(size)
+        if len(payload) < size:
+            return None
+        return protocol.decode(payload)
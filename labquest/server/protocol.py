@@ -0,0 +1,65 @@
+""" Wire format of the labquest streaming server.
+
+Every frame is a 4 byte little-endian payload length followed by the payload. The first byte of the
+payload is the frame type:
+
+    b'D' data:    type, device (uint8), channel (uint8), pad, count (uint32),
+                  then count time stamps (int64, microseconds) and count values (float64)
+    b'J' message: type, then a UTF-8 JSON object with a "type" key
+
+Messages from the server: {"type":"hello", "channels":[...], "sample_period":...} when a client
+connects, {"type":"subscribed", "channels":[...]} after a subscribe, and {"type":"dropped",
+"frames":n} when frames had to be dropped for a slow client.
+
+Messages from a client: {"type":"subscribe", "channels":[{"device":0, "ch":"ch1", "decimate":10,
+"mode":"mean"}, ...]} (decimate and mode are optional) and {"type":"unsubscribe", "channels":[...]}.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from labquest.config import CHANNEL_NAMES, CHANNEL_NUMBERS
+
+
+LENGTH = struct.Struct('<I')
+DATA_HEADER = struct.Struct('<cBBxI')    # type, device, channel, pad, count
+DATA = b'D'
+MESSAGE = b'J'
+MAX_FRAME_SIZE = 64*1024*1024
+
+
+def data_frame(device_index, channel, time_stamps, values):
+    """ Encode a data frame (including the length prefix)
+    """
+
+    time_stamps = np.ascontiguousarray(time_stamps, dtype='<i8')
+    values = np.ascontiguousarray(values, dtype='<f8')
+    payload_size = DATA_HEADER.size + time_stamps.nbytes + values.nbytes
+    return b''.join((LENGTH.pack(payload_size), DATA_HEADER.pack(DATA, device_index, channel, values.size),
+                     time_stamps.tobytes(), values.tobytes()))
+
+def message_frame(message):
+    """ Encode a JSON message frame (including the length prefix)
+    """
+
+    payload = MESSAGE + json.dumps(message).encode('utf-8')
+    return LENGTH.pack(len(payload)) + payload
+
+def decode(payload):
+    """ Decode a frame payload (without the length prefix).
+
+    Returns:
+        ('data', (device_index, ch, time_stamps, values)) or ('message', dict)
+    """
+
+    frame_type = payload[:1]
+    if frame_type == DATA:
+        _, device_index, channel, count = DATA_HEADER.unpack_from(payload, 0)
+        time_stamps = np.frombuffer(payload, dtype='<i8', count=count, offset=DATA_HEADER.size)
+        values = np.frombuffer(payload, dtype='<f8', count=count, offset=DATA_HEADER.size + 8*count)
+        return 'data', (device_index, CHANNEL_NAMES.get(channel, str(channel)), time_stamps, values)
+    if frame_type == MESSAGE:
+        return 'message', json.loads(payload[1:].decode('utf-8'))
+    raise ValueError("unknown frame type: " + repr(frame_type))
@@ -14,6 +14,7 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/vernierst/labquest-py",
     packages=setuptools.find_packages(),
+    install_requires=['numpy'],
     package_data={'labquest': ['data/*.txt', 'data/*.dylib', 'data/*.dll']},
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -0,0 +1,57 @@
+import time
+
+from labquest import LabQuest
+
+
+def open_simulated(**sensors):
+    lq = LabQuest(backend='simulated')
+    lq.open()
+    lq.select_sensors(**sensors)
+    return lq
+
+
+def test_control_loop_drives_dcu():
+    lq = open_simulated(ch1='lq_sensor', dig2='dcu')
+    try:
+        lq.start(period=2)
+        loop = lq.control_loop(lambda time_stamp, value: 15, 'ch1', 10, output='dcu', output_ch='dig2',
+                               duration=0.3)
+        assert loop.wait(5)
+        statistics = loop.as_dict()
+        assert statistics["iterations"] >= 20
+        assert statistics["commands"] == 1
+        assert statistics["errors"] == 0
+        lq.stop()
+    finally:
+        lq.close()
+
+
+def test_control_loop_with_subscriptions():
+    # the acquisition loop drains the subscribed channels, and the control loop takes its newest
+    # sample instead of competing for the NGIO buffer
+    lq = open_simulated(ch1='lq_sensor', ch2='lq_sensor', dig2='dcu')
+    try:
+        subscriptions = [lq.subscribe('ch1', batch_size=10), lq.subscribe('ch2', batch_size=10)]
+        lq.start(period=2)
+        time_stamps = []
+
+        def control(time_stamp, value):
+            time_stamps.append(time_stamp)
+            return None
+
+        time.sleep(0.05)
+        loop = lq.control_loop(control, 'ch1', 10, output=None, duration=0.3)
+        assert loop.wait(5)
+        lq.stop()
+        statistics = loop.as_dict()
+        assert statistics["iterations"] >= 20
+        assert statistics["no_sample"] <= 2
+        assert time_stamps == sorted(set(time_stamps))
+        # the subscriber still gets every sample of the channel
+        batches = []
+        while not subscriptions[0].queue.empty():
+            batches.append(subscriptions[0].queue.get_nowait()[0])
+        received = [int(time_stamp) for batch in batches for time_stamp in batch]
+        assert received == list(range(received[0], received[-1] + 1, 2000))
+    finally:
+        lq.close()
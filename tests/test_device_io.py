@@ -0,0 +1,92 @@
+import threading
+import time
+
+from labquest import LabQuest, config
+from labquest import labquest_device_io_functions as device_io
+from labquest import ngio_read_functions as ngio_read
+from labquest import ngio_send_cmd_get_resp as ngio_send
+from labquest.ngio_simulated_library import SimulatedNGIO
+
+
+def open_simulated(num_devices, latency=0.0001):
+    simulator = SimulatedNGIO(device_type=17, num_devices=num_devices, latency=latency, check_overlaps=True)
+    lq = LabQuest(backend=simulator)
+    lq.open()
+    for device in range(num_devices):
+        lq.select_sensors(ch1='lq_sensor', device=device)
+    return lq, simulator
+
+
+def hammer(lq, handles, duration=0.3):
+    """ Call NGIO on each handle from its own thread (a handle can be listed more than once), and
+    queue work on the executors, for duration seconds. Returns the number of calls made.
+    """
+
+    calls = [0]*len(handles)
+    end_time = time.perf_counter() + duration
+
+    def worker(index, hDevice):
+        while time.perf_counter() < end_time:
+            ngio_read.get_num_measurements_available(hDevice, 1)
+            ngio_send.send_cmd_get_response(hDevice, 0x10, [0]*14, 0)    # get status
+            if calls[index] % 20 == 0:
+                device_io.get_executor(hDevice).submit(ngio_read.get_num_measurements_available, hDevice, 1).result()
+            calls[index] += 2
+
+    with config.use_session(lq.session):
+        threads = [threading.Thread(target=config.in_current_session(worker), args=(index, hDevice))
+                   for index, hDevice in enumerate(handles)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return sum(calls)
+
+
+def test_threads_sharing_devices_do_not_overlap():
+    lq, simulator = open_simulated(num_devices=3)
+    try:
+        with config.use_session(lq.session):
+            handles = list(config.hDevice)*4
+        assert hammer(lq, handles) > 100
+        assert simulator.overlapping_calls == 0
+    finally:
+        lq.close()
+
+
+def test_other_threads_join_a_single_thread_device():
+    # the thread that opened the device calls it without the lock until other threads call it
+    lq, simulator = open_simulated(num_devices=1)
+    try:
+        with config.use_session(lq.session):
+            hDevice = config.hDevice[0]
+            executor = device_io.get_executor(hDevice)
+            assert executor.owner == threading.get_ident()
+            calls = []
+            thread = threading.Thread(target=lambda: calls.append(hammer(lq, [hDevice]*3)))
+            thread.start()
+            while thread.is_alive():
+                ngio_read.get_num_measurements_available(hDevice, 1)
+            thread.join()
+            assert calls[0] > 100
+            assert executor.owner is device_io.SHARED
+        assert simulator.overlapping_calls == 0
+    finally:
+        lq.close()
+
+
+def test_overlap_check_sees_unserialized_calls():
+    # the simulator's check works: calls straight to the library (not serialized) do overlap
+    simulator = SimulatedNGIO(device_type=17, latency=0.001, check_overlaps=True)
+    hDevice = 1000
+
+    def worker():
+        for i in range(20):
+            simulator.NGIO_Device_GetNumMeasurementsAvailable(hDevice, 1)
+
+    threads = [threading.Thread(target=worker) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert simulator.overlapping_calls > 0
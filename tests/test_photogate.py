@@ -0,0 +1,14 @@
+from labquest import LabQuest
+from labquest import labquest_photogate_timing_functions as photo
+
+
+def test_unknown_mode_is_rejected_before_collecting(monkeypatch):
+    calls = []
+    monkeypatch.setattr(photo, 'get_photogate_time_stamps', lambda *args: calls.append(args))
+    lq = LabQuest(backend='simulated')
+    lq.open()
+    try:
+        assert lq.photogate_analysis('dig1', 5, 10, mode='speed') is None
+        assert not calls
+    finally:
+        lq.close()
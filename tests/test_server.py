@@ -0,0 +1,162 @@
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from labquest import LabQuest
+from labquest.server import ClientConnection, LabQuestServer, protocol
+from labquest.server.client import LabQuestClient
+
+
+class RunningServer:
+    """ A LabQuestServer on a simulated device, run by an event loop on its own thread
+    """
+
+    def __init__(self, **kwargs):
+        self.lq = LabQuest(backend='simulated')
+        self.lq.open()
+        self.lq.select_sensors(ch1='lq_sensor', ch2='lq_sensor')
+        self.server = LabQuestServer(self.lq, port=0, period=1, **kwargs)
+        self.loop = None
+        self.stopping = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self._main(),), daemon=True)
+        self.thread.start()
+        assert self.started.wait(5)
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        await self.server.start()
+        self.started.set()
+        await self.stopping.wait()
+        await self.server.close()
+
+    def call(self, function):
+        """ Run function() on the event loop and return its result
+        """
+
+        async def call():
+            return function()
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result(5)
+
+    def client(self):
+        return LabQuestClient('127.0.0.1', self.server.port, timeout=5)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join(5)
+        self.lq.close()
+
+
+@pytest.fixture
+def running_server():
+    running = RunningServer(batch_size=20, max_latency=0.02)
+    yield running
+    running.close()
+
+
+def receive(client, ch, duration):
+    """ The time stamps and values of ch received for duration seconds
+    """
+
+    time_stamps = []
+    values = []
+    end_time = time.perf_counter() + duration
+    while time.perf_counter() < end_time:
+        device_index, frame_ch, frame_time_stamps, frame_values = client.receive()
+        assert device_index == 0
+        if frame_ch == ch:
+            time_stamps.append(frame_time_stamps)
+            values.append(frame_values)
+    return np.concatenate(time_stamps), np.concatenate(values)
+
+
+def test_hello_subscribed_and_data(running_server):
+    with running_server.client() as client:
+        assert client.hello["type"] == "hello"
+        assert [(channel["device"], channel["ch"]) for channel in client.hello["channels"]] == [(0, 'ch1'), (0, 'ch2')]
+        assert client.hello["channels"][0]["sample_period"] == pytest.approx(0.001)
+
+        client.subscribe('ch1')
+        time_stamps, values = receive(client, 'ch1', 0.3)
+        assert client.messages[0] == {"type":"subscribed", "channels":[{"device":0, "ch":'ch1', "decimate":1,
+                                                                          "mode":'mean'}]}
+        assert time_stamps.dtype == np.int64 and values.dtype == np.float64
+        assert time_stamps.size > 100
+        assert (np.diff(time_stamps) == 1000).all()
+
+        # ch2 was not subscribed, and an unknown channel is not confirmed
+        client.subscribe('ch9')
+        receive(client, 'ch1', 0.1)
+        assert client.messages[1] == {"type":"subscribed", "channels":[]}
+
+
+def test_decimation_per_client(running_server):
+    with running_server.client() as full, running_server.client() as mean, running_server.client() as last:
+        full.subscribe('ch1')
+        time.sleep(0.05)
+        mean.subscribe('ch1', decimate=10, mode='mean')
+        last.subscribe('ch1', decimate=5, mode='last')
+        full_times, full_values = receive(full, 'ch1', 0.5)
+        mean_times, mean_values = receive(mean, 'ch1', 0.1)
+        last_times, last_values = receive(last, 'ch1', 0.1)
+
+    assert (np.diff(mean_times) == 10000).all()
+    assert (np.diff(last_times) == 5000).all()
+    values_at = dict(zip(full_times.tolist(), full_values.tolist()))
+    # the mean time of 10 samples 1 ms apart is 4.5 ms after the first
+    checked = [(time_stamp, value) for time_stamp, value in zip(mean_times.tolist(), mean_values.tolist())
+               if time_stamp + 4500 <= full_times[-1]]
+    assert len(checked) > 10
+    for time_stamp, value in checked:
+        block = [values_at[time_stamp - 4500 + 1000*i] for i in range(10)]
+        assert value == pytest.approx(np.mean(block))
+    checked = [(time_stamp, value) for time_stamp, value in zip(last_times.tolist(), last_values.tolist())
+               if time_stamp <= full_times[-1]]
+    assert len(checked) > 20
+    for time_stamp, value in checked:
+        assert value == values_at[time_stamp]
+
+
+def test_slow_client_drops_its_oldest_frames():
+    running = RunningServer(batch_size=5, max_latency=0.01, max_queue=8)
+    try:
+        with running.client() as fast:
+            slow = socket.socket()
+            slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+            slow.connect(('127.0.0.1', running.server.port))
+            try:
+                while len(running.call(lambda: running.server.clients)) < 2:
+                    time.sleep(0.01)
+
+                def make_slow():
+                    # the slow client is the second one; leave almost no room in the socket buffers
+                    transport = running.server.clients[1].writer.transport
+                    transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+                    transport.set_write_buffer_limits(high=4096)
+                running.call(make_slow)
+                slow.sendall(b''.join(protocol.message_frame({"type":"subscribe", "channels":[{"device":0, "ch":ch}]})
+                                      for ch in ('ch1', 'ch2')))
+                fast.subscribe('ch1')
+                time_stamps, values = receive(fast, 'ch1', 0.5)
+                dropped = running.call(lambda: running.server.clients[1].dropped)
+            finally:
+                slow.close()
+    finally:
+        running.close()
+
+    # the slow client only lost its own frames
+    assert dropped > 0
+    assert (np.diff(time_stamps) == 1000).all()
+
+
+def test_client_queue_keeps_the_newest_frames():
+    client = ClientConnection(None, None, max_queue=4)
+    for frame in range(10):
+        client.send(bytes([frame]))
+    assert list(client.frames) == [bytes([6]), bytes([7]), bytes([8]), bytes([9])]
+    assert client.dropped == 6
@@ -0,0 +1,49 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from labquest import labquest_shared_memory_functions as shared
+
+
+@pytest.fixture
+def ring():
+    ring = shared.SharedRing("lqtest" + str(os.getpid()) + "_dev0_ch1", 0, 1, capacity=8)
+    yield ring
+    ring.close()
+
+
+def test_reader_gets_the_samples_in_order(ring):
+    reader = shared.RingReader(ring.name, from_start=True, track=True)
+    try:
+        ring.write(np.arange(6)*1000, np.arange(6.0))
+        ring.write(np.arange(6, 11)*1000, np.arange(6.0, 11.0))
+        time_stamps, values = reader.read()
+        assert list(values) == list(np.arange(3.0, 11.0))
+        assert reader.overruns == 1 and reader.lost == 3
+    finally:
+        reader.close()
+
+
+def test_reader_drops_samples_the_writer_is_overwriting(ring):
+    reader = shared.RingReader(ring.name, from_start=True, track=True)
+    try:
+        ring.write(np.arange(6)*1000, np.arange(6.0))
+        # the writer has started a 4 sample packet (wrapping around over samples 0 and 1), but
+        # has not published its sequence yet
+        struct.pack_into('<Q', ring.memory.buf, shared.WRITE_SEQUENCE_OFFSET, 10)
+        ring.values[[6, 7, 0, 1]] = -1.0
+        time_stamps, values = reader.read()
+        assert list(values) == [2.0, 3.0, 4.0, 5.0]
+        assert reader.overruns == 1 and reader.lost == 2
+        assert reader.overrun_since(1) and not reader.overrun_since(2)
+    finally:
+        reader.close()
+
+
+def test_existing_ring_is_not_replaced(ring):
+    with pytest.raises(FileExistsError):
+        shared.SharedRing(ring.name, 0, 1, capacity=8)
+    reader = shared.RingReader(ring.name, track=True)
+    reader.close()
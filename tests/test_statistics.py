@@ -0,0 +1,37 @@
+import numpy as np
+
+from labquest import LabQuest
+
+
+def open_simulated(**sensors):
+    lq = LabQuest(backend='simulated')
+    lq.open()
+    lq.select_sensors(**sensors)
+    return lq
+
+
+def test_stats_from_start_cover_every_value_read():
+    lq = open_simulated(ch1='lq_sensor')
+    try:
+        lq.start(period=2, stats=True)
+        values = lq.read_multi_pt('ch1', 200)
+        stats = lq.stats('ch1')
+        lq.stop()
+        assert stats["count"] == len(values)
+        assert np.isclose(stats["mean"], np.mean(values))
+        assert stats["min"] == min(values)
+    finally:
+        lq.close()
+
+
+def test_window_stats_match_the_last_values():
+    lq = open_simulated(ch1='lq_sensor')
+    try:
+        lq.start(period=1, stats=True)
+        values = lq.read_multi_pt('ch1', 500)
+        stats = lq.stats('ch1', window=100)
+        lq.stop()
+        assert stats["count"] == 100
+        assert np.isclose(stats["std"], np.std(values[-100:], ddof=1))
+    finally:
+        lq.close()
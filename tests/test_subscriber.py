@@ -0,0 +1,39 @@
+import time
+
+from labquest import LabQuest
+
+
+def open_simulated(**sensors):
+    lq = LabQuest(backend='simulated')
+    lq.open()
+    lq.select_sensors(**sensors)
+    return lq
+
+
+def test_subscription_gets_its_channel():
+    lq = open_simulated(ch1='lq_sensor')
+    try:
+        subscription = lq.subscribe('ch1', batch_size=10)
+        lq.start(period=2)
+        time.sleep(0.3)
+        lq.stop()
+        time_stamps, values = subscription.queue.get_nowait()
+        assert values.size == 10
+        assert not values.flags.writeable
+        assert (time_stamps[1:] - time_stamps[:-1] == 2000).all()
+    finally:
+        lq.close()
+
+
+def test_channels_without_subscribers_are_left_for_read():
+    lq = open_simulated(ch1='lq_sensor', ch2='lq_sensor')
+    try:
+        lq.subscribe('ch2', batch_size=10)
+        lq.start(period=2)
+        time.sleep(0.3)
+        time_stamps, values = lq.read_all()['ch1']
+        lq.stop()
+        # 0.3 s at 2 ms: about 150 values, none of them taken by the acquisition loop
+        assert values.size > 100
+    finally:
+        lq.close()